@@ -8,14 +8,20 @@ from flask import Flask, request, jsonify
 
 from datetime import datetime, timedelta
 import os
+import sys
 import logging
 import psutil
 import subprocess
 
+# Shared modules live one level up (/app/shared in the container) - VS
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.auth import init_auth
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+init_auth(app)
 
 # Services configuration - VS
 SERVICES = [
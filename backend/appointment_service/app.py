@@ -9,14 +9,22 @@ from flask import Flask, request, jsonify
 from datetime import datetime, timedelta
 import uuid
 import os
+import sys
 import logging
 import boto3
 from botocore.exceptions import ClientError
 
+# Shared modules live one level up (/app/shared in the container) - VS
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.auth import init_auth
+from shared.database import scan_all
+from shared.rollups import RollupStore, appointment_contribution
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+init_auth(app)
 
 
 AWS_REGION = os.getenv('AWS_REGION', 'eu-north-1')
@@ -31,6 +39,8 @@ try:
 except Exception as e:
     logger.warning(f"DynamoDB not available: {e}")
 
+rollups = RollupStore(dynamodb)
+
 appointments_db = {}
 
 def save_appointment(appointment):
@@ -76,8 +86,7 @@ def get_appointments():
                 )
                 appointments = response.get('Items', [])
             else:
-                response = table.scan()
-                appointments = response.get('Items', [])
+                appointments = scan_all(table)
         except ClientError as e:
             logger.error(f"DynamoDB error: {e}")
             appointments = list(appointments_db.values())
@@ -137,6 +146,7 @@ def create_appointment():
     }
     
     save_appointment(appointment)
+    rollups.record_change(appointment_contribution, None, appointment)
     logger.info(f"Appointment created: {appointment['id']}")
     return jsonify(appointment), 201
 
@@ -156,6 +166,7 @@ def update_appointment(appointment_id):
         return jsonify({'error': 'Appointment not found'}), 404
     
     data = request.get_json()
+    before = dict(appointment)
     appointment.update({
         'dateTime': data.get('dateTime', appointment.get('dateTime')),
         'vetId': data.get('vetId', appointment.get('vetId')),
@@ -166,6 +177,7 @@ def update_appointment(appointment_id):
     })
     
     save_appointment(appointment)
+    rollups.record_change(appointment_contribution, before, appointment)
     return jsonify(appointment)
 
 @app.route('/api/v1/appointments/<appointment_id>/cancel', methods=['POST'])
@@ -184,12 +196,14 @@ def cancel_appointment(appointment_id):
         return jsonify({'error': 'Appointment not found'}), 404
     
     data = request.get_json() or {}
+    before = dict(appointment)
     appointment['status'] = 'cancelled'
     appointment['cancelReason'] = data.get('reason', '')
     appointment['cancelledAt'] = datetime.utcnow().isoformat()
     appointment['updatedAt'] = datetime.utcnow().isoformat()
     
     save_appointment(appointment)
+    rollups.record_change(appointment_contribution, before, appointment)
     return jsonify(appointment)
 
 @app.route('/api/v1/appointments/<appointment_id>/complete', methods=['POST'])
@@ -207,11 +221,13 @@ def complete_appointment(appointment_id):
     if not appointment:
         return jsonify({'error': 'Appointment not found'}), 404
     
+    before = dict(appointment)
     appointment['status'] = 'completed'
     appointment['completedAt'] = datetime.utcnow().isoformat()
     appointment['updatedAt'] = datetime.utcnow().isoformat()
     
     save_appointment(appointment)
+    rollups.record_change(appointment_contribution, before, appointment)
     return jsonify(appointment)
 
 @app.route('/api/v1/appointments/available-slots', methods=['GET'])
@@ -258,14 +274,17 @@ def get_available_slots():
 
 @app.route('/api/v1/appointments/<appointment_id>', methods=['DELETE'])
 def delete_appointment(appointment_id):
+    appointment = None
     if table:
         try:
-            table.delete_item(Key={'id': appointment_id})
+            appointment = table.delete_item(Key={'id': appointment_id}, ReturnValues='ALL_OLD').get('Attributes')
         except ClientError as e:
             logger.error(f"DynamoDB error: {e}")
     
     if appointment_id in appointments_db:
-        del appointments_db[appointment_id]
+        appointment = appointments_db.pop(appointment_id)
+    
+    rollups.record_change(appointment_contribution, appointment, None)
     
     return jsonify({'message': 'Appointment deleted'})
 
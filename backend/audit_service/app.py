@@ -4,22 +4,41 @@ Serwis logów audytu z AWS DynamoDB
 @author VS
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify
 
 from datetime import datetime
 import uuid
+import json
 import os
+import sys
+import atexit
 import logging
+import threading
 import boto3
-from botocore.exceptions import ClientError
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+# Shared modules live one level up (/app/shared in the container) - VS
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.auth import init_auth
+from shared.rate_limit import client_ip
+
+from archive import ArchiveScheduler, AuditArchiver
+from detector import AnomalyDetector
+from ingest import AuditIngestor, IngestQueueFull
+from queries import AuditQuery, day_bucket, matches, time_range
+from stats import AuditStats
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+init_auth(app)
 
 AWS_REGION = os.getenv('AWS_REGION', 'eu-north-1')
 TABLE_NAME = 'PetCareApp-AuditLogs'
+S3_BUCKET = os.getenv('S3_BUCKET', 'petcareapp-files')
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL') or None
 
 dynamodb = None
 table = None
@@ -30,21 +49,88 @@ try:
 except Exception as e:
     logger.warning(f"DynamoDB not available: {e}")
 
+s3_client = None
+try:
+    s3_client = boto3.client(
+        's3',
+        region_name=AWS_REGION,
+        endpoint_url=S3_ENDPOINT_URL,
+        config=Config(signature_version='s3v4')
+    )
+    logger.info(f"S3 client initialized for bucket: {S3_BUCKET}")
+except Exception as e:
+    logger.warning(f"S3 not available: {e}")
+
 audit_logs_db = {}
 
-def save_audit_log(log):
-    if table:
-        try:
-            table.put_item(Item=log)
-            return True
-        except ClientError as e:
-            logger.error(f"DynamoDB error: {e}")
-    audit_logs_db[log['id']] = log
-    return True
+AUDIT_BATCH_MAX = int(os.getenv('AUDIT_BATCH_MAX', 1000))
+# DynamoDB items are limited to 400 KB - larger details are cut to a preview - VS
+AUDIT_MAX_DETAILS_BYTES = int(os.getenv('AUDIT_MAX_DETAILS_BYTES', 64 * 1024))
+AUDIT_MAX_FIELD_LENGTH = int(os.getenv('AUDIT_MAX_FIELD_LENGTH', 1024))
+
+audit_stats = AuditStats(dynamodb)
+ingestor = AuditIngestor(table, fallback=audit_logs_db)
+ingestor.listeners.append(audit_stats.record)
+ingestor.start()
+audit_stats.start()
+# atexit runs in reverse: drain the queue first, then flush the counters it produced - VS
+atexit.register(audit_stats.stop)
+atexit.register(ingestor.stop)
+audit_query = AuditQuery(table)
+detector = AnomalyDetector()
+
+archiver = AuditArchiver(table, s3_client, S3_BUCKET)
+archive_scheduler = ArchiveScheduler(archiver)
+if archiver.available:
+    archive_scheduler.start()
+
+def event_timestamp(value):
+    """Batch senders may pass the original event time; anything unparsable means now"""
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '')).isoformat() if value else None
+    except ValueError:
+        return None
+
+def capped_text(value):
+    return value[:AUDIT_MAX_FIELD_LENGTH] if isinstance(value, str) else value
+
+def capped_details(details):
+    encoded = json.dumps(details, default=str)
+    if len(encoded.encode()) <= AUDIT_MAX_DETAILS_BYTES:
+        return details
+    return {'truncated': True, 'originalBytes': len(encoded.encode()), 'preview': encoded[:AUDIT_MAX_FIELD_LENGTH]}
+
+def build_audit_log(data):
+    timestamp = event_timestamp(data.get('timestamp')) or datetime.utcnow().isoformat()
+    return {
+        'id': str(uuid.uuid4()),
+        'userId': capped_text(data.get('userId')),
+        'userEmail': capped_text(data.get('userEmail')),
+        'action': capped_text(data.get('action')),  # create, read, update, delete, login, logout
+        'resource': capped_text(data.get('resource')),  # user, pet, appointment, payment, etc.
+        'resourceId': capped_text(data.get('resourceId')),
+        'details': capped_details(data.get('details', {})),
+        'ip': capped_text(data.get('ip')) or client_ip(),
+        'userAgent': capped_text(data.get('userAgent') or request.headers.get('User-Agent', '')),
+        'timestamp': timestamp,
+        'day': day_bucket(timestamp),  # time bucket - partition of day-timestamp-index
+        'status': data.get('status', 'success')
+    }
+
+def queue_full_response(error):
+    response = jsonify({'error': str(error)})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 @app.route('/api/v1/health', methods=['GET'])
 def health_check():
-    return jsonify({'service': 'audit-service', 'status': 'healthy', 'dynamodb': table is not None})
+    return jsonify({
+        'service': 'audit-service',
+        'status': 'healthy',
+        'dynamodb': table is not None,
+        'ingest': ingestor.status(),
+        'detector': detector.status()
+    })
 
 @app.route('/api/v1/audit/logs', methods=['GET'])
 def get_audit_logs():
@@ -56,59 +142,60 @@ def get_audit_logs():
     date_to = request.args.get('dateTo')
     limit = request.args.get('limit', 100, type=int)
     
+    try:
+        lower, upper = time_range(date_from, date_to)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid date: {e}'}), 400
+    
     if table:
         try:
-            if user_id:
-                response = table.query(
-                    IndexName='userId-timestamp-index',
-                    KeyConditionExpression='userId = :uid',
-                    ExpressionAttributeValues={':uid': user_id},
-                    ScanIndexForward=False,
-                    Limit=limit
-                )
-            else:
-                response = table.scan(Limit=limit)
-            logs = response.get('Items', [])
+            logs = audit_query.find(user_id, action, resource, date_from, date_to, limit)
         except ClientError as e:
             logger.error(f"DynamoDB error: {e}")
-            logs = list(audit_logs_db.values())
+            logs = None
     else:
-        logs = list(audit_logs_db.values())
+        logs = None
     
-    # Apply filters - VS
-    if action:
-        logs = [l for l in logs if l.get('action') == action]
-    if resource:
-        logs = [l for l in logs if l.get('resource') == resource]
-    if date_from:
-        logs = [l for l in logs if l.get('timestamp', '') >= date_from]
-    if date_to:
-        logs = [l for l in logs if l.get('timestamp', '') <= date_to]
+    if logs is None:
+        filters = {k: v for k, v in (('userId', user_id), ('action', action), ('resource', resource)) if v}
+        logs = [log for log in audit_logs_db.values() if matches(log, filters, lower, upper)]
+        logs = sorted(logs, key=lambda x: x.get('timestamp', ''), reverse=True)
     
     return jsonify(logs[:limit])
 
 @app.route('/api/v1/audit/logs', methods=['POST'])
 def create_audit_log():
-    """Create new audit log entry - VS"""
-    data = request.get_json()
+    """Create new audit log entry - written asynchronously in batches - VS"""
+    data = request.get_json(silent=True) or {}
+    log = build_audit_log(data)
     
-    log = {
-        'id': str(uuid.uuid4()),
-        'userId': data.get('userId'),
-        'userEmail': data.get('userEmail'),
-        'action': data.get('action'),  # create, read, update, delete, login, logout
-        'resource': data.get('resource'),  # user, pet, appointment, payment, etc.
-        'resourceId': data.get('resourceId'),
-        'details': data.get('details', {}),
-        'ip': data.get('ip') or request.remote_addr,
-        'userAgent': data.get('userAgent') or request.headers.get('User-Agent', ''),
-        'timestamp': datetime.utcnow().isoformat(),
-        'status': data.get('status', 'success')
-    }
+    try:
+        ingestor.submit([log])
+    except IngestQueueFull as e:
+        return queue_full_response(e)
+    detector.observe([log])
+    logger.debug(f"Audit log: {log['action']} on {log['resource']} by {log['userId']}")
+    return jsonify(log), 202
+
+@app.route('/api/v1/audit/logs/batch', methods=['POST'])
+def create_audit_logs_batch():
+    """Bulk ingest - body is a list of logs or {"logs": [...]} - VS"""
+    data = request.get_json(silent=True)
+    entries = data.get('logs') if isinstance(data, dict) else data
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'error': 'Expected a non-empty list of logs'}), 400
+    if len(entries) > AUDIT_BATCH_MAX:
+        return jsonify({'error': f'Too many logs in one batch (max {AUDIT_BATCH_MAX})'}), 413
+    if not all(isinstance(entry, dict) for entry in entries):
+        return jsonify({'error': 'Each log must be an object'}), 400
     
-    save_audit_log(log)
-    logger.info(f"Audit log: {log['action']} on {log['resource']} by {log['userId']}")
-    return jsonify(log), 201
+    logs = [build_audit_log(entry) for entry in entries]
+    try:
+        ingestor.submit(logs)
+    except IngestQueueFull as e:
+        return queue_full_response(e)
+    detector.observe(logs)
+    return jsonify({'accepted': len(logs), 'ids': [log['id'] for log in logs]}), 202
 
 @app.route('/api/v1/audit/logs/<log_id>', methods=['GET'])
 def get_audit_log(log_id):
@@ -146,7 +233,7 @@ def get_user_activity(user_id):
             logger.error(f"DynamoDB error: {e}")
             logs = []
     else:
-        logs = [l for l in audit_logs_db.values() if l.get('userId') == user_id]
+        logs = [log for log in audit_logs_db.values() if log.get('userId') == user_id]
         logs = sorted(logs, key=lambda x: x.get('timestamp', ''), reverse=True)[:limit]
     
     return jsonify({
@@ -157,41 +244,88 @@ def get_user_activity(user_id):
 
 @app.route('/api/v1/audit/stats', methods=['GET'])
 def get_audit_stats():
-    """Get audit statistics - VS"""
+    """Get audit statistics from the daily counters - VS"""
+    try:
+        stats = audit_stats.summary()
+    except (ClientError, BotoCoreError) as e:
+        logger.error(f"DynamoDB error: {e}")
+        return jsonify({'error': 'Statistics unavailable'}), 503
+    stats['securityEvents']['anomalies'] = detector.summary()
+    return jsonify(stats)
+
+@app.route('/api/v1/audit/security', methods=['GET'])
+def get_security_events():
+    """Findings of the anomaly detector, newest first - VS"""
+    events = detector.list(
+        request.args.get('rule'),
+        request.args.get('severity'),
+        request.args.get('since'),
+        request.args.get('limit', 100, type=int)
+    )
+    return jsonify({'events': events, 'total': len(events), 'detector': detector.status()})
+
+@app.route('/api/v1/audit/archive', methods=['GET'])
+def get_archive_status():
+    return jsonify({
+        'available': archiver.available,
+        'retentionDays': archiver.retention_days,
+        'cutoff': archiver.cutoff().isoformat(),
+        'location': f"s3://{S3_BUCKET}/{archiver.prefix}/",
+        'codec': archiver.codec.extension,
+        'running': archiver.lock.locked(),
+        'lastRun': archiver.last_run
+    })
+
+@app.route('/api/v1/audit/archive/run', methods=['POST'])
+def run_archive():
+    """Archive logs older than the retention window in the background - admin/IT only - VS"""
+    user = g.get('user')
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if user.get('role') not in ('admin', 'it'):
+        return jsonify({'error': 'Forbidden'}), 403
+    if not archiver.available:
+        return jsonify({'error': 'Archive unavailable'}), 503
+    if archiver.lock.locked():
+        return jsonify({'error': 'Archive run already in progress'}), 409
+    data = request.get_json(silent=True) or {}
+    date_from = data.get('dateFrom')
+    if date_from:
+        # Validated here - in the background thread a bad date would only end up in the log - VS
+        try:
+            datetime.fromisoformat(str(date_from)[:10])
+        except ValueError as e:
+            return jsonify({'error': f'Invalid dateFrom: {e}'}), 400
     
-    # Demo stats - in production aggregate from DynamoDB - VS
-    stats = {
-        'today': {
-            'total': 156,
-            'byAction': {
-                'login': 45,
-                'logout': 38,
-                'create': 28,
-                'read': 89,
-                'update': 22,
-                'delete': 5
-            }
-        },
-        'lastWeek': {
-            'total': 1243,
-            'byResource': {
-                'appointment': 345,
-                'pet': 234,
-                'user': 189,
-                'payment': 156,
-                'medical_record': 178,
-                'other': 141
-            }
-        },
-        'securityEvents': {
-            'failedLogins': 12,
-            'suspiciousActivity': 3,
-            'passwordResets': 8
-        },
-        'generatedAt': datetime.utcnow().isoformat()
-    }
+    def run():
+        try:
+            archiver.run(date_from)
+        except Exception as e:
+            logger.error(f"Audit archive run failed: {e}")
     
-    return jsonify(stats)
+    threading.Thread(target=run, name='audit-archive-run', daemon=True).start()
+    return jsonify({'message': 'Archive run started', 'cutoff': archiver.cutoff().isoformat()}), 202
+
+@app.route('/api/v1/audit/archive/logs', methods=['GET'])
+def get_archived_logs():
+    """Search archived partitions by date range - VS"""
+    if not archiver.available:
+        return jsonify({'error': 'Archive unavailable'}), 503
+    try:
+        logs = archiver.find(
+            request.args.get('userId'),
+            request.args.get('action'),
+            request.args.get('resource'),
+            request.args.get('dateFrom'),
+            request.args.get('dateTo'),
+            request.args.get('limit', 100, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'error': f'Invalid date: {e}'}), 400
+    except (ClientError, BotoCoreError) as e:
+        logger.error(f"S3 error: {e}")
+        return jsonify({'error': 'Archive unavailable'}), 503
+    return jsonify(logs)
 
 if __name__ == '__main__':
     PORT = int(os.getenv('PORT', 8009))
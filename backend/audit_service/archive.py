@@ -0,0 +1,233 @@
+"""
+PetCareApp - Audit Archive
+Przenoszenie starych logów audytu do skompresowanych plików NDJSON na S3 (partycje dzienne)
+@author VS
+"""
+
+import io
+import os
+import gzip
+import json
+import uuid
+import logging
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+from queries import AUDIT_QUERY_MAX_DAYS, AuditQuery, matches, time_range
+
+logger = logging.getLogger(__name__)
+
+AUDIT_RETENTION_DAYS = int(os.getenv('AUDIT_RETENTION_DAYS', 90))
+# A daily run also picks up days missed by earlier runs and late-arriving logs - VS
+AUDIT_ARCHIVE_CATCHUP_DAYS = int(os.getenv('AUDIT_ARCHIVE_CATCHUP_DAYS', 7))
+AUDIT_ARCHIVE_PREFIX = os.getenv('AUDIT_ARCHIVE_PREFIX', 'audit/archive')
+AUDIT_ARCHIVE_HOUR = int(os.getenv('AUDIT_ARCHIVE_HOUR', 3))
+AUDIT_ARCHIVE_SPOOL_BYTES = int(os.getenv('AUDIT_ARCHIVE_SPOOL_BYTES', 16 * 1024 * 1024))
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return str(value)
+
+
+class _Codec:
+    def __init__(self, extension, writer, reader):
+        self.extension = extension
+        self.writer = writer
+        self.reader = reader
+
+
+CODECS = {
+    'gz': _Codec('gz', lambda f: gzip.GzipFile(fileobj=f, mode='wb'), lambda f: gzip.GzipFile(fileobj=f, mode='rb'))
+}
+if ZSTD_AVAILABLE:
+    CODECS['zst'] = _Codec(
+        'zst',
+        lambda f: zstandard.ZstdCompressor(level=10).stream_writer(f, closefd=False),
+        lambda f: zstandard.ZstdDecompressor().stream_reader(f)
+    )
+DEFAULT_CODEC = 'zst' if ZSTD_AVAILABLE else 'gz'
+
+
+def _days(first, last):
+    day = first
+    while day <= last:
+        yield day.strftime('%Y-%m-%d')
+        day += timedelta(days=1)
+
+
+class AuditArchiver:
+    """
+    Archiwizacja logów starszych niż AUDIT_RETENTION_DAYS - VS
+
+    Dzień po dniu: logi z partycji dziennej (GSI `day`) są strumieniowo
+    kompresowane do pliku tymczasowego, wysyłane jako nowa część
+    `.../year=YYYY/month=MM/day=DD/part-*.ndjson.zst`, a dopiero po udanym
+    uploadzie usuwane z tabeli wsadowo. Przerwany przebieg może zostawić
+    logi w dwóch częściach - odczyt archiwum deduplikuje po `id`.
+    """
+
+    def __init__(self, table, s3_client, bucket, retention_days=AUDIT_RETENTION_DAYS,
+                 prefix=AUDIT_ARCHIVE_PREFIX, codec=DEFAULT_CODEC):
+        self.table = table
+        self.query = AuditQuery(table) if table else None
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.retention_days = retention_days
+        self.prefix = prefix
+        self.codec = CODECS[codec]
+        self.lock = threading.Lock()
+        self.last_run = None
+
+    @property
+    def available(self):
+        return self.table is not None and self.s3_client is not None
+
+    def partition(self, day):
+        return f"{self.prefix}/year={day[:4]}/month={day[5:7]}/day={day[8:10]}/"
+
+    def cutoff(self, now=None):
+        """First day that stays in the hot table"""
+        return ((now or datetime.utcnow()) - timedelta(days=self.retention_days)).date()
+
+    # ---------- Archiwizacja ----------
+
+    def archive_day(self, day):
+        """Move one day partition to S3, returns the number of archived logs"""
+        ids = []
+        with tempfile.SpooledTemporaryFile(max_size=AUDIT_ARCHIVE_SPOOL_BYTES) as spool:
+            stream = self.codec.writer(spool)
+            for log in self.query.day_logs(day):
+                stream.write(json.dumps(log, default=_json_default, ensure_ascii=False).encode() + b'\n')
+                ids.append(log['id'])
+            stream.close()
+            if not ids:
+                return 0
+            size = spool.tell()
+            spool.seek(0)
+            key = (f"{self.partition(day)}part-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-"
+                   f"{uuid.uuid4().hex[:8]}.ndjson.{self.codec.extension}")
+            self.s3_client.upload_fileobj(
+                spool, self.bucket, key,
+                ExtraArgs={'ContentType': 'application/x-ndjson', 'Metadata': {'logs': str(len(ids))}}
+            )
+
+        with self.table.batch_writer() as batch:
+            for log_id in ids:
+                batch.delete_item(Key={'id': log_id})
+        logger.info(f"Audit archive {day}: {len(ids)} logs, {size} bytes -> s3://{self.bucket}/{key}")
+        return len(ids)
+
+    def run(self, date_from=None, now=None):
+        """Archive every day before the cutoff, from date_from (default: the catch-up window)"""
+        if not self.lock.acquire(blocking=False):
+            raise RuntimeError('Archive run already in progress')
+        try:
+            cutoff = self.cutoff(now)
+            last = cutoff - timedelta(days=1)
+            if date_from:
+                first = datetime.fromisoformat(date_from[:10]).date()
+            else:
+                first = cutoff - timedelta(days=AUDIT_ARCHIVE_CATCHUP_DAYS)
+            started = datetime.utcnow().isoformat()
+            archived = {}
+            for day in _days(first, last):
+                count = self.archive_day(day)
+                if count:
+                    archived[day] = count
+            self.last_run = {
+                'startedAt': started,
+                'completedAt': datetime.utcnow().isoformat(),
+                'from': first.isoformat(),
+                'to': last.isoformat(),
+                'archivedLogs': sum(archived.values()),
+                'days': archived
+            }
+            return self.last_run
+        finally:
+            self.lock.release()
+
+    # ---------- Odczyt ----------
+
+    def _parts(self, day):
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.partition(day)):
+            for obj in page.get('Contents', []):
+                yield obj['Key']
+
+    def _read_part(self, key):
+        codec = CODECS.get(key.rsplit('.', 1)[-1])
+        if not codec:
+            logger.warning(f"Audit archive: unknown codec of {key}, skipped")
+            return
+        body = self.s3_client.get_object(Bucket=self.bucket, Key=key)['Body']
+        with codec.reader(body) as reader:
+            for line in io.TextIOWrapper(io.BufferedReader(reader), encoding='utf-8'):
+                if line.strip():
+                    yield json.loads(line)
+
+    def find(self, user_id=None, action=None, resource=None, date_from=None, date_to=None, limit=100):
+        """
+        Logs from archived partitions in [date_from, date_to], newest first.
+        Only the parts of the requested days are downloaded; each is streamed.
+        """
+        lower, upper = time_range(date_from, date_to)
+        filters = {name: value for name, value in (('userId', user_id), ('action', action), ('resource', resource)) if value}
+        last = datetime.fromisoformat(upper[:10]).date() if upper else self.cutoff() - timedelta(days=1)
+        first = datetime.fromisoformat(lower[:10]).date() if lower else last
+        first = max(first, last - timedelta(days=AUDIT_QUERY_MAX_DAYS - 1))
+
+        logs = []
+        for day in reversed(list(_days(first, last))):
+            found = {}
+            for key in self._parts(day):
+                for log in self._read_part(key):
+                    if matches(log, filters, lower, upper):
+                        found[log['id']] = log
+            logs.extend(sorted(found.values(), key=lambda x: x.get('timestamp', ''), reverse=True))
+            if len(logs) >= limit:
+                break
+        return logs[:limit]
+
+
+class ArchiveScheduler:
+    """Runs the archiver every night at AUDIT_ARCHIVE_HOUR (UTC) - VS"""
+
+    def __init__(self, archiver, hour=AUDIT_ARCHIVE_HOUR):
+        self.archiver = archiver
+        self.hour = hour
+        self._stop = threading.Event()
+        self._thread = None
+
+    def seconds_until_next_run(self, now=None):
+        now = now or datetime.utcnow()
+        next_run = now.replace(hour=self.hour, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return (next_run - now).total_seconds()
+
+    def _loop(self):
+        while not self._stop.wait(self.seconds_until_next_run()):
+            try:
+                self.archiver.run()
+            except Exception as e:
+                logger.error(f"Audit archive run error: {e}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='audit-archive', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,206 @@
+"""
+PetCareApp - Audit Anomaly Detector
+Wykrywanie serii nieudanych logowań, masowych usunięć itp. na strumieniu logów audytu
+@author VS
+"""
+
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+
+from shared.rate_limit import known_proxy
+from stats import security_events
+
+AUDIT_DETECTOR_MAX_KEYS = int(os.getenv('AUDIT_DETECTOR_MAX_KEYS', 50000))
+AUDIT_DETECTOR_MAX_FINDINGS = int(os.getenv('AUDIT_DETECTOR_MAX_FINDINGS', 1000))
+# Each window is split into this many buckets - fixed memory per tracked key - VS
+WINDOW_BUCKETS = 10
+
+
+class SlidingWindow:
+    """Event count over the last `window` seconds, in WINDOW_BUCKETS ring buckets"""
+    __slots__ = ('span', 'buckets', 'newest', 'total')
+
+    def __init__(self, window):
+        self.span = max(window / WINDOW_BUCKETS, 1e-3)
+        self.buckets = [0] * WINDOW_BUCKETS
+        self.newest = None
+        self.total = 0
+
+    def add(self, at, count=1):
+        slot = int(at / self.span)
+        if self.newest is None:
+            self.newest = slot
+        elif slot > self.newest:
+            for step in range(1, min(slot - self.newest, WINDOW_BUCKETS) + 1):
+                index = (self.newest + step) % WINDOW_BUCKETS
+                self.total -= self.buckets[index]
+                self.buckets[index] = 0
+            self.newest = slot
+        elif slot <= self.newest - WINDOW_BUCKETS:
+            # older than the whole window (late or replayed event) - VS
+            return self.total
+        self.buckets[slot % WINDOW_BUCKETS] += count
+        self.total += count
+        return self.total
+
+
+class Rule:
+    def __init__(self, name, description, key, match, threshold, window, severity):
+        self.name = name
+        self.description = description
+        self.key = key
+        self.match = match
+        self.threshold = threshold
+        self.window = window
+        self.severity = severity
+
+
+def _failed_login(log):
+    return 'failedLogins' in security_events(log)
+
+
+def _client_ip(log):
+    """A proxy address would put every client in one bucket - no key then"""
+    ip = log.get('ip')
+    return None if known_proxy(ip) else ip
+
+
+def _denied(log):
+    return 'suspiciousActivity' in security_events(log)
+
+
+RULES = (
+    Rule('failed_login_burst', 'Repeated failed logins for one account',
+         lambda log: log.get('userId') or log.get('userEmail'), _failed_login,
+         int(os.getenv('AUDIT_FAILED_LOGIN_THRESHOLD', 5)), 300, 'high'),
+    Rule('failed_login_ip', 'Failed logins from one IP (credential stuffing)',
+         _client_ip, _failed_login,
+         int(os.getenv('AUDIT_FAILED_LOGIN_IP_THRESHOLD', 20)), 300, 'critical'),
+    Rule('mass_delete', 'Many deletes by one user',
+         lambda log: log.get('userId'), lambda log: log.get('action') == 'delete',
+         int(os.getenv('AUDIT_MASS_DELETE_THRESHOLD', 30)), 60, 'high'),
+    Rule('access_denied_burst', 'Repeated denied access for one user',
+         lambda log: log.get('userId') or _client_ip(log), _denied,
+         int(os.getenv('AUDIT_DENIED_THRESHOLD', 10)), 300, 'medium'),
+)
+
+
+def _event_time(log):
+    try:
+        return datetime.fromisoformat(log['timestamp']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+class AnomalyDetector:
+    """
+    Detektor strumieniowy - VS
+
+    Każda para (reguła, klucz) ma własne okno przesuwne o stałym rozmiarze;
+    pary trzymane są w OrderedDict w kolejności ostatniego użycia, więc
+    przy limicie AUDIT_DETECTOR_MAX_KEYS wypadają najdłużej nieaktywne, a
+    klucze bezczynne dłużej niż okno reguły są usuwane na bieżąco. Przekroczenie
+    progu otwiera znalezisko; kolejne zdarzenia w tym samym oknie tylko je
+    aktualizują. Historia nie jest czytana ponownie.
+    """
+
+    def __init__(self, rules=RULES, max_keys=AUDIT_DETECTOR_MAX_KEYS, max_findings=AUDIT_DETECTOR_MAX_FINDINGS):
+        self.rules = rules
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.tracked = OrderedDict()  # (rule, key) -> [SlidingWindow, last touch (monotonic), open finding]
+        self.findings = deque(maxlen=max_findings)
+        self.stats = {'events': 0, 'findings': 0, 'evicted': 0}
+
+    def observe(self, logs):
+        now = time.monotonic()
+        with self.lock:
+            for log in logs:
+                self.stats['events'] += 1
+                at = None
+                for rule in self.rules:
+                    if not rule.match(log):
+                        continue
+                    key = rule.key(log)
+                    if not key:
+                        continue
+                    at = at if at is not None else _event_time(log)
+                    self._count(rule, str(key), at, now, log)
+            self._evict(now)
+
+    def _count(self, rule, key, at, now, log):
+        entry = self.tracked.get((rule.name, key))
+        if entry is None:
+            entry = self.tracked[(rule.name, key)] = [SlidingWindow(rule.window), now, None]
+        else:
+            self.tracked.move_to_end((rule.name, key))
+            entry[1] = now
+        count = entry[0].add(at)
+        if count < rule.threshold:
+            return
+
+        finding = entry[2]
+        timestamp = log.get('timestamp') or datetime.utcnow().isoformat()
+        if finding and at - finding['_lastAt'] <= rule.window:
+            finding.update(count=max(finding['count'], count), lastSeen=timestamp, _lastAt=at)
+            return
+        finding = {
+            'id': str(uuid.uuid4()),
+            'rule': rule.name,
+            'description': rule.description,
+            'severity': rule.severity,
+            'key': key,
+            'count': count,
+            'threshold': rule.threshold,
+            'windowSeconds': rule.window,
+            'firstSeen': timestamp,
+            'lastSeen': timestamp,
+            '_lastAt': at
+        }
+        entry[2] = finding
+        self.findings.append(finding)
+        self.stats['findings'] += 1
+
+    def _evict(self, now):
+        windows = {rule.name: rule.window for rule in self.rules}
+        while self.tracked:
+            (rule_name, _), entry = next(iter(self.tracked.items()))
+            if len(self.tracked) <= self.max_keys and now - entry[1] <= windows[rule_name]:
+                break
+            self.tracked.popitem(last=False)
+            self.stats['evicted'] += 1
+
+    def list(self, rule=None, severity=None, since=None, limit=100):
+        """Findings, newest first"""
+        with self.lock:
+            findings = [dict(f) for f in reversed(self.findings)]
+        result = []
+        for finding in findings:
+            if rule and finding['rule'] != rule:
+                continue
+            if severity and finding['severity'] != severity:
+                continue
+            if since and finding['lastSeen'] < since:
+                continue
+            del finding['_lastAt']
+            result.append(finding)
+            if len(result) >= limit:
+                break
+        return result
+
+    def summary(self, since=None):
+        since = since or datetime.utcnow().strftime('%Y-%m-%d')
+        by_rule = {}
+        with self.lock:
+            for finding in self.findings:
+                if finding['lastSeen'] >= since:
+                    by_rule[finding['rule']] = by_rule.get(finding['rule'], 0) + 1
+        return {'total': sum(by_rule.values()), 'byRule': by_rule}
+
+    def status(self):
+        with self.lock:
+            return {**self.stats, 'trackedKeys': len(self.tracked), 'maxKeys': self.max_keys}
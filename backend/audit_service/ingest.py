@@ -0,0 +1,324 @@
+"""
+PetCareApp - Audit Ingestion
+Buforowany zapis logów audytu: kolejka w pamięci + WAL na dysku + zapis wsadowy do DynamoDB
+@author VS
+"""
+
+import os
+import json
+import glob
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from decimal import Decimal
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_SIZE = int(os.getenv('AUDIT_QUEUE_SIZE', 50000))
+# Flusher collects up to this many logs per round; batch_writer splits them into 25-item requests - VS
+AUDIT_FLUSH_BATCH = int(os.getenv('AUDIT_FLUSH_BATCH', 500))
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 0.5))
+AUDIT_FLUSH_RETRIES = int(os.getenv('AUDIT_FLUSH_RETRIES', 5))
+# A batch that failed all its retries is requeued with backoff up to this delay - VS
+AUDIT_REQUEUE_MAX_DELAY = float(os.getenv('AUDIT_REQUEUE_MAX_DELAY', 60))
+AUDIT_WAL_DIR = os.getenv('AUDIT_WAL_DIR', '/app/data/audit-wal')
+AUDIT_WAL_SEGMENT_BYTES = int(os.getenv('AUDIT_WAL_SEGMENT_BYTES', 16 * 1024 * 1024))
+
+
+# Worth retrying - anything else (ValidationException, item over 400 KB...) won't succeed later - VS
+RETRYABLE_ERRORS = {
+    'ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded',
+    'InternalServerError', 'ServiceUnavailable', 'LimitExceededException', 'TransactionInProgressException'
+}
+REJECTED_FILE = 'rejected.log'
+
+
+def retryable(error):
+    if isinstance(error, BotoCoreError):
+        return True
+    response = error.response
+    return (response.get('Error', {}).get('Code') in RETRYABLE_ERRORS
+            or response.get('ResponseMetadata', {}).get('HTTPStatusCode', 500) >= 500)
+
+
+# Index key attributes must be non-empty strings, otherwise DynamoDB rejects the whole batch - VS
+INDEX_KEY_ATTRIBUTES = ('userId', 'action', 'resource', 'day', 'timestamp')
+
+
+def storable(log):
+    """Item without None values and without empty index keys"""
+    return {
+        k: v for k, v in log.items()
+        if v is not None and not (k in INDEX_KEY_ATTRIBUTES and (v == '' or not isinstance(v, str)))
+    }
+
+
+class IngestQueueFull(Exception):
+    """Queue is at capacity - caller should retry later"""
+
+
+class AuditIngestor:
+    """
+    Ścieżka zapisu logów audytu - VS
+
+    submit() dopisuje logi do pliku WAL (jeden fsync na żądanie, niezależnie
+    od liczby logów) i wrzuca je do kolejki, po czym od razu wraca. Wątek
+    flushera zbiera logi partiami i zapisuje je przez batch_write_item
+    (batch_writer ponawia UnprocessedItems). WAL jest dzielony na segmenty;
+    segment jest usuwany, gdy wszystkie jego logi trafiły do tabeli. Partia,
+    której nie udało się zapisać (throttling, 5xx), wraca do ponowienia
+    z wykładniczym opóźnieniem (do AUDIT_REQUEUE_MAX_DELAY) - do tego czasu
+    jej logi są czytelne z `fallback`. Log odrzucony przez tabelę (np.
+    ValidationException) jest wyszukiwany przez bisekcję partii i trafia
+    do pliku REJECTED_FILE, reszta partii jest zapisywana. Po restarcie
+    niezapisane segmenty są odtwarzane do kolejki.
+    """
+
+    def __init__(self, table, fallback=None, wal_dir=AUDIT_WAL_DIR, max_queue=AUDIT_QUEUE_SIZE,
+                 batch_size=AUDIT_FLUSH_BATCH, flush_interval=AUDIT_FLUSH_INTERVAL):
+        self.table = table
+        # Without DynamoDB logs end up in the in-memory store, like before - VS
+        self.fallback = fallback if fallback is not None else {}
+        self.wal_dir = wal_dir
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = {}  # segment -> logs not yet persisted
+        self.retry = deque()  # (due at (monotonic), failed rounds, batch) - VS
+        self.retrying = 0
+        self.segment = 0
+        self.wal = None
+        # Called with every batch persisted to the table (stats counters etc.) - VS
+        self.listeners = []
+        self.stats = {'accepted': 0, 'written': 0, 'failed': 0, 'rejected': 0, 'replayed': 0, 'batches': 0}
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------- WAL ----------
+
+    def _segment_path(self, segment):
+        return os.path.join(self.wal_dir, f"wal-{segment:010d}.log")
+
+    def _open_segment(self, segment):
+        if self.wal:
+            self.wal.close()
+        self.segment = segment
+        self.pending.setdefault(segment, 0)
+        self.wal = open(self._segment_path(segment), 'ab')
+
+    def _replay(self):
+        """Load logs from segments left over by a previous run"""
+        os.makedirs(self.wal_dir, exist_ok=True)
+        last = 0
+        seen = set()
+        for path in sorted(glob.glob(os.path.join(self.wal_dir, 'wal-*.log'))):
+            segment = int(os.path.basename(path)[4:-4])
+            last = max(last, segment)
+            count = 0
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        log = json.loads(line, parse_float=Decimal)
+                    except ValueError:
+                        # torn write from a crash in the middle of a line - VS
+                        continue
+                    if log.get('id') in seen:
+                        continue
+                    seen.add(log.get('id'))
+                    self.queue.put((segment, log))
+                    count += 1
+            if count:
+                self.pending[segment] = count
+            else:
+                os.remove(path)
+        self.stats['replayed'] = len(seen)
+        if seen:
+            logger.info(f"Audit WAL replay: {len(seen)} logs from {len(self.pending)} segments")
+        self._open_segment(last + 1)
+
+    def _release(self, segments):
+        """Drop segments whose logs are all persisted"""
+        with self.lock:
+            for segment, count in segments.items():
+                self.pending[segment] -= count
+            for segment in [s for s, c in self.pending.items() if c == 0]:
+                if segment == self.segment:
+                    if self.wal.tell() == 0:
+                        continue
+                    self._open_segment(segment + 1)
+                del self.pending[segment]
+                try:
+                    os.remove(self._segment_path(segment))
+                except OSError as e:
+                    logger.warning(f"Audit WAL cleanup error: {e}")
+
+    # ---------- Zapis ----------
+
+    def submit(self, logs):
+        """
+        Accept logs for writing; returns once they are durable in the WAL.
+        Raises IngestQueueFull when the flusher can't keep up.
+        """
+        lines = [json.dumps(log, default=str).encode() + b'\n' for log in logs]
+        with self.lock:
+            if self.queue.qsize() + self.retrying + len(logs) > self.max_queue:
+                raise IngestQueueFull(f"Audit queue full ({self.queue.qsize()} logs waiting)")
+            if self.wal.tell() >= AUDIT_WAL_SEGMENT_BYTES:
+                self._open_segment(self.segment + 1)
+            self.wal.write(b''.join(lines))
+            self.wal.flush()
+            os.fsync(self.wal.fileno())
+            self.pending[self.segment] += len(logs)
+            for line in lines:
+                # Round-trip through JSON: floats become Decimal, as DynamoDB requires - VS
+                self.queue.put((self.segment, json.loads(line, parse_float=Decimal)))
+            self.stats['accepted'] += len(logs)
+
+    def _take_batch(self):
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _put(self, logs):
+        with self.table.batch_writer(overwrite_by_pkeys=['id']) as writer:
+            for log in logs:
+                writer.put_item(Item=storable(log))
+
+    def _write(self, logs):
+        """
+        Write logs, returns the ones the table rejected (written to REJECTED_FILE),
+        or None after a transient failure - the whole batch is retried (puts are idempotent)
+        """
+        if not self.table:
+            for log in logs:
+                self.fallback[log['id']] = log
+            return []
+        for attempt in range(AUDIT_FLUSH_RETRIES):
+            try:
+                self._put(logs)
+                return []
+            except (ClientError, BotoCoreError) as e:
+                if not retryable(e):
+                    # One bad item fails its whole request - bisect down to it - VS
+                    if len(logs) == 1:
+                        logger.error(f"Audit log {logs[0].get('id')} rejected: {e}")
+                        self._reject(logs)
+                        return logs
+                    middle = len(logs) // 2
+                    rejected = []
+                    for half in (logs[:middle], logs[middle:]):
+                        result = self._write(half)
+                        if result is None:
+                            return None
+                        rejected.extend(result)
+                    return rejected
+                logger.warning(f"Audit batch write failed (attempt {attempt + 1}): {e}")
+                if self._stop.wait(min(0.2 * 2 ** attempt, 5)):
+                    break
+        return None
+
+    def _reject(self, logs):
+        """Dead letter: append to REJECTED_FILE next to the WAL"""
+        try:
+            with open(os.path.join(self.wal_dir, REJECTED_FILE), 'ab') as f:
+                f.write(b''.join(json.dumps(log, default=str).encode() + b'\n' for log in logs))
+        except OSError as e:
+            logger.error(f"Audit dead letter write error: {e}")
+        self.stats['rejected'] += len(logs)
+
+    def _due_retry(self):
+        now = time.monotonic()
+        with self.lock:
+            for entry in self.retry:
+                if entry[0] <= now:
+                    self.retry.remove(entry)
+                    self.retrying -= len(entry[2])
+                    return entry[1], entry[2]
+        return 0, None
+
+    def flush_once(self):
+        """Write one batch (a due retry first), returns the number of logs taken"""
+        rounds, batch = self._due_retry()
+        if batch is None:
+            batch = self._take_batch()
+        if not batch:
+            return 0
+        logs = [log for _, log in batch]
+        rejected = self._write(logs)
+        if rejected is not None:
+            segments = {}
+            for segment, _ in batch:
+                segments[segment] = segments.get(segment, 0) + 1
+            self._release(segments)
+            if rounds and self.table:
+                for log in logs:
+                    self.fallback.pop(log['id'], None)
+            if rejected:
+                rejected_ids = {log['id'] for log in rejected}
+                logs = [log for log in logs if log['id'] not in rejected_ids]
+            self.stats['written'] += len(logs)
+            self.stats['batches'] += 1
+            for listener in self.listeners:
+                try:
+                    listener(logs)
+                except Exception as e:
+                    logger.error(f"Audit listener error: {e}")
+        else:
+            # Readable from memory until a retry persists them; the WAL segment stays on disk - VS
+            for log in logs:
+                self.fallback[log['id']] = log
+            delay = min(self.flush_interval * 2 ** rounds, AUDIT_REQUEUE_MAX_DELAY)
+            with self.lock:
+                self.retry.append((time.monotonic() + delay, rounds + 1, batch))
+                self.retrying += len(batch)
+            self.stats['failed'] += len(logs)
+            logger.error(f"Audit batch of {len(logs)} logs not written, retrying in {delay:.1f}s")
+        return len(batch)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.flush_once()
+            except Exception as e:
+                logger.error(f"Audit flusher error: {e}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self.lock:
+            if self.wal is None:
+                self._replay()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='audit-flusher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Drain what's queued (best effort) and stop the flusher"""
+        deadline = time.monotonic() + timeout
+        while self.queue.qsize() and time.monotonic() < deadline and self._thread and self._thread.is_alive():
+            time.sleep(0.05)
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=max(deadline - time.monotonic(), 0.1))
+
+    def status(self):
+        return {
+            **self.stats,
+            'queued': self.queue.qsize(),
+            'retrying': self.retrying,
+            'capacity': self.max_queue,
+            'walSegments': len(self.pending)
+        }
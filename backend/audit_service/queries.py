@@ -0,0 +1,135 @@
+"""
+PetCareApp - Audit Queries
+Zapytania o logi audytu po indeksach (dzień / użytkownik / akcja / zasób + timestamp)
+@author VS
+"""
+
+import os
+from datetime import datetime, timedelta
+
+from boto3.dynamodb.conditions import Attr, Key
+
+AUDIT_DEFAULT_LOOKBACK_DAYS = int(os.getenv('AUDIT_DEFAULT_LOOKBACK_DAYS', 30))
+AUDIT_QUERY_MAX_DAYS = int(os.getenv('AUDIT_QUERY_MAX_DAYS', 366))
+
+# Atrybut -> GSI z kluczem sortowania `timestamp` - VS
+INDEXES = {
+    'userId': 'userId-timestamp-index',
+    'action': 'action-timestamp-index',
+    'resource': 'resource-timestamp-index',
+    'day': 'day-timestamp-index'
+}
+
+
+def day_bucket(timestamp):
+    """Partition bucket of a log: its UTC day"""
+    return timestamp[:10]
+
+
+def time_range(date_from=None, date_to=None):
+    """
+    Inclusive timestamp bounds; a date-only dateTo covers the whole day.
+    Raises ValueError on a malformed date.
+    """
+    for value in (date_from, date_to):
+        if value:
+            datetime.fromisoformat(value.replace('Z', ''))
+    upper = date_to
+    if date_to and len(date_to) == 10:
+        upper = f"{date_to}T23:59:59.999999"
+    return date_from or None, upper or None
+
+
+def _timestamp_condition(lower, upper):
+    if lower and upper:
+        return Key('timestamp').between(lower, upper)
+    if lower:
+        return Key('timestamp').gte(lower)
+    if upper:
+        return Key('timestamp').lte(upper)
+    return None
+
+
+def matches(log, filters, lower=None, upper=None):
+    """Same semantics as the indexed query, for the in-memory store"""
+    timestamp = log.get('timestamp', '')
+    if lower and timestamp < lower:
+        return False
+    if upper and timestamp > upper:
+        return False
+    return all(log.get(name) == value for name, value in filters.items())
+
+
+class AuditQuery:
+    """
+    Wybór ścieżki zapytania - VS
+
+    Najbardziej selektywny podany filtr (userId > action > resource) staje się
+    kluczem partycji GSI, zakres dat - warunkiem na `timestamp`, a pozostałe
+    filtry - FilterExpression. Bez żadnego z nich odpytywane są kolejne
+    partycje dzienne (`day`) od najnowszej, aż do zebrania `limit` logów.
+    Każda ścieżka to ograniczony Query, nigdy Scan.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def find(self, user_id=None, action=None, resource=None, date_from=None, date_to=None, limit=100):
+        lower, upper = time_range(date_from, date_to)
+        filters = {name: value for name, value in (('userId', user_id), ('action', action), ('resource', resource)) if value}
+
+        for name in ('userId', 'action', 'resource'):
+            if name in filters:
+                rest = {k: v for k, v in filters.items() if k != name}
+                return self._query(name, filters[name], lower, upper, rest, limit)
+        return self._by_days(lower, upper, limit)
+
+    def _query(self, name, value, lower, upper, filters, limit):
+        condition = Key(name).eq(value)
+        timestamp = _timestamp_condition(lower, upper)
+        kwargs = {
+            'IndexName': INDEXES[name],
+            'KeyConditionExpression': condition & timestamp if timestamp else condition,
+            'ScanIndexForward': False,
+            'Limit': limit
+        }
+        if filters:
+            expression = None
+            for attribute, expected in filters.items():
+                part = Attr(attribute).eq(expected)
+                expression = part if expression is None else expression & part
+            kwargs['FilterExpression'] = expression
+
+        logs = []
+        while len(logs) < limit:
+            response = self.table.query(**kwargs)
+            logs.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return logs[:limit]
+
+    def _by_days(self, lower, upper, limit):
+        last = datetime.fromisoformat(day_bucket(upper)) if upper else datetime.utcnow()
+        if lower:
+            first = datetime.fromisoformat(day_bucket(lower))
+        else:
+            first = last - timedelta(days=AUDIT_DEFAULT_LOOKBACK_DAYS - 1)
+        first = max(first, last - timedelta(days=AUDIT_QUERY_MAX_DAYS - 1))
+
+        logs = []
+        day = last
+        while day >= first and len(logs) < limit:
+            logs.extend(self._query('day', day.strftime('%Y-%m-%d'), lower, upper, {}, limit - len(logs)))
+            day -= timedelta(days=1)
+        return logs
+
+    def day_logs(self, day):
+        """Every log of one day partition, oldest first, page by page"""
+        kwargs = {'IndexName': INDEXES['day'], 'KeyConditionExpression': Key('day').eq(day)}
+        while True:
+            response = self.table.query(**kwargs)
+            yield from response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
@@ -0,0 +1,213 @@
+"""
+PetCareApp - Audit Statistics
+Dzienne liczniki audytu (akcje, zasoby, zdarzenia bezpieczeństwa) aktualizowane przy zapisie
+@author VS
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+logger = logging.getLogger(__name__)
+
+AUDIT_STATS_TABLE = os.getenv('AUDIT_STATS_TABLE', 'PetCareApp-AuditStats')
+AUDIT_STATS_FLUSH_INTERVAL = float(os.getenv('AUDIT_STATS_FLUSH_INTERVAL', 5))
+# Without DynamoDB counters live in memory only for the days the endpoint reads - VS
+AUDIT_STATS_MEMORY_DAYS = 8
+
+FAILED_STATUSES = ('failure', 'failed', 'error')
+DENIED_STATUSES = ('denied', 'forbidden', 'blocked', 'unauthorized')
+PASSWORD_RESET_ACTIONS = ('password_reset', 'reset_password')
+
+# action/resource come from the client - anything else is counted as 'other',
+# so a day item can't grow with arbitrary attribute names - VS
+KNOWN_ACTIONS = {
+    'create', 'read', 'update', 'delete', 'login', 'logout', 'login_failed', 'access_denied',
+    'export', 'archive', 'upload', 'download', *PASSWORD_RESET_ACTIONS
+}
+KNOWN_RESOURCES = {
+    'user', 'auth', 'pet', 'appointment', 'payment', 'invoice', 'medical_record', 'prescription',
+    'vaccination', 'drug', 'notification', 'report', 'analytics', 'alert', 'audit', 'file'
+}
+AUDIT_STATS_READ_RETRIES = 5
+
+
+def bucket(value, known):
+    """Counter name part: the value itself when known, 'unknown' when missing, otherwise 'other'"""
+    if not value:
+        return 'unknown'
+    value = str(value).lower()
+    return value if value in known else 'other'
+
+
+def security_events(log):
+    """Security counters a single log contributes to"""
+    action, status = log.get('action'), log.get('status')
+    events = []
+    if action in ('login', 'login_failed') and (action == 'login_failed' or status in FAILED_STATUSES):
+        events.append('failedLogins')
+    if action in PASSWORD_RESET_ACTIONS:
+        events.append('passwordResets')
+    if status in DENIED_STATUSES or action == 'access_denied':
+        events.append('suspiciousActivity')
+    return events
+
+
+def contribution(log, counters=None):
+    """Counter increments of one log: {day: {counter: n}}"""
+    counters = {} if counters is None else counters
+    day = log.get('day') or str(log.get('timestamp', ''))[:10]
+    if not day:
+        return counters
+    row = counters.setdefault(day, {})
+    names = [
+        'total',
+        f"action#{bucket(log.get('action'), KNOWN_ACTIONS)}",
+        f"resource#{bucket(log.get('resource'), KNOWN_RESOURCES)}"
+    ]
+    names += [f"security#{event}" for event in security_events(log)]
+    for name in names:
+        row[name] = row.get(name, 0) + 1
+    return counters
+
+
+def _merge(target, counters):
+    for day, row in counters.items():
+        day_row = target.setdefault(day, {})
+        for name, value in row.items():
+            day_row[name] = day_row.get(name, 0) + value
+
+
+def _group(row, prefix):
+    return {name[len(prefix):]: int(value) for name, value in row.items() if name.startswith(prefix)}
+
+
+class AuditStats:
+    """
+    Liczniki w tabeli AuditStats: jeden element na dzień (`day`), atrybut na licznik - VS
+
+    Flusher ingestora przekazuje zapisane logi do record(); przyrosty są
+    sumowane w pamięci i co AUDIT_STATS_FLUSH_INTERVAL trafiają do tabeli
+    jako atomowe ADD (jedno UpdateItem na dzień), więc kilka instancji
+    serwisu może liczyć równolegle. Statystyki to odczyt 7 elementów
+    niezależnie od liczby logów; niezapisane jeszcze przyrosty tej
+    instancji są doliczane, żeby wynik był aktualny.
+    """
+
+    def __init__(self, dynamodb, table_name=AUDIT_STATS_TABLE, flush_interval=AUDIT_STATS_FLUSH_INTERVAL):
+        self.table_name = table_name
+        self.table = dynamodb.Table(table_name) if dynamodb else None
+        self.dynamodb = dynamodb
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.memory = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, logs):
+        counters = {}
+        for log in logs:
+            contribution(log, counters)
+        with self.lock:
+            _merge(self.pending, counters)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        if not self.table:
+            _merge(self.memory, pending)
+            oldest = (datetime.utcnow() - timedelta(days=AUDIT_STATS_MEMORY_DAYS)).strftime('%Y-%m-%d')
+            for day in [d for d in self.memory if d < oldest]:
+                del self.memory[day]
+            return
+        for day, row in pending.items():
+            names = {f"#c{i}": name for i, name in enumerate(row)}
+            values = {f":v{i}": value for i, value in enumerate(row.values())}
+            try:
+                self.table.update_item(
+                    Key={'day': day},
+                    UpdateExpression='ADD ' + ', '.join(f"{n} {v}" for n, v in zip(names, values)),
+                    ExpressionAttributeNames=names,
+                    ExpressionAttributeValues=values
+                )
+            except (ClientError, BotoCoreError) as e:
+                # Put them back, next round retries - VS
+                logger.error(f"Audit stats update error for {day}: {e}")
+                with self.lock:
+                    _merge(self.pending, {day: row})
+
+    def _days(self, days):
+        """Counters of the given days, stored plus not yet flushed"""
+        rows = {day: {} for day in days}
+        if self.table:
+            request_items = {self.table_name: {'Keys': [{'day': day} for day in days]}}
+            for attempt in range(AUDIT_STATS_READ_RETRIES):
+                response = self.dynamodb.batch_get_item(RequestItems=request_items)
+                for item in response.get('Responses', {}).get(self.table_name, []):
+                    rows[item['day']] = {k: v for k, v in item.items() if k != 'day'}
+                # Throttled keys come back as UnprocessedKeys - read them again with backoff - VS
+                request_items = response.get('UnprocessedKeys')
+                if not request_items:
+                    break
+                time.sleep(0.05 * 2 ** attempt)
+            else:
+                logger.warning(f"Audit stats: {len(request_items[self.table_name]['Keys'])} days unread after retries")
+        else:
+            _merge(rows, {day: self.memory.get(day, {}) for day in days})
+        with self.lock:
+            _merge(rows, {day: self.pending[day] for day in days if day in self.pending})
+        return rows
+
+    def summary(self, now=None):
+        now = now or datetime.utcnow()
+        days = [(now - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(7)]
+        rows = self._days(days)
+        today = rows[days[0]]
+        week = {}
+        for row in rows.values():
+            for name, value in row.items():
+                week[name] = week.get(name, 0) + value
+        return {
+            'today': {
+                'total': int(today.get('total', 0)),
+                'byAction': _group(today, 'action#'),
+                'byResource': _group(today, 'resource#')
+            },
+            'lastWeek': {
+                'total': int(week.get('total', 0)),
+                'byResource': _group(week, 'resource#'),
+                'byDay': {day: int(rows[day].get('total', 0)) for day in reversed(days)}
+            },
+            'securityEvents': {
+                'failedLogins': int(today.get('security#failedLogins', 0)),
+                'suspiciousActivity': int(today.get('security#suspiciousActivity', 0)),
+                'passwordResets': int(today.get('security#passwordResets', 0)),
+                'lastWeek': _group(week, 'security#')
+            },
+            'generatedAt': now.isoformat()
+        }
+
+    def _loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Audit stats flush error: {e}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='audit-stats', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
@@ -4,19 +4,32 @@ Serwis autoryzacji z AWS Cognito
 @author VS
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
+import sys
 import logging
 import jwt
 import boto3
 from botocore.exceptions import ClientError
 
+# Shared modules live one level up (/app/shared in the container) - VS
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.auth import bearer_token, init_auth
+from shared.rate_limit import RateLimiter, client_ip_key, rate_limit, shared_cache
+from shared.revocation import get_revocations
+
+from profiles import ProfileCache, profile_from_attributes, profile_from_id_token
+from sessions import SessionError, SessionStore
+from tokens import TokenIssuer
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+# Login/register/refresh are public; /me reads the user verified by the middleware - VS
+init_auth(app, public_paths=('/api/v1/auth/',))
 
 # AWS Configuration - VS
 AWS_REGION = os.getenv('AWS_REGION', 'eu-north-1')
@@ -32,6 +45,13 @@ try:
 except Exception as e:
     logger.warning(f"Cognito not available: {e}")
 
+# Refresh token sessions - VS
+dynamodb = None
+try:
+    dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION)
+except Exception as e:
+    logger.warning(f"DynamoDB not available, sessions kept in memory: {e}")
+
 # Test accounts for development - VS
 TEST_ACCOUNTS = {
     'admin@petcareapp.com': {'password': 'Admin123!', 'id': 'test-admin-001', 'firstName': 'Admin', 'lastName': 'System', 'role': 'admin'},
@@ -40,14 +60,10 @@ TEST_ACCOUNTS = {
     'it@petcareapp.com': {'password': 'It123!', 'id': 'test-it-001', 'firstName': 'Piotr', 'lastName': 'Wiśniewski', 'role': 'it'}
 }
 
-def create_token(user_data, expires_hours=24):
-    """Create JWT token - VS"""
-    payload = {
-        **user_data,
-        'exp': datetime.utcnow() + timedelta(hours=expires_hours),
-        'iat': datetime.utcnow()
-    }
-    return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
+issuer = TokenIssuer(JWT_SECRET)
+profiles = ProfileCache()
+revocations = get_revocations()
+sessions = SessionStore(dynamodb, revocations, refresh_ttl=issuer.refresh_ttl, access_ttl=issuer.access_ttl)
 
 def verify_token(token):
     """Verify JWT token - VS"""
@@ -58,16 +74,37 @@ def verify_token(token):
     except jwt.InvalidTokenError:
         return None
 
+# Login throttling before Cognito is called: per IP (credential stuffing) and per e-mail
+# (password guessing, reset after a successful login) - VS
+LOGIN_IP_RATE_LIMIT = int(os.getenv('LOGIN_IP_RATE_LIMIT', 20))
+LOGIN_EMAIL_RATE_LIMIT = int(os.getenv('LOGIN_EMAIL_RATE_LIMIT', 5))
+login_ip_limiter = RateLimiter('login-ip', LOGIN_IP_RATE_LIMIT, 60, cache=shared_cache())
+login_email_limiter = RateLimiter('login-email', LOGIN_EMAIL_RATE_LIMIT, 300, cache=shared_cache())
+
+def login_email():
+    data = request.get_json(silent=True) or {}
+    email = str(data.get('email', '')).lower().strip()
+    return email or None
+
+def start_session(user):
+    """Login response tokens bound to a new refresh session - VS"""
+    sid, refresh_jti = sessions.open(user)
+    return issuer.issue(user, sid=sid, refresh_jti=refresh_jti)
+
 @app.route('/api/v1/health', methods=['GET'])
 def health_check():
     return jsonify({
         'service': 'auth-service',
         'status': 'healthy',
         'cognito': cognito_client is not None,
+        'revocations': revocations.status(),
+        'loginRateLimits': {'ip': login_ip_limiter.status(), 'email': login_email_limiter.status()},
         'timestamp': datetime.utcnow().isoformat()
     })
 
 @app.route('/api/v1/auth/login', methods=['POST'])
+@rate_limit(login_ip_limiter, key=client_ip_key)
+@rate_limit(login_email_limiter, key=login_email)
 def login():
     """Login endpoint - VS"""
     data = request.get_json()
@@ -88,16 +125,9 @@ def login():
                 'lastName': account['lastName'],
                 'role': account['role']
             }
-            access_token = create_token(user)
-            refresh_token = create_token({'email': email, 'type': 'refresh'}, expires_hours=168)
-            
             logger.info(f"Test account login: {email}")
-            return jsonify({
-                'user': user,
-                'accessToken': access_token,
-                'refreshToken': refresh_token,
-                'expiresIn': 86400
-            })
+            login_email_limiter.reset(email)
+            return jsonify({'user': user, **start_session(user)})
         else:
             return jsonify({'error': 'Invalid password'}), 401
     
@@ -113,25 +143,25 @@ def login():
                 }
             )
             
-            # Get user attributes
-            access_token = response['AuthenticationResult']['AccessToken']
-            user_response = cognito_client.get_user(AccessToken=access_token)
+            result = response.get('AuthenticationResult')
+            if not result:
+                return jsonify({'error': 'Additional authentication step required',
+                                'challenge': response.get('ChallengeName')}), 401
             
-            attributes = {attr['Name']: attr['Value'] for attr in user_response['UserAttributes']}
-            
-            user = {
-                'id': attributes.get('sub', ''),
-                'email': email,
-                'firstName': attributes.get('given_name', ''),
-                'lastName': attributes.get('family_name', ''),
-                'role': attributes.get('custom:role', 'client')
-            }
+            # User attributes come from the ID token claims - no get_user round trip - VS
+            if result.get('IdToken'):
+                user = profile_from_id_token(result['IdToken'], email)
+            else:
+                user_response = cognito_client.get_user(AccessToken=result['AccessToken'])
+                user = profile_from_attributes(user_response['UserAttributes'], email)
+            profiles.put(user)
+            login_email_limiter.reset(email)
             
             return jsonify({
                 'user': user,
-                'accessToken': response['AuthenticationResult']['AccessToken'],
-                'refreshToken': response['AuthenticationResult']['RefreshToken'],
-                'expiresIn': response['AuthenticationResult']['ExpiresIn']
+                'accessToken': result['AccessToken'],
+                'refreshToken': result['RefreshToken'],
+                'expiresIn': result['ExpiresIn']
             })
             
         except cognito_client.exceptions.NotAuthorizedException:
@@ -214,45 +244,90 @@ def refresh_token():
     if not decoded or decoded.get('type') != 'refresh':
         return jsonify({'error': 'Invalid refresh token'}), 401
     
-    email = decoded.get('email', '')
-    if email in TEST_ACCOUNTS:
-        account = TEST_ACCOUNTS[email]
-        user = {
-            'id': account['id'],
-            'email': email,
-            'firstName': account['firstName'],
-            'lastName': account['lastName'],
-            'role': account['role']
-        }
-        new_token = create_token(user)
-        return jsonify({'accessToken': new_token, 'expiresIn': 86400})
+    # Every refresh rotates the refresh token; the old one stops working - VS
+    sid = decoded.get('sid')
+    if not sid:
+        return jsonify({'error': 'Session expired, please log in again'}), 401
+    try:
+        user, refresh_jti = sessions.rotate(sid, decoded.get('jti'))
+    except SessionError as e:
+        return jsonify({'error': str(e)}), 401
+    except Exception as e:
+        logger.error(f"Session rotation error: {e}")
+        return jsonify({'error': 'Token refresh failed'}), 503
     
-    return jsonify({'error': 'Token refresh failed'}), 401
+    return jsonify(issuer.issue(user, sid=sid, refresh_jti=refresh_jti))
 
 @app.route('/api/v1/auth/logout', methods=['POST'])
 def logout():
-    """Logout user - VS"""
+    """Logout user - revokes the session of the access/refresh token - VS"""
+    data = request.get_json(silent=True) or {}
+    user = g.get('user') or {}
+    refresh = verify_token(data.get('refreshToken', '')) if data.get('refreshToken') else None
+    
+    sid = user.get('sid') or (refresh or {}).get('sid')
+    if sid:
+        sessions.revoke(sid, reason='logout')
+    elif user.get('jti'):
+        revocations.revoke_token(user, reason='logout')
+    
+    # Cognito refresh token (not ours) - revoke it at Cognito too - VS
+    if data.get('refreshToken') and not refresh and cognito_client and COGNITO_CLIENT_ID:
+        try:
+            cognito_client.revoke_token(Token=data['refreshToken'], ClientId=COGNITO_CLIENT_ID)
+        except Exception as e:
+            logger.warning(f"Cognito revoke_token error: {e}")
+    
     return jsonify({'message': 'Logged out successfully'})
 
+@app.route('/api/v1/auth/sessions/revoke', methods=['POST'])
+def revoke_sessions():
+    """Revoke a compromised session (`sid`) or all sessions of a user (`email`) - admin/IT only - VS"""
+    user = g.get('user')
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if user.get('role') not in ('admin', 'it'):
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    reason = data.get('reason', 'revoked')
+    if data.get('sid'):
+        sessions.revoke(data['sid'], reason=reason)
+        return jsonify({'revoked': 1})
+    if data.get('email'):
+        email = data['email'].lower().strip()
+        try:
+            return jsonify({'revoked': sessions.revoke_user(email, reason=reason)})
+        except Exception as e:
+            logger.error(f"Session revoke error: {e}")
+            return jsonify({'error': 'Session revoke failed'}), 500
+    return jsonify({'error': 'sid or email is required'}), 400
+
 @app.route('/api/v1/auth/me', methods=['GET'])
 def get_current_user():
     """Get current user from token - VS"""
-    auth_header = request.headers.get('Authorization', '')
-    if not auth_header.startswith('Bearer '):
-        return jsonify({'error': 'No token provided'}), 401
-    
-    token = auth_header.split(' ')[1]
-    decoded = verify_token(token)
-    
-    if not decoded:
+    user = g.get('user')
+    if not user:
         return jsonify({'error': 'Invalid token'}), 401
     
+    # Cognito access tokens carry no names - profile from login cache, else one get_user - VS
+    if not user.get('firstName') and cognito_client:
+        profile = profiles.get(user.get('id'))
+        if not profile:
+            try:
+                user_response = cognito_client.get_user(AccessToken=bearer_token())
+                profile = profile_from_attributes(user_response['UserAttributes'], user.get('email'))
+                profiles.put(profile)
+            except Exception as e:
+                logger.warning(f"Cognito get_user error: {e}")
+        user = profile or user
+    
     return jsonify({
-        'id': decoded.get('id'),
-        'email': decoded.get('email'),
-        'firstName': decoded.get('firstName'),
-        'lastName': decoded.get('lastName'),
-        'role': decoded.get('role')
+        'id': user.get('id'),
+        'email': user.get('email'),
+        'firstName': user.get('firstName'),
+        'lastName': user.get('lastName'),
+        'role': user.get('role')
     })
 
 if __name__ == '__main__':
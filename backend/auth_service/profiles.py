@@ -0,0 +1,75 @@
+"""
+PetCareApp - User Profiles
+Profil użytkownika z claimów ID tokena Cognito + krótki cache profili
+@author VS
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import jwt
+
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', 300))
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 10000))
+
+
+def profile_from_claims(claims, email=None):
+    return {
+        'id': claims.get('sub', ''),
+        'email': claims.get('email') or email,
+        'firstName': claims.get('given_name', ''),
+        'lastName': claims.get('family_name', ''),
+        'role': claims.get('custom:role', 'client')
+    }
+
+
+def profile_from_id_token(id_token, email=None):
+    """
+    ID token comes straight from our own initiate_auth call over TLS, so the
+    claims are read without a signature check - saves the get_user round trip - VS
+    """
+    claims = jwt.decode(id_token, options={'verify_signature': False})
+    return profile_from_claims(claims, email)
+
+
+def profile_from_attributes(attributes, email=None):
+    """get_user / admin_get_user attribute list -> profile"""
+    return profile_from_claims({attr['Name']: attr['Value'] for attr in attributes}, email)
+
+
+class ProfileCache:
+    """LRU profili po e-mailu i id, każdy wpis ważny PROFILE_CACHE_TTL sekund - VS"""
+
+    def __init__(self, ttl=PROFILE_CACHE_TTL, max_size=PROFILE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, profile):
+        expires = time.monotonic() + self.ttl
+        with self.lock:
+            for key in (profile.get('email'), profile.get('id')):
+                if key:
+                    self.entries[key] = (profile, expires)
+                    self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+            if entry[1] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def invalidate(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
@@ -0,0 +1,168 @@
+"""
+PetCareApp - Auth Sessions
+Sesje logowania z rotacją refresh tokenów i wykrywaniem ich ponownego użycia
+@author VS
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import BotoCoreError, ClientError
+
+from tokens import ACCESS_TOKEN_TTL, REFRESH_TOKEN_TTL
+
+logger = logging.getLogger(__name__)
+
+AUTH_SESSIONS_TABLE = os.getenv('AUTH_SESSIONS_TABLE', 'PetCareApp-AuthSessions')
+# A refresh retried right after rotation (parallel 401s in the browser) is not a reuse - VS
+AUTH_REFRESH_REUSE_GRACE = int(os.getenv('AUTH_REFRESH_REUSE_GRACE', 10))
+
+
+class SessionError(Exception):
+    """Sesja nie istnieje, wygasła albo została unieważniona"""
+
+
+class RefreshTokenReuse(SessionError):
+    """Użyto refresh tokenu, który został już wymieniony - sesja unieważniona"""
+
+
+class SessionStore:
+    """
+    Jedna sesja = jeden element tabeli (`sid`) z `jti` aktualnego refresh tokenu - VS
+
+    Odświeżenie to warunkowe UpdateItem (`refreshJti = <jti z tokenu>`),
+    które wymienia jti na nowy, więc każdy refresh token działa raz. Token
+    z nieaktualnym jti oznacza, że ktoś posługuje się skradzioną kopią -
+    cała sesja jest unieważniana, a jej `sid` trafia na listę unieważnień,
+    przez co przestają działać także wydane w niej access tokeny.
+    Bez DynamoDB sesje żyją w pamięci procesu (tryb deweloperski).
+    """
+
+    def __init__(self, dynamodb, revocations, table_name=AUTH_SESSIONS_TABLE,
+                 refresh_ttl=REFRESH_TOKEN_TTL, access_ttl=ACCESS_TOKEN_TTL, reuse_grace=AUTH_REFRESH_REUSE_GRACE):
+        self.table = dynamodb.Table(table_name) if dynamodb else None
+        self.revocations = revocations
+        self.refresh_ttl = refresh_ttl
+        self.access_ttl = access_ttl
+        self.reuse_grace = reuse_grace
+        self.memory = {}
+        self.lock = threading.Lock()
+
+    def _get(self, sid):
+        if self.table is None:
+            with self.lock:
+                session = self.memory.get(sid)
+                return dict(session) if session else None
+        return self.table.get_item(Key={'sid': sid}, ConsistentRead=True).get('Item')
+
+    def open(self, user):
+        """Nowa sesja po logowaniu, zwraca (sid, jti refresh tokenu)"""
+        sid, jti = uuid.uuid4().hex, uuid.uuid4().hex
+        now = int(time.time())
+        session = {
+            'sid': sid,
+            'email': user['email'],
+            'user': user,
+            'refreshJti': jti,
+            'createdAt': datetime.utcnow().isoformat(),
+            'rotatedAt': now,
+            'expiresAt': now + self.refresh_ttl
+        }
+        if self.table is None:
+            with self.lock:
+                if len(self.memory) >= 10000:
+                    self.memory = {k: v for k, v in self.memory.items() if v['expiresAt'] > now}
+                self.memory[sid] = session
+        else:
+            self.table.put_item(Item=session)
+        return sid, jti
+
+    def rotate(self, sid, jti):
+        """
+        Wymiana refresh tokenu: zwraca (użytkownik, nowy jti).
+        SessionError gdy sesji nie ma, RefreshTokenReuse przy ponownym użyciu.
+        """
+        new_jti = uuid.uuid4().hex
+        now = int(time.time())
+        if self.table is None:
+            with self.lock:
+                session = self.memory.get(sid)
+                if session and session['refreshJti'] == jti and 'revokedAt' not in session and session['expiresAt'] > now:
+                    session.update(previousJti=jti, refreshJti=new_jti, rotatedAt=now, expiresAt=now + self.refresh_ttl)
+                    return session['user'], new_jti
+        else:
+            try:
+                response = self.table.update_item(
+                    Key={'sid': sid},
+                    UpdateExpression='SET refreshJti = :new, previousJti = :old, rotatedAt = :now, expiresAt = :exp',
+                    ConditionExpression='refreshJti = :old AND attribute_not_exists(revokedAt) AND expiresAt > :now',
+                    ExpressionAttributeValues={':new': new_jti, ':old': jti, ':now': now, ':exp': now + self.refresh_ttl},
+                    ReturnValues='ALL_NEW'
+                )
+                return response['Attributes']['user'], new_jti
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+
+        session = self._get(sid)
+        if not session or 'revokedAt' in session or int(session['expiresAt']) <= now:
+            raise SessionError('Session expired or revoked')
+        if session.get('previousJti') == jti and now - int(session['rotatedAt']) <= self.reuse_grace:
+            # Lost the race with a parallel refresh - hand out the current refresh jti - VS
+            return session['user'], session['refreshJti']
+        logger.warning(f"Refresh token reuse detected for session {sid} ({session.get('email')}) - revoking")
+        self.revoke(sid, reason='refresh_token_reuse')
+        raise RefreshTokenReuse('Refresh token reuse detected, session revoked')
+
+    def revoke(self, sid, reason='logout'):
+        """
+        Unieważnienie sesji: kolejne odświeżenia są odrzucane, a access tokeny
+        z tym `sid` - na liście unieważnień do końca swojej ważności
+        """
+        now = int(time.time())
+        if self.table is None:
+            with self.lock:
+                session = self.memory.get(sid)
+                if session:
+                    session.update(revokedAt=datetime.utcnow().isoformat(), revokedReason=reason)
+        else:
+            try:
+                self.table.update_item(
+                    Key={'sid': sid},
+                    UpdateExpression='SET revokedAt = :at, revokedReason = :reason',
+                    ConditionExpression='attribute_exists(sid)',
+                    ExpressionAttributeValues={':at': datetime.utcnow().isoformat(), ':reason': reason}
+                )
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    logger.error(f"Session revoke error for {sid}: {e}")
+            except BotoCoreError as e:
+                logger.error(f"Session revoke error for {sid}: {e}")
+        # Also covers Cognito sessions (sid = origin_jti) that have no element here - VS
+        self.revocations.revoke('sid', sid, now + self.access_ttl, reason)
+
+    def revoke_user(self, email, reason='revoked'):
+        """Unieważnienie wszystkich aktywnych sesji użytkownika, zwraca ich liczbę"""
+        now = int(time.time())
+        if self.table is None:
+            with self.lock:
+                sids = [s['sid'] for s in self.memory.values()
+                        if s['email'] == email and 'revokedAt' not in s and s['expiresAt'] > now]
+        else:
+            sids = []
+            kwargs = {'IndexName': 'email-index', 'KeyConditionExpression': Key('email').eq(email)}
+            while True:
+                response = self.table.query(**kwargs)
+                sids.extend(s['sid'] for s in response.get('Items', [])
+                            if 'revokedAt' not in s and int(s['expiresAt']) > now)
+                if 'LastEvaluatedKey' not in response:
+                    break
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        for sid in sids:
+            self.revoke(sid, reason)
+        return len(sids)
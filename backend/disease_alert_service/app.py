@@ -6,18 +6,35 @@ Integrates with WOAH/OIE, ADNS/ADIS, GIW (PL), EFSA
 from flask import Flask, request, jsonify
 
 import os
+import sys
 import logging
 import hashlib
 import json
 from datetime import datetime, timedelta
-from functools import wraps
-from concurrent.futures import ThreadPoolExecutor
+
+# Shared modules live one level up (/app/shared in the container) - VS
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.auth import require_auth
+from shared.http_cache import cached_response
+
+from outbreaks import OutbreakStore, IngestionWorker, FEEDS, STORE_PATH
+from matcher import PopulationIndex, NotificationSender, AlertMatcher, PopulationRefresher
 
 app = Flask(__name__)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Outbreak store fed by the background ingestion worker
+outbreak_store = OutbreakStore(STORE_PATH or None)
+ingestion_worker = IngestionWorker(outbreak_store, FEEDS)
+
+# Proactive matching of new outbreaks against the pet population
+population = PopulationIndex()
+alert_matcher = AlertMatcher(population, NotificationSender())
+population_refresher = PopulationRefresher(population)
+ingestion_worker.add_listener(alert_matcher.on_outbreaks)
+
 # Cache
 CACHE_TTL = 1800  # 30 min
 cache = {}
@@ -35,15 +52,6 @@ def get_cached(key):
 def set_cached(key, data, ttl=CACHE_TTL):
     cache[key] = (data, datetime.now() + timedelta(seconds=ttl))
 
-# Auth Decorator 
-def require_auth(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        if not request.headers.get('Authorization') and os.getenv('APP_ENV') == 'production':
-            return jsonify({'error': 'Unauthorized'}), 401
-        return f(*args, **kwargs)
-    return decorated
-
 # Health
 @app.route("/health", methods=['GET'])
 def health():
@@ -54,37 +62,104 @@ def health():
         'sources': ['WOAH/OIE', 'ADNS/ADIS (EU)', 'GIW (PL)', 'EFSA']
     })
 
-#  Example Alerts Endpoint 
+#  Alerts Endpoint 
 @app.route("/alerts", methods=['GET'])
 @require_auth
 def alerts():
+    """
+    Outbreaks from the local store, e.g. within X km of a clinic in the last N days
+    
+    GET /alerts?lat=52.23&lon=21.01&radiusKm=50&days=30&disease=asf,hpai
+    """
     country = request.args.get('country', 'POL')
     source = request.args.get('source', 'ALL').upper()
     limit = min(int(request.args.get('limit', 50)), 100)
+    days = min(int(request.args.get('days', 30)), 365)
+    radius_km = min(float(request.args.get('radiusKm', 50)), 1000)
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    diseases = [d.strip().lower() for d in request.args.get('disease', '').split(',') if d.strip()]
+    
+    # Spatial queries are not limited to a single country
+    if lat is not None and lon is not None and 'country' not in request.args:
+        country = None
     
-    cache_key = get_cache_key('alerts', {'country': country, 'source': source})
+    params = {'country': country, 'source': source, 'limit': limit, 'days': days,
+              'radiusKm': radius_km, 'lat': lat, 'lon': lon, 'diseases': diseases}
+    cache_key = get_cache_key(f'alerts:{outbreak_store.version}', params)
     cached = get_cached(cache_key)
     if cached:
         return jsonify({**cached, 'cached': True})
     
+    found = outbreak_store.query(
+        lat=lat, lon=lon, radius_km=radius_km, days=days,
+        diseases=diseases or None, country=country,
+        source=None if source == 'ALL' else source, limit=limit
+    )
+    
     results = {
         'country': country,
+        'query': params,
         'sources': [],
-        'alerts': [],
+        'alerts': found,
         'data_portals': []
     }
     
-    results['sources'].append({
-        'id': 'WOAH',
-        'name': 'World Organisation for Animal Health',
-        'url': 'https://wahis.woah.org',
-        'count': 0,
-        'note': ''
-    })
+    for feed in FEEDS:
+        if source not in ('ALL', feed.id):
+            continue
+        last_run = ingestion_worker.last_run.get(feed.id, {})
+        results['sources'].append({
+            'id': feed.id,
+            'name': feed.name,
+            'count': len([a for a in found if a['source'] == feed.id]),
+            'lastIngest': last_run.get('at'),
+            'error': last_run.get('error')
+        })
     
     set_cached(cache_key, results)
     return jsonify(results)
 
+@app.route("/alerts/ingest", methods=['POST'])
+@require_auth
+def ingest_alerts():
+    """Run outbreak ingestion immediately"""
+    changed = ingestion_worker.run_once()
+    return jsonify({
+        'changed': len(changed),
+        'total': len(outbreak_store),
+        'sources': ingestion_worker.last_run
+    })
+
+@app.route("/alerts/population", methods=['POST'])
+@require_auth
+def update_population():
+    """
+    Incremental population update pushed by pet/user services
+    
+    POST {"users": [{"id", "region"}], "pets": [{"id", "ownerId", "species"}], "deletedPets": ["id"]}
+    """
+    if population.refreshed_at is None:
+        # Owner regions come from the first full refresh - pets pushed before it would be dropped
+        response = jsonify({'error': 'Population index not loaded yet'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    data = request.get_json(silent=True) or {}
+    if any(not isinstance(item, dict) or 'id' not in item for item in data.get('users', []) + data.get('pets', [])):
+        return jsonify({'error': 'Every user and pet needs an id'}), 400
+    for user in data.get('users', []):
+        population.set_owner_region(user['id'], user.get('region'))
+    indexed = sum(1 for pet in data.get('pets', []) if population.upsert_pet(pet))
+    for pet_id in data.get('deletedPets', []):
+        population.remove_pet(pet_id)
+    return jsonify({'indexed': indexed, 'population': population.stats()})
+
+@app.route("/alerts/matches", methods=['GET'])
+@require_auth
+def match_stats():
+    """Proactive matching statistics"""
+    return jsonify({'population': population.stats(), 'matcher': alert_matcher.stats})
+
 #  ASF Info 
 @app.route("/alerts/asf", methods=['GET'])
 @require_auth
@@ -102,6 +177,7 @@ def asf_info():
 
 #  Monitored Diseases 
 @app.route("/alerts/diseases", methods=['GET'])
+@cached_response(max_age=86400)
 def monitored_diseases():
     return jsonify([
         {'id': 'asf', 'name': 'Afrykański pomór świń', 'notifiable': True},
@@ -114,7 +190,9 @@ def monitored_diseases():
 def stats():
     return jsonify({
         'cache_entries': len(cache),
-        'sources_count': 4,
+        'sources_count': len(FEEDS),
+        'outbreaks': outbreak_store.stats(),
+        'last_ingest': ingestion_worker.last_run,
         'real_time_sources': ['WOAH'],
         'data_portal_sources': ['ADNS/ADIS', 'EFSA'],
         'map_sources': ['GIW']
@@ -123,4 +201,11 @@ def stats():
 #  Main 
 if __name__ == "__main__":
     port = int(os.getenv('PORT', 8011))
+    if os.getenv('OUTBREAK_INGEST_ENABLED', 'true').lower() == 'true':
+        try:
+            population.refresh()
+        except Exception as e:
+            logger.warning(f"Population index not loaded: {e}")
+        population_refresher.start()
+        ingestion_worker.start()
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,247 @@
+"""
+PetCareApp - Outbreak Matcher
+Matches newly ingested outbreaks against the pet population and notifies owners in batches
+@author VS
+"""
+
+import os
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from shared.auth import service_headers
+
+logger = logging.getLogger(__name__)
+
+PET_SERVICE_URL = os.getenv('PET_SERVICE_URL', 'http://pet:8012')
+USER_SERVICE_URL = os.getenv('USER_SERVICE_URL', 'http://user:8002')
+NOTIFICATION_SERVICE_URL = os.getenv('NOTIFICATION_SERVICE_URL', 'http://notification:8005')
+POPULATION_REFRESH_INTERVAL = int(os.getenv('POPULATION_REFRESH_INTERVAL', 3600))
+NOTIFY_BATCH_SIZE = int(os.getenv('NOTIFY_BATCH_SIZE', 500))
+ALERT_MAX_AGE_DAYS = int(os.getenv('ALERT_MAX_AGE_DAYS', 30))
+
+# Pet species (pet_service ids) susceptible to monitored diseases
+DISEASE_SPECIES = {
+    'asf': {'other'},  # domestic/miniature pigs are registered as "other"
+    'hpai': {'bird'},
+    'rabies': {'dog', 'cat', 'rabbit', 'guinea_pig', 'hamster', 'other'}
+}
+
+# Outbreak species names (as reported by feeds) mapped to pet_service species ids
+OUTBREAK_SPECIES = {
+    'dog': 'dog', 'dogs': 'dog', 'cat': 'cat', 'cats': 'cat',
+    'bird': 'bird', 'birds': 'bird', 'poultry': 'bird', 'wild birds': 'bird',
+    'rabbit': 'rabbit', 'swine': 'other', 'pig': 'other', 'pigs': 'other'
+}
+
+
+def normalize_region(value):
+    return ' '.join(str(value or '').lower().replace('województwo', '').split())
+
+
+def susceptible_species(outbreak):
+    species = set(DISEASE_SPECIES.get(outbreak.get('disease'), set()))
+    for name in outbreak.get('species', []):
+        if name in OUTBREAK_SPECIES:
+            species.add(OUTBREAK_SPECIES[name])
+    return species
+
+
+class PopulationIndex:
+    """
+    Pets bucketed by (owner region, species), so an outbreak only touches
+    the buckets of its own region instead of scanning all pets - VS
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.buckets = {}      # (region, species) -> {petId: pet summary}
+        self.pet_keys = {}     # petId -> (region, species)
+        self.owner_regions = {}
+        self.refreshed_at = None
+
+    def __len__(self):
+        return len(self.pet_keys)
+
+    def set_owner_region(self, owner_id, region):
+        with self.lock:
+            self.owner_regions[owner_id] = normalize_region(region)
+
+    def upsert_pet(self, pet):
+        """Add or move a single pet, returns False if the owner's region is unknown"""
+        with self.lock:
+            self.remove_pet(pet['id'])
+            region = self.owner_regions.get(pet.get('ownerId'))
+            if not region or not pet.get('species') or pet.get('isActive') is False:
+                return False
+            key = (region, pet['species'])
+            self.buckets.setdefault(key, {})[pet['id']] = {
+                'petId': pet['id'],
+                'petName': pet.get('name', ''),
+                'ownerId': pet.get('ownerId'),
+                'species': pet['species']
+            }
+            self.pet_keys[pet['id']] = key
+            return True
+
+    def remove_pet(self, pet_id):
+        with self.lock:
+            key = self.pet_keys.pop(pet_id, None)
+            if key:
+                bucket = self.buckets.get(key, {})
+                bucket.pop(pet_id, None)
+                if not bucket:
+                    self.buckets.pop(key, None)
+
+    def pets_in(self, region, species):
+        with self.lock:
+            return list(self.buckets.get((normalize_region(region), species), {}).values())
+
+    def load(self, users, pets):
+        """Rebuild the whole index from user and pet lists"""
+        fresh = PopulationIndex()
+        for user in users:
+            if user.get('region'):
+                fresh.set_owner_region(user['id'], user['region'])
+        for pet in pets:
+            fresh.upsert_pet(pet)
+        with self.lock:
+            self.buckets = fresh.buckets
+            self.pet_keys = fresh.pet_keys
+            self.owner_regions = fresh.owner_regions
+            self.refreshed_at = datetime.utcnow().isoformat()
+
+    def refresh(self):
+        """Pull the population snapshot from user_service and pet_service"""
+        headers = service_headers('disease-alert-service')
+        users = requests.get(f"{USER_SERVICE_URL}/api/v1/users", headers=headers, timeout=30)
+        users.raise_for_status()
+        pets = requests.get(f"{PET_SERVICE_URL}/api/v1/pets", headers=headers, timeout=30)
+        pets.raise_for_status()
+        self.load(users.json(), pets.json())
+        logger.info(f"Population index refreshed: {len(self.pet_keys)} pets in {len(self.buckets)} buckets")
+
+    def stats(self):
+        with self.lock:
+            return {'pets': len(self.pet_keys), 'buckets': len(self.buckets), 'refreshedAt': self.refreshed_at}
+
+
+class NotificationSender:
+    """Sends notifications to notification_service in batches - VS"""
+
+    def __init__(self, base_url=NOTIFICATION_SERVICE_URL, batch_size=NOTIFY_BATCH_SIZE, workers=4):
+        self.url = f"{base_url}/api/v1/notifications/batch"
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _post(self, batch):
+        response = requests.post(self.url, json={'notifications': batch},
+                                 headers=service_headers('disease-alert-service'), timeout=30)
+        response.raise_for_status()
+        return len(batch)
+
+    def send(self, notifications):
+        """Send all notifications, returns number delivered"""
+        batches = [notifications[i:i + self.batch_size] for i in range(0, len(notifications), self.batch_size)]
+        sent = 0
+        for future in [self.executor.submit(self._post, b) for b in batches]:
+            try:
+                sent += future.result()
+            except Exception as e:
+                logger.error(f"Notification batch error: {e}")
+        return sent
+
+
+class AlertMatcher:
+    """Turns new or changed outbreaks into one notification per affected owner - VS"""
+
+    def __init__(self, population, sender):
+        self.population = population
+        self.sender = sender
+        self.lock = threading.Lock()
+        # outbreakId -> (reportDate, set(ownerId)); dropped once the outbreak is too old to alert about - VS
+        self.notified = {}
+        self.stats = {'outbreaksMatched': 0, 'notificationsSent': 0, 'lastRun': None}
+
+    def match(self, outbreak):
+        """Affected owners -> list of their pets"""
+        if not outbreak.get('region'):
+            return {}
+        owners = {}
+        for species in susceptible_species(outbreak):
+            for pet in self.population.pets_in(outbreak['region'], species):
+                owners.setdefault(pet['ownerId'], []).append(pet)
+        return owners
+
+    def _notification(self, outbreak, owner_id, pets):
+        names = ', '.join(p['petName'] for p in pets if p['petName'])
+        return {
+            'userId': owner_id,
+            'type': 'disease_alert',
+            'title': f"Alert: {outbreak['disease'].upper()} - {outbreak['region']}",
+            'message': f"W Twoim regionie ({outbreak['region']}) zgłoszono ognisko choroby {outbreak['disease'].upper()}. "
+                       f"Dotyczy zwierząt: {names or 'Twoje zwierzęta'}.",
+            'data': {
+                'outbreakId': outbreak['id'],
+                'disease': outbreak['disease'],
+                'region': outbreak['region'],
+                'reportDate': outbreak['reportDate'],
+                'petIds': [p['petId'] for p in pets]
+            }
+        }
+
+    def on_outbreaks(self, outbreaks):
+        """Ingestion listener - only owners not yet notified about an outbreak are alerted"""
+        notifications = []
+        oldest = (datetime.utcnow() - timedelta(days=ALERT_MAX_AGE_DAYS)).strftime('%Y-%m-%d')
+        with self.lock:
+            self.notified = {k: v for k, v in self.notified.items() if v[0] >= oldest}
+            for outbreak in outbreaks:
+                # Historical outbreaks (e.g. first ingest after deploy) are not worth an alert
+                if outbreak['reportDate'] < oldest:
+                    continue
+                owners = self.match(outbreak)
+                already = self.notified.setdefault(outbreak['id'], (outbreak['reportDate'], set()))[1]
+                new_owners = [owner_id for owner_id in owners if owner_id not in already]
+                for owner_id in new_owners:
+                    already.add(owner_id)
+                    notifications.append(self._notification(outbreak, owner_id, owners[owner_id]))
+                if new_owners:
+                    self.stats['outbreaksMatched'] += 1
+
+        if notifications:
+            self.stats['notificationsSent'] += self.sender.send(notifications)
+        self.stats['lastRun'] = datetime.utcnow().isoformat()
+        logger.info(f"Outbreak matching: {len(outbreaks)} outbreaks, {len(notifications)} notifications")
+        return notifications
+
+
+class PopulationRefresher:
+    """Background thread refreshing the population index snapshot - VS"""
+
+    def __init__(self, population, interval=POPULATION_REFRESH_INTERVAL):
+        self.population = population
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _loop(self):
+        # The initial snapshot is loaded synchronously at startup
+        while not self._stop.wait(self.interval):
+            try:
+                self.population.refresh()
+            except Exception as e:
+                logger.error(f"Population refresh error: {e}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='population-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
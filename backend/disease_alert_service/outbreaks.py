@@ -0,0 +1,404 @@
+"""
+PetCareApp - Outbreak Store & Feed Ingestion
+Local, geo-indexed store of animal disease outbreaks fed by WOAH/OIE, ADNS/ADIS, GIW and EFSA
+@author VS
+"""
+
+import os
+import json
+import math
+import bisect
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+FEED_DIR = os.getenv('OUTBREAK_FEED_DIR', '')
+STORE_PATH = os.getenv('OUTBREAK_STORE_PATH', '')
+INGEST_INTERVAL = int(os.getenv('OUTBREAK_INGEST_INTERVAL', 900))  # 15 min
+
+EARTH_RADIUS_KM = 6371.0
+
+
+#  Geohash
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Indexed precisions: 2 (~630 km) ... 5 (~4.9 km)
+INDEX_PRECISIONS = (2, 3, 4, 5)
+MAX_QUERY_CELLS = 64
+
+
+def geohash_encode(lat, lon, precision=5):
+    """Encode coordinates as a geohash string"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bit, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch |= 1 << (4 - bit)
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        if bit < 4:
+            bit += 1
+        else:
+            chars.append(_BASE32[ch])
+            bit, ch = 0, 0
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision):
+    """(lat_degrees, lon_degrees) of a single geohash cell"""
+    bits = precision * 5
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def geohash_cells_covering(min_lat, min_lon, max_lat, max_lon, precision):
+    """All geohash cells of given precision intersecting the bounding box"""
+    lat_step, lon_step = geohash_cell_size(precision)
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0 - 1e-9)
+    min_lon, max_lon = max(min_lon, -180.0), min(max_lon, 180.0 - 1e-9)
+
+    cells = set()
+    lat = math.floor((min_lat + 90.0) / lat_step) * lat_step - 90.0
+    while lat <= max_lat:
+        lon = math.floor((min_lon + 180.0) / lon_step) * lon_step - 180.0
+        while lon <= max_lon:
+            cells.add(geohash_encode(lat + lat_step / 2, lon + lon_step / 2, precision))
+            lon += lon_step
+        lat += lat_step
+    return cells
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bounding_box(lat, lon, radius_km):
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    dlon = min(math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)), 180.0)
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+#  Store
+
+class OutbreakStore:
+    """
+    In-memory outbreak store with a geohash index (one map per precision)
+    and a per-disease index sorted by report date - VS
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.RLock()
+        self.outbreaks = {}
+        self.geo_index = {p: {} for p in INDEX_PRECISIONS}
+        self.disease_index = {}  # disease -> sorted [(reportDate, id)]
+        self.version = 0
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        return len(self.outbreaks)
+
+    def _index(self, outbreak):
+        oid = outbreak['id']
+        if outbreak.get('lat') is not None and outbreak.get('lon') is not None:
+            full = geohash_encode(outbreak['lat'], outbreak['lon'], max(INDEX_PRECISIONS))
+            for p in INDEX_PRECISIONS:
+                self.geo_index[p].setdefault(full[:p], set()).add(oid)
+        bisect.insort(self.disease_index.setdefault(outbreak['disease'], []), (outbreak['reportDate'], oid))
+
+    def _unindex(self, outbreak):
+        oid = outbreak['id']
+        if outbreak.get('lat') is not None and outbreak.get('lon') is not None:
+            full = geohash_encode(outbreak['lat'], outbreak['lon'], max(INDEX_PRECISIONS))
+            for p in INDEX_PRECISIONS:
+                bucket = self.geo_index[p].get(full[:p])
+                if bucket:
+                    bucket.discard(oid)
+                    if not bucket:
+                        del self.geo_index[p][full[:p]]
+        entries = self.disease_index.get(outbreak['disease'], [])
+        i = bisect.bisect_left(entries, (outbreak['reportDate'], oid))
+        if i < len(entries) and entries[i] == (outbreak['reportDate'], oid):
+            entries.pop(i)
+
+    def upsert_many(self, outbreaks):
+        """Insert or replace outbreaks, returns list of new or changed records"""
+        changed = []
+        with self.lock:
+            for outbreak in outbreaks:
+                existing = self.outbreaks.get(outbreak['id'])
+                if existing == outbreak:
+                    continue
+                if existing:
+                    self._unindex(existing)
+                self.outbreaks[outbreak['id']] = outbreak
+                self._index(outbreak)
+                changed.append(outbreak)
+            if changed:
+                self.version += 1
+        return changed
+
+    def _ids_near(self, lat, lon, radius_km):
+        min_lat, min_lon, max_lat, max_lon = bounding_box(lat, lon, radius_km)
+        # Finest precision that still keeps the number of probed cells small
+        for p in reversed(INDEX_PRECISIONS):
+            lat_step, lon_step = geohash_cell_size(p)
+            estimate = (math.ceil((max_lat - min_lat) / lat_step) + 1) * (math.ceil((max_lon - min_lon) / lon_step) + 1)
+            if estimate <= MAX_QUERY_CELLS or p == INDEX_PRECISIONS[0]:
+                break
+        ids = set()
+        index = self.geo_index[p]
+        for cell in geohash_cells_covering(min_lat, min_lon, max_lat, max_lon, p):
+            ids.update(index.get(cell, ()))
+        return ids
+
+    def _ids_since(self, since, diseases=None):
+        ids = set()
+        for disease in diseases or list(self.disease_index):
+            entries = self.disease_index.get(disease, [])
+            start = bisect.bisect_left(entries, (since, ''))
+            ids.update(oid for _, oid in entries[start:])
+        return ids
+
+    def query(self, lat=None, lon=None, radius_km=50, days=30, diseases=None, country=None, source=None, limit=50):
+        """Outbreaks matching the filters, nearest (or newest) first"""
+        since = (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d')
+        with self.lock:
+            if lat is not None and lon is not None:
+                candidates = self._ids_near(lat, lon, radius_km)
+            else:
+                candidates = self._ids_since(since, diseases)
+
+            results = []
+            for oid in candidates:
+                outbreak = self.outbreaks[oid]
+                if outbreak['reportDate'] < since or (diseases and outbreak['disease'] not in diseases):
+                    continue
+                if country and outbreak.get('country') != country:
+                    continue
+                if source and outbreak.get('source') != source:
+                    continue
+                if lat is not None and lon is not None:
+                    distance = haversine_km(lat, lon, outbreak['lat'], outbreak['lon'])
+                    if distance > radius_km:
+                        continue
+                    outbreak = {**outbreak, 'distanceKm': round(distance, 1)}
+                results.append(outbreak)
+
+        if lat is not None and lon is not None:
+            results.sort(key=lambda o: (o['distanceKm'], o['reportDate']))
+        else:
+            results.sort(key=lambda o: o['reportDate'], reverse=True)
+        return results[:limit]
+
+    def stats(self):
+        with self.lock:
+            by_source, by_disease = {}, {}
+            for outbreak in self.outbreaks.values():
+                by_source[outbreak['source']] = by_source.get(outbreak['source'], 0) + 1
+                by_disease[outbreak['disease']] = by_disease.get(outbreak['disease'], 0) + 1
+            return {'total': len(self.outbreaks), 'bySource': by_source, 'byDisease': by_disease, 'version': self.version}
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            snapshot = list(self.outbreaks.values())
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.upsert_many(json.load(f))
+            logger.info(f"Loaded {len(self.outbreaks)} outbreaks from {self.path}")
+        except (OSError, ValueError) as e:
+            logger.error(f"Outbreak store load error: {e}")
+
+
+#  Feeds
+
+DISEASE_ALIASES = {
+    'asf': 'asf', 'african swine fever': 'asf', 'afrykański pomór świń': 'asf',
+    'hpai': 'hpai', 'avian influenza': 'hpai', 'highly pathogenic avian influenza': 'hpai',
+    'grypa ptaków': 'hpai', 'wysoce zjadliwa grypa ptaków': 'hpai',
+    'rabies': 'rabies', 'wścieklizna': 'rabies'
+}
+
+
+def normalize_disease(value):
+    value = str(value or '').strip().lower()
+    return DISEASE_ALIASES.get(value, value)
+
+
+def _first(raw, *keys, default=None):
+    for key in keys:
+        if raw.get(key) not in (None, ''):
+            return raw[key]
+    return default
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+class FeedSource:
+    """
+    Single outbreak feed - read from `<OUTBREAK_FEED_DIR>/<file_name>` when present
+    (offline stand-in), otherwise from the URL configured in `url_env`
+    """
+
+    def __init__(self, source_id, name, url_env, file_name):
+        self.id = source_id
+        self.name = name
+        self.url = os.getenv(url_env, '')
+        self.file_name = file_name
+
+    def fetch_raw(self):
+        if FEED_DIR:
+            path = os.path.join(FEED_DIR, self.file_name)
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    return json.load(f)
+        if self.url:
+            response = requests.get(self.url, timeout=30, headers={'Accept': 'application/json', 'User-Agent': 'PetCareApp/1.0'})
+            response.raise_for_status()
+            return response.json()
+        return []
+
+    def parse(self, raw):
+        lat = _first(raw, 'lat', 'latitude')
+        lon = _first(raw, 'lon', 'lng', 'longitude')
+        report_date = _parse_date(_first(raw, 'reportDate', 'report_date', 'startDate', 'start_date', 'date'))
+        external_id = _first(raw, 'id', 'outbreakId', 'outbreak_id', 'reference')
+        disease = normalize_disease(_first(raw, 'disease', 'diseaseName', 'disease_name'))
+        if not (external_id and disease and report_date):
+            return None
+        species = _first(raw, 'species', 'animalType', default=[])
+        if isinstance(species, str):
+            species = [species]
+        return {
+            'id': f"{self.id}:{external_id}",
+            'source': self.id,
+            'disease': disease,
+            'species': [str(s).lower() for s in species if s],
+            'country': _first(raw, 'country', 'countryCode', 'country_code', default=''),
+            'region': _first(raw, 'region', 'adminArea', 'admin_area', default=''),
+            'lat': float(lat) if lat is not None else None,
+            'lon': float(lon) if lon is not None else None,
+            'reportDate': report_date,
+            'status': _first(raw, 'status', default='ongoing'),
+            'cases': int(_first(raw, 'cases', default=0) or 0),
+            'url': _first(raw, 'url', 'link', default='')
+        }
+
+    def fetch(self):
+        raw = self.fetch_raw()
+        if isinstance(raw, dict):
+            raw = _first(raw, 'outbreaks', 'results', 'items', default=[])
+        outbreaks = []
+        for item in raw:
+            try:
+                parsed = self.parse(item)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"{self.id}: skipping malformed outbreak: {e}")
+                continue
+            if parsed:
+                outbreaks.append(parsed)
+        return outbreaks
+
+
+FEEDS = [
+    FeedSource('WOAH', 'World Organisation for Animal Health', 'WOAH_FEED_URL', 'woah.json'),
+    FeedSource('ADIS', 'Animal Disease Information System (EU)', 'ADIS_FEED_URL', 'adis.json'),
+    FeedSource('GIW', 'Główny Inspektorat Weterynarii', 'GIW_FEED_URL', 'giw.json'),
+    FeedSource('EFSA', 'European Food Safety Authority', 'EFSA_FEED_URL', 'efsa.json')
+]
+
+
+class IngestionWorker:
+    """Background thread periodically pulling all feeds into the store - VS"""
+
+    def __init__(self, store, feeds, interval=INGEST_INTERVAL):
+        self.store = store
+        self.feeds = feeds
+        self.interval = interval
+        self.last_run = {}
+        self.listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._run_lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """callback(changed_outbreaks) is called after every ingest that changed the store"""
+        self.listeners.append(callback)
+
+    def run_once(self):
+        with self._run_lock:
+            changed = []
+            with ThreadPoolExecutor(max_workers=len(self.feeds)) as executor:
+                futures = {executor.submit(feed.fetch): feed for feed in self.feeds}
+                for future, feed in futures.items():
+                    status = {'at': datetime.utcnow().isoformat(), 'count': 0, 'error': None}
+                    try:
+                        outbreaks = future.result()
+                        status['count'] = len(outbreaks)
+                        changed.extend(self.store.upsert_many(outbreaks))
+                    except Exception as e:
+                        logger.error(f"{feed.id} ingestion error: {e}")
+                        status['error'] = str(e)
+                    self.last_run[feed.id] = status
+
+            if changed:
+                try:
+                    self.store.save()
+                except OSError as e:
+                    logger.error(f"Outbreak store save error: {e}")
+                for callback in self.listeners:
+                    try:
+                        callback(changed)
+                    except Exception as e:
+                        logger.error(f"Outbreak listener error: {e}")
+            logger.info(f"Outbreak ingestion finished: {len(changed)} new/changed, {len(self.store)} total")
+            return changed
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Outbreak ingestion failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='outbreak-ingestion', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
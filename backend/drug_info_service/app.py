@@ -9,14 +9,20 @@ from flask import Flask, request, jsonify
 from datetime import datetime
 import uuid
 import os
+import sys
 import logging
 import boto3
 from botocore.exceptions import ClientError
 
+# Shared modules live one level up (/app/shared in the container) - VS
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.auth import init_auth
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+init_auth(app)
 
 AWS_REGION = os.getenv('AWS_REGION', 'eu-north-1')
 TABLE_NAME = 'PetCareApp-Prescriptions'
@@ -8,22 +8,34 @@ Integrates with:
 @author VS
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 
 import os
+import sys
 import logging
 import hashlib
 import requests
 import json
+import re
+import unicodedata
 from datetime import datetime, timedelta
-from functools import wraps
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+
+# Shared modules live one level up (/app/shared in the container) - VS
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.auth import require_auth
+from shared.http_cache import cached_response
+from shared.rate_limit import RateLimiter, rate_limit, shared_cache
 
 app = Flask(__name__)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Every uncached search fans out to three external registries - VS
+SEARCH_RATE_LIMIT = int(os.getenv('SEARCH_RATE_LIMIT', 30))
+search_limiter = RateLimiter('drug-search', SEARCH_RATE_LIMIT, 60, cache=shared_cache())
+
 # Cache
 CACHE_TTL = 3600
 cache = {}
@@ -170,14 +182,120 @@ class PIWetClient:
         }
 
 
-#  Auth 
-def require_auth(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        if not request.headers.get('Authorization') and os.getenv('APP_ENV') == 'production':
-            return jsonify({'error': 'Unauthorized'}), 401
-        return f(*args, **kwargs)
-    return decorated
+#  Result merging 
+
+# Lower rank wins when two sources describe the same product
+SOURCE_PRIORITY = {'URPL': 0, 'EMA': 1, 'FDA': 2}
+
+
+def _normalize_text(value):
+    """Lowercase, strip diacritics and collapse whitespace"""
+    value = unicodedata.normalize('NFKD', str(value or ''))
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return ' '.join(value.lower().split())
+
+
+def normalize_substance(value):
+    """Canonical form of an active substance list, independent of order and separators"""
+    parts = re.split(r'[,;+/]|\band\b', _normalize_text(value))
+    return ' + '.join(sorted({p.strip() for p in parts if p.strip()}))
+
+
+STRENGTH_PATTERN = re.compile(r'(\d+(?:[.,]\d+)?)\s*(mg|mcg|µg|ug|g|ml|iu|j\.?m\.?|%)(?![a-z])')
+
+
+def _strength(drug):
+    """Strength tokens from the name/substance, e.g. '50 mg', order independent"""
+    text = f"{_normalize_text(drug.get('name'))} {_normalize_text(drug.get('activeSubstance'))}"
+    return ' + '.join(sorted({f"{amount.replace(',', '.')} {unit}" for amount, unit in STRENGTH_PATTERN.findall(text)}))
+
+
+def _product_key(drug):
+    """Name + strength + form - for records without a registration number (FDA)"""
+    name = STRENGTH_PATTERN.sub(' ', _normalize_text(drug.get('name')))
+    name = ' '.join(re.sub(r'[^\w\s]', ' ', name).split())
+    if not name:
+        return None
+    return ('product', name, _strength(drug), _normalize_text(drug.get('form')))
+
+
+def _dedup_key(drug):
+    substance = normalize_substance(drug.get('activeSubstance'))
+    form = _normalize_text(drug.get('form'))
+    registration = _normalize_text(drug.get('registrationNumber'))
+    if not registration:
+        # FDA has no registration numbers - compare on the product itself
+        return _product_key(drug) or ('substance', substance, form)
+    return (substance, form, registration)
+
+
+def score_drug(drug, query):
+    """Relevance of a single drug for the query (higher is better)"""
+    q = _normalize_text(query)
+    name = _normalize_text(drug.get('name'))
+    substance = normalize_substance(drug.get('activeSubstance'))
+    
+    score = 0.0
+    if name == q:
+        score += 100
+    elif name.startswith(q):
+        score += 60
+    elif q in name:
+        score += 40
+    if q in substance.split(' + '):
+        score += 50
+    elif q in substance:
+        score += 25
+    if drug.get('registrationNumber'):
+        score += 5
+    if _normalize_text(drug.get('status')) in ('', 'active'):
+        score += 5
+    score -= SOURCE_PRIORITY.get(drug.get('source'), len(SOURCE_PRIORITY))
+    return score
+
+
+def merge_drug_results(query, drugs, limit):
+    """
+    De-duplicate drugs from all sources by substance + form + registration number,
+    rank them by relevance and cut the list to `limit`.
+    A record without a registration number is matched on name + strength + form,
+    also against registered records (the product key is an alias of theirs).
+    Returns (drugs, unique_count).
+    """
+    merged = {}
+    aliases = {}  # product key -> dedup key of a merged record
+    for drug in drugs:
+        key = _dedup_key(drug)
+        product = _product_key(drug)
+        if key not in merged and product in aliases:
+            key = aliases[product]
+            if drug.get('registrationNumber') and merged[key].get('registrationNumber'):
+                # Two registrations of the same product are separate drugs
+                key = _dedup_key(drug)
+        if product and product not in aliases:
+            aliases[product] = key
+        score = score_drug(drug, query)
+        existing = merged.get(key)
+        if existing is None:
+            merged[key] = {**drug, 'sources': [drug.get('source')], 'score': score}
+            continue
+        
+        if drug.get('source') not in existing['sources']:
+            existing['sources'].append(drug.get('source'))
+        if score > existing['score']:
+            # Better match becomes the primary record, keep fields it lacks
+            sources = existing['sources']
+            merged[key] = {**existing, **{k: v for k, v in drug.items() if v}, 'sources': sources, 'score': score}
+        else:
+            for field, value in drug.items():
+                if value and not existing.get(field):
+                    existing[field] = value
+    
+    ranked = sorted(
+        merged.values(),
+        key=lambda d: (-d['score'], SOURCE_PRIORITY.get(d.get('source'), 99), _normalize_text(d.get('name')))
+    )
+    return ranked[:limit], len(ranked)
 
 
 #  Endpoints 
@@ -192,17 +310,53 @@ def health():
     })
 
 
+SEARCH_CLIENTS = {'URPL': URPLClient, 'FDA': FDAClient, 'EMA': EMAClient}
+SEARCH_TIMEOUT = 20
+
+
+def _parse_search_args():
+    query = request.args.get('q', '').strip()
+    source = request.args.get('source', 'all').upper()
+    limit = min(int(request.args.get('limit', 20)), 100)
+    return query, source, limit
+
+
+def _submit_searches(executor, query, source, limit):
+    """Start a search in every requested source, returns {future: source_id}"""
+    return {
+        executor.submit(client.search, query, limit): src
+        for src, client in SEARCH_CLIENTS.items()
+        if source in ['ALL', src]
+    }
+
+
+def _source_summary(src, data):
+    return {
+        'id': src,
+        'name': data.get('source_name', src),
+        'url': data.get('url', ''),
+        'count': len(data.get('drugs', [])),
+        'error': data.get('error')
+    }
+
+
+def _finalize_results(results, query, limit):
+    fetched = len(results['drugs'])
+    results['drugs'], results['total'] = merge_drug_results(query, results['drugs'], limit)
+    results['duplicatesRemoved'] = fetched - results['total']
+    return results
+
+
 @app.route('/drugs/search', methods=['GET'])
 @require_auth
+@rate_limit(search_limiter)
 def search_drugs():
     """
     Search across external drug databases
     
     GET /drugs/search?q=amoxicillin&source=all&limit=20
     """
-    query = request.args.get('q', '').strip()
-    source = request.args.get('source', 'all').upper()
-    limit = min(int(request.args.get('limit', 20)), 100)
+    query, source, limit = _parse_search_args()
     
     if len(query) < 2:
         return jsonify({'error': 'Query min 2 characters'}), 400
@@ -216,37 +370,97 @@ def search_drugs():
     results = {'query': query, 'sources': [], 'drugs': [], 'total': 0}
     
     # Search in parallel
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        futures = {}
+    with ThreadPoolExecutor(max_workers=len(SEARCH_CLIENTS)) as executor:
+        futures = _submit_searches(executor, query, source, limit)
         
-        if source in ['ALL', 'URPL']:
-            futures['URPL'] = executor.submit(URPLClient.search, query, limit)
-        if source in ['ALL', 'FDA']:
-            futures['FDA'] = executor.submit(FDAClient.search, query, limit)
-        if source in ['ALL', 'EMA']:
-            futures['EMA'] = executor.submit(EMAClient.search, query, limit)
-        
-        for src, future in futures.items():
+        for future, src in futures.items():
             try:
-                data = future.result(timeout=20)
-                results['sources'].append({
-                    'id': src,
-                    'name': data.get('source_name', src),
-                    'url': data.get('url', ''),
-                    'count': len(data.get('drugs', [])),
-                    'error': data.get('error')
-                })
-                for drug in data.get('drugs', []):
-                    results['drugs'].append(drug)
-                results['total'] += len(data.get('drugs', []))
+                data = future.result(timeout=SEARCH_TIMEOUT)
+                results['sources'].append(_source_summary(src, data))
+                results['drugs'].extend(data.get('drugs', []))
             except Exception as e:
                 results['sources'].append({'id': src, 'error': str(e), 'count': 0})
     
+    _finalize_results(results, query, limit)
     set_cached(cache_key, results)
     return jsonify(results)
 
 
+def _format_event(event, data, fmt):
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    if fmt == 'sse':
+        return f"event: {event}\ndata: {payload}\n\n"
+    return json.dumps({'event': event, 'data': data}, ensure_ascii=False, default=str) + "\n"
+
+
+@app.route('/drugs/search/stream', methods=['GET'])
+@require_auth
+@rate_limit(search_limiter)
+def search_drugs_stream():
+    """
+    Stream search results - every source is emitted as soon as it answers,
+    followed by a final `summary` event with merged and ranked results
+    
+    GET /drugs/search/stream?q=amoxicillin&source=all&limit=20&format=sse|ndjson
+    """
+    query, source, limit = _parse_search_args()
+    
+    if len(query) < 2:
+        return jsonify({'error': 'Query min 2 characters'}), 400
+    
+    fmt = request.args.get('format', '').lower()
+    if fmt not in ('sse', 'ndjson'):
+        fmt = 'sse' if 'text/event-stream' in request.headers.get('Accept', '') else 'ndjson'
+    
+    cache_key = get_cache_key('search', {'q': query, 'source': source, 'limit': limit})
+    cached = get_cached(cache_key)
+    
+    def generate():
+        if cached:
+            for src in cached['sources']:
+                drugs = [d for d in cached['drugs'] if src['id'] in d.get('sources', [])]
+                yield _format_event('source', {'source': src, 'drugs': drugs}, fmt)
+            yield _format_event('summary', {**cached, 'cached': True}, fmt)
+            return
+        
+        results = {'query': query, 'sources': [], 'drugs': [], 'total': 0}
+        executor = ThreadPoolExecutor(max_workers=len(SEARCH_CLIENTS))
+        futures = _submit_searches(executor, query, source, limit)
+        try:
+            for future in as_completed(futures, timeout=SEARCH_TIMEOUT):
+                src = futures[future]
+                try:
+                    data = future.result()
+                    summary = _source_summary(src, data)
+                    results['drugs'].extend(data.get('drugs', []))
+                except Exception as e:
+                    summary = {'id': src, 'error': str(e), 'count': 0}
+                    data = {}
+                results['sources'].append(summary)
+                yield _format_event('source', {'source': summary, 'drugs': data.get('drugs', [])}, fmt)
+        except FuturesTimeoutError:
+            for future, src in futures.items():
+                if not future.done():
+                    summary = {'id': src, 'error': 'Timeout', 'count': 0}
+                    results['sources'].append(summary)
+                    yield _format_event('source', {'source': summary, 'drugs': []}, fmt)
+        finally:
+            # Do not block the worker on a slow registry after the client is gone
+            executor.shutdown(wait=False)
+        
+        _finalize_results(results, query, limit)
+        set_cached(cache_key, results)
+        yield _format_event('summary', results, fmt)
+    
+    mimetype = 'text/event-stream' if fmt == 'sse' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
 @app.route('/drugs/sources', methods=['GET'])
+@cached_response(max_age=86400)
 def get_sources():
     """Get available data sources"""
     return jsonify([
@@ -282,6 +496,7 @@ def get_sources():
 
 
 @app.route('/drugs/categories', methods=['GET'])
+@cached_response(max_age=86400)
 def get_categories():
     """ATC-vet classification"""
     return jsonify([
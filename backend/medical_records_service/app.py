@@ -9,21 +9,34 @@ from flask import Flask, request, jsonify
 from datetime import datetime
 import uuid
 import os
+import sys
 import logging
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
+# Shared modules live one level up (/app/shared in the container) - VS
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.auth import init_auth
+from shared.database import scan_all
+
+from attachments import AttachmentUploader, AttachmentTooLarge, EmptyAttachment, ATTACHMENT_CONTENT_TYPES
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+init_auth(app)
 
 
 AWS_REGION = os.getenv('AWS_REGION', 'eu-north-1')
 TABLE_NAME = 'PetCareApp-MedicalRecords'
+S3_BUCKET = os.getenv('S3_BUCKET', 'petcareapp-files')
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL') or None
 
 dynamodb = None
 table = None
+s3_client = None
 try:
     dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION)
     table = dynamodb.Table(TABLE_NAME)
@@ -31,6 +44,19 @@ try:
 except Exception as e:
     logger.warning(f"DynamoDB not available: {e}")
 
+try:
+    s3_client = boto3.client(
+        's3',
+        region_name=AWS_REGION,
+        endpoint_url=S3_ENDPOINT_URL,
+        config=Config(signature_version='s3v4')
+    )
+    logger.info(f"S3 client initialized for bucket: {S3_BUCKET}")
+except Exception as e:
+    logger.warning(f"S3 not available: {e}")
+
+uploader = AttachmentUploader(s3_client, S3_BUCKET) if s3_client else None
+
 records_db = {}
 
 def save_record(record):
@@ -57,9 +83,44 @@ def get_records_by_pet(pet_id):
             logger.error(f"DynamoDB error: {e}")
     return [r for r in records_db.values() if r.get('petId') == pet_id]
 
+def find_record(record_id):
+    if table:
+        try:
+            response = table.get_item(Key={'id': record_id})
+            if response.get('Item'):
+                return response['Item']
+        except ClientError as e:
+            logger.error(f"DynamoDB error: {e}")
+    return records_db.get(record_id)
+
+def add_attachment(record, attachment):
+    """Append attachment metadata without overwriting concurrent uploads - VS"""
+    now = datetime.utcnow().isoformat()
+    if table:
+        try:
+            table.update_item(
+                Key={'id': record['id']},
+                UpdateExpression='SET attachments = list_append(if_not_exists(attachments, :empty), :a), updatedAt = :u',
+                ExpressionAttributeValues={':a': [attachment], ':empty': [], ':u': now}
+            )
+            return
+        except ClientError as e:
+            logger.error(f"DynamoDB error: {e}")
+    record.setdefault('attachments', []).append(attachment)
+    record['updatedAt'] = now
+    records_db[record['id']] = record
+
+def find_attachment(record, attachment_id):
+    return next((a for a in record.get('attachments', []) if a.get('id') == attachment_id), None)
+
 @app.route('/api/v1/health', methods=['GET'])
 def health_check():
-    return jsonify({'service': 'medical-records-service', 'status': 'healthy', 'dynamodb': table is not None})
+    return jsonify({
+        'service': 'medical-records-service',
+        'status': 'healthy',
+        'dynamodb': table is not None,
+        's3': s3_client is not None
+    })
 
 @app.route('/api/v1/medical-records', methods=['GET'])
 def get_medical_records():
@@ -71,8 +132,7 @@ def get_medical_records():
         records = get_records_by_pet(pet_id)
     elif table:
         try:
-            response = table.scan()
-            records = response.get('Items', [])
+            records = scan_all(table)
         except:
             records = list(records_db.values())
     else:
@@ -166,6 +226,64 @@ def delete_medical_record(record_id):
     
     return jsonify({'message': 'Record deleted'})
 
+@app.route('/api/v1/medical-records/<record_id>/attachments', methods=['POST'])
+def upload_attachment(record_id):
+    """
+    Upload an attachment as the raw request body - VS
+
+    The body is streamed to S3 multipart upload part by part, so large
+    DICOM files are never held in memory. File name comes from the
+    `fileName` query parameter or the X-File-Name header.
+    """
+    if not uploader:
+        return jsonify({'error': 'Storage not configured'}), 503
+    
+    record = find_record(record_id)
+    if not record:
+        return jsonify({'error': 'Record not found'}), 404
+    
+    content_type = (request.mimetype or 'application/octet-stream').lower()
+    if content_type not in ATTACHMENT_CONTENT_TYPES:
+        return jsonify({'error': f'Unsupported content type: {content_type}'}), 415
+    if request.content_length is not None:
+        if request.content_length == 0:
+            return jsonify({'error': 'Empty body'}), 400
+        if request.content_length > uploader.max_bytes:
+            return jsonify({'error': f'Attachment exceeds {uploader.max_bytes} bytes'}), 413
+    
+    file_name = request.args.get('fileName') or request.headers.get('X-File-Name', '')
+    try:
+        attachment = uploader.upload(request.stream, record_id, file_name, content_type)
+    except AttachmentTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except EmptyAttachment as e:
+        return jsonify({'error': str(e)}), 400
+    except ClientError as e:
+        logger.error(f"S3 upload error: {e}")
+        return jsonify({'error': 'Failed to upload'}), 502
+    
+    expected = request.headers.get('X-Checksum-Sha256')
+    if expected and expected.lower() != attachment['sha256']:
+        uploader.delete(attachment)
+        return jsonify({'error': 'Checksum mismatch', 'sha256': attachment['sha256']}), 422
+    
+    add_attachment(record, attachment)
+    logger.info(f"Attachment {attachment['id']} added to record {record_id}")
+    return jsonify(attachment), 201
+
+@app.route('/api/v1/medical-records/<record_id>/attachments/<attachment_id>', methods=['GET'])
+def get_attachment(record_id, attachment_id):
+    """Attachment metadata with a short-lived download URL - VS"""
+    if not uploader:
+        return jsonify({'error': 'Storage not configured'}), 503
+    
+    record = find_record(record_id)
+    attachment = find_attachment(record, attachment_id) if record else None
+    if not attachment:
+        return jsonify({'error': 'Attachment not found'}), 404
+    
+    return jsonify({**attachment, 'downloadUrl': uploader.download_url(attachment)})
+
 @app.route('/api/v1/medical-records/pet/<pet_id>/history', methods=['GET'])
 def get_pet_medical_history(pet_id):
     """Get complete medical history for a pet - VS"""
@@ -0,0 +1,144 @@
+"""
+PetCareApp - Medical Record Attachments
+Strumieniowy upload załączników (RTG, USG, DICOM, PDF) do S3 multipart
+@author VS
+"""
+
+import os
+import re
+import uuid
+import base64
+import hashlib
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# S3 wymaga min. 5 MiB na część (poza ostatnią) - VS
+ATTACHMENT_PART_SIZE = max(int(os.getenv('ATTACHMENT_PART_SIZE', 8 * 1024 * 1024)), 5 * 1024 * 1024)
+ATTACHMENT_MAX_BYTES = int(os.getenv('ATTACHMENT_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+ATTACHMENT_CONTENT_TYPES = (
+    'application/dicom', 'application/pdf', 'application/octet-stream',
+    'image/jpeg', 'image/png', 'image/tiff'
+)
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+class EmptyAttachment(Exception):
+    pass
+
+
+def safe_file_name(file_name):
+    return re.sub(r'[^A-Za-z0-9._-]', '_', os.path.basename(file_name or '')) or 'attachment'
+
+
+def attachment_key(record_id, attachment_id, file_name):
+    return f"medical-records/{record_id}/attachments/{attachment_id}/{safe_file_name(file_name)}"
+
+
+def read_part(stream, size):
+    """Read up to `size` bytes - WSGI streams may return less than asked for"""
+    chunks, remaining = [], size
+    while remaining > 0:
+        chunk = stream.read(min(remaining, 1024 * 1024))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+class AttachmentUploader:
+    """
+    Przesyła ciało żądania do S3 część po części - VS
+
+    W pamięci jest tylko jedna część (ATTACHMENT_PART_SIZE), SHA-256 całego
+    pliku liczony jest w locie, a każda część wysyłana z Content-MD5,
+    więc S3 odrzuci uszkodzony fragment. Przy błędzie upload jest przerywany.
+    """
+
+    def __init__(self, s3_client, bucket, part_size=ATTACHMENT_PART_SIZE, max_bytes=ATTACHMENT_MAX_BYTES):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.part_size = part_size
+        self.max_bytes = max_bytes
+
+    def upload(self, stream, record_id, file_name, content_type):
+        """Stream an attachment to S3, returns its metadata"""
+        attachment_id = str(uuid.uuid4())
+        key = attachment_key(record_id, attachment_id, file_name)
+        upload = self.s3_client.create_multipart_upload(
+            Bucket=self.bucket,
+            Key=key,
+            ContentType=content_type,
+            Metadata={'record-id': record_id}
+        )
+        upload_id = upload['UploadId']
+
+        sha256 = hashlib.sha256()
+        parts, size = [], 0
+        try:
+            while True:
+                data = read_part(stream, self.part_size)
+                if not data:
+                    if parts:
+                        break
+                    # Chunked body without Content-Length can still be empty - VS
+                    raise EmptyAttachment('Empty body')
+                size += len(data)
+                if size > self.max_bytes:
+                    raise AttachmentTooLarge(f"Attachment exceeds {self.max_bytes} bytes")
+                sha256.update(data)
+
+                part_number = len(parts) + 1
+                response = self.s3_client.upload_part(
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=data,
+                    ContentMD5=base64.b64encode(hashlib.md5(data).digest()).decode()
+                )
+                parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+                if len(data) < self.part_size:
+                    break
+
+            result = self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except Exception:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+
+        logger.info(f"Attachment uploaded: {key} ({size} bytes, {len(parts)} parts)")
+        return {
+            'id': attachment_id,
+            'fileName': safe_file_name(file_name),
+            'contentType': content_type,
+            'size': size,
+            'sha256': sha256.hexdigest(),
+            'parts': len(parts),
+            's3Key': key,
+            'etag': result.get('ETag', '').strip('"'),
+            'uploadedAt': datetime.utcnow().isoformat()
+        }
+
+    def download_url(self, attachment, expires=900):
+        return self.s3_client.generate_presigned_url(
+            'get_object',
+            Params={
+                'Bucket': self.bucket,
+                'Key': attachment['s3Key'],
+                'ResponseContentDisposition': f"attachment; filename=\"{attachment['fileName']}\""
+            },
+            ExpiresIn=expires
+        )
+
+    def delete(self, attachment):
+        self.s3_client.delete_object(Bucket=self.bucket, Key=attachment['s3Key'])
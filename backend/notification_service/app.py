@@ -4,19 +4,27 @@ Serwis powiadomień z AWS SES i DynamoDB
 @author VS
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 
 from datetime import datetime
 import uuid
 import os
+import sys
+import atexit
 import logging
 import boto3
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
+
+# Shared modules live one level up (/app/shared in the container) - VS
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.auth import init_auth
+from shared.email_outbox import DynamoOutboxStore, EmailOutbox, MemoryOutboxStore
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+init_auth(app)
 
 
 AWS_REGION = os.getenv('AWS_REGION', 'eu-north-1')
@@ -48,7 +56,7 @@ def send_email_ses(to_email, subject, html_body, text_body=None):
     """Send email via AWS SES - VS"""
     if not ses_client:
         logger.warning("SES not configured")
-        return False
+        return {'success': False, 'error': 'SES not configured'}
     
     try:
         body = {'Html': {'Charset': 'UTF-8', 'Data': html_body}}
@@ -64,10 +72,65 @@ def send_email_ses(to_email, subject, html_body, text_body=None):
             }
         )
         logger.info(f"Email sent to {to_email}, MessageId: {response['MessageId']}")
-        return True
+        return {'success': True, 'message_id': response['MessageId']}
     except ClientError as e:
         logger.error(f"SES error: {e.response['Error']['Message']}")
-        return False
+        return {'success': False, 'error': e.response['Error']['Message']}
+
+def deliver_email(message):
+    """Outbox sender - VS"""
+    return send_email_ses(message['to_email'], message['subject'], message.get('body_html') or message['body_text'],
+                          message['body_text'])
+
+def outbox_store():
+    """Outbox table when it is reachable, otherwise the in-process queue (dev) - VS"""
+    if dynamodb:
+        store = DynamoOutboxStore(dynamodb)
+        try:
+            store.table.load()
+            return store
+        except (ClientError, BotoCoreError) as e:
+            logger.warning(f"Email outbox table not available, using in-memory queue: {e}")
+    return MemoryOutboxStore()
+
+# Emails are queued in the request and sent by the outbox workers - VS
+outbox = EmailOutbox(outbox_store(), deliver_email)
+outbox.start()
+atexit.register(outbox.stop)
+
+def outbox_view(item):
+    """Per-message delivery status (without the body) - VS"""
+    view = {
+        'id': item['id'],
+        'status': item['status'],
+        'attempts': int(item.get('attempts', 0)),
+        'to': item['message']['to_email'],
+        'subject': item['message']['subject'],
+        'createdAt': item.get('createdAt')
+    }
+    for field in ('lastAttemptAt', 'sentAt', 'deadAt', 'lastError', 'providerMessageId'):
+        if item.get(field):
+            view[field] = item[field]
+    if item['status'] == 'queued' and item.get('nextAttemptAt'):
+        view['nextAttemptAt'] = datetime.utcfromtimestamp(int(item['nextAttemptAt']) / 1000).isoformat()
+    return view
+
+def outbox_admin_error():
+    """Queued emails expose recipients - admin/IT only - VS"""
+    user = g.get('user')
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if user.get('role') not in ('admin', 'it'):
+        return jsonify({'error': 'Forbidden'}), 403
+    return None
+
+def queue_email(to_email, subject, html, text, dedupe_key=None):
+    """Outbox item or None when the queue is not writable - VS"""
+    try:
+        return outbox.enqueue(to_email, subject, text, html, dedupe_key=dedupe_key)
+    except Exception as e:
+        logger.error(f"Email outbox enqueue error: {e}")
+        return None
 
 def create_appointment_reminder_html(data):
     """Create appointment reminder email - VS"""
@@ -141,7 +204,8 @@ def health_check():
         'service': 'notification-service',
         'status': 'healthy',
         'ses': ses_client is not None,
-        'dynamodb': table is not None
+        'dynamodb': table is not None,
+        'outbox': outbox.status()
     })
 
 @app.route('/api/v1/notifications', methods=['GET'])
@@ -171,6 +235,39 @@ def create_notification():
     save_notification(notification)
     return jsonify(notification), 201
 
+@app.route('/api/v1/notifications/batch', methods=['POST'])
+def create_notifications_batch():
+    """Create many in-app notifications at once (e.g. disease alerts) - VS"""
+    data = request.get_json() or {}
+    now = datetime.utcnow().isoformat()
+    
+    notifications = [{
+        'id': str(uuid.uuid4()),
+        'userId': item.get('userId'),
+        'type': item.get('type', 'system'),
+        'title': item.get('title', ''),
+        'message': item.get('message', ''),
+        'data': item.get('data', {}),
+        'isRead': False,
+        'createdAt': now
+    } for item in data.get('notifications', []) if item.get('userId')]
+    
+    saved = False
+    if table:
+        try:
+            # batch_writer groups puts into BatchWriteItem calls of 25 and retries unprocessed items
+            with table.batch_writer() as batch:
+                for notification in notifications:
+                    batch.put_item(Item=notification)
+            saved = True
+        except ClientError as e:
+            logger.error(f"DynamoDB error: {e}")
+    if not saved:
+        for notification in notifications:
+            notifications_db[notification['id']] = notification
+    
+    return jsonify({'created': len(notifications)}), 201
+
 @app.route('/api/v1/notifications/unread-count', methods=['GET'])
 def get_unread_count():
     user_id = request.args.get('userId')
@@ -239,7 +336,9 @@ def send_email():
         html = f"<p>{data.get('message', '')}</p>"
         text = data.get('message', '')
     
-    success = send_email_ses(to_email, subject, html, text)
+    queued = queue_email(to_email, subject, html, text, dedupe_key=data.get('dedupeKey'))
+    if not queued:
+        return jsonify({'success': False, 'error': 'Email queue unavailable'}), 503
     # Save notification record
     if data.get('userId'):
         notification = {
@@ -248,14 +347,14 @@ def send_email():
             'type': notif_type or 'email',
             'title': subject,
             'message': text[:200],
-            'emailSent': success,
+            'emailOutboxId': queued['id'],
             'emailTo': to_email,
             'isRead': False,
             'createdAt': datetime.utcnow().isoformat()
         }
         save_notification(notification)
     
-    return jsonify({'success': success})
+    return jsonify({'success': True, 'emailId': queued['id'], 'status': queued['status']}), 202
 
 @app.route('/api/v1/notifications/send-appointment-reminder', methods=['POST'])
 def send_appointment_reminder():
@@ -267,9 +366,52 @@ def send_appointment_reminder():
     
     html, text = create_appointment_reminder_html(data)
     subject = f"Przypomnienie o wizycie - {data.get('petName', 'PetCareApp')}"
-    success = send_email_ses(data['email'], subject, html, text)
+    # One reminder per appointment even if the caller retries - VS
+    dedupe_key = f"appointment-reminder:{data['appointmentId']}" if data.get('appointmentId') else None
+    queued = queue_email(data['email'], subject, html, text, dedupe_key=dedupe_key)
+    if not queued:
+        return jsonify({'success': False, 'error': 'Email queue unavailable'}), 503
     
-    return jsonify({'success': success})
+    return jsonify({'success': True, 'emailId': queued['id'], 'status': queued['status']}), 202
+
+@app.route('/api/v1/notifications/emails', methods=['GET'])
+def list_emails():
+    """Pending (queued/sending) or dead-lettered emails - VS"""
+    error = outbox_admin_error()
+    if error:
+        return error
+    status = request.args.get('status', 'dead')
+    if status not in ('queued', 'sending', 'dead'):
+        return jsonify({'error': 'status must be queued, sending or dead'}), 400
+    limit = max(1, min(request.args.get('limit', 100, type=int), 500))
+    try:
+        items = outbox.list(status, limit)
+    except Exception as e:
+        logger.error(f"Email outbox list error: {e}")
+        return jsonify({'error': 'Email queue unavailable'}), 503
+    return jsonify({'emails': [outbox_view(item) for item in items], 'outbox': outbox.status()})
+
+@app.route('/api/v1/notifications/emails/<email_id>', methods=['GET'])
+def get_email_status(email_id):
+    """Delivery status of one queued email - VS"""
+    error = outbox_admin_error()
+    if error:
+        return error
+    item = outbox.get(email_id)
+    if not item:
+        return jsonify({'error': 'Email not found'}), 404
+    return jsonify(outbox_view(item))
+
+@app.route('/api/v1/notifications/emails/<email_id>/requeue', methods=['POST'])
+def requeue_email(email_id):
+    """Send a dead-lettered email again - VS"""
+    error = outbox_admin_error()
+    if error:
+        return error
+    item = outbox.requeue(email_id)
+    if not item:
+        return jsonify({'error': 'Email not found in dead letter queue'}), 404
+    return jsonify(outbox_view(item)), 202
 
 @app.route('/api/v1/notifications/settings', methods=['GET', 'PUT'])
 def notification_settings():
@@ -9,15 +9,24 @@ from flask import Flask, request, jsonify
 from datetime import datetime
 import uuid
 import os
+import sys
 import logging
 import boto3
 from botocore.exceptions import ClientError
 import stripe
 
+# Shared modules live one level up (/app/shared in the container) - VS
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.auth import init_auth
+from shared.database import scan_all
+from shared.http_cache import cached_response
+from shared.rollups import RollupStore, payment_contribution
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+init_auth(app, public_paths=('/api/v1/payments/webhook',))
 
 
 AWS_REGION = os.getenv('AWS_REGION', 'eu-north-1')
@@ -42,6 +51,8 @@ try:
 except Exception as e:
     logger.warning(f"DynamoDB not available: {e}")
 
+rollups = RollupStore(dynamodb)
+
 payments_db = {}
 
 def save_payment(payment):
@@ -85,8 +96,7 @@ def get_payments():
         payments = get_payments_by_user(user_id)
     elif table:
         try:
-            response = table.scan()
-            payments = response.get('Items', [])
+            payments = scan_all(table)
         except:
             payments = list(payments_db.values())
     else:
@@ -157,6 +167,7 @@ def create_payment_intent():
             'createdAt': datetime.utcnow().isoformat()
         }
         save_payment(payment)
+        rollups.record_change(payment_contribution, None, payment)
         
         return jsonify({
             'clientSecret': intent.client_secret,
@@ -186,11 +197,13 @@ def confirm_payment():
     if not payment:
         return jsonify({'error': 'Payment not found'}), 404
     
+    before = dict(payment)
     payment['status'] = 'completed'
     payment['paidAt'] = datetime.utcnow().isoformat()
     payment['updatedAt'] = datetime.utcnow().isoformat()
     
     save_payment(payment)
+    rollups.record_change(payment_contribution, before, payment)
     return jsonify(payment)
 
 @app.route('/api/v1/payments/webhook', methods=['POST'])
@@ -224,9 +237,11 @@ def stripe_webhook():
                 items = response.get('Items', [])
                 if items:
                     payment = items[0]
+                    before = dict(payment)
                     payment['status'] = 'completed'
                     payment['paidAt'] = datetime.utcnow().isoformat()
                     save_payment(payment)
+                    rollups.record_change(payment_contribution, before, payment)
             except Exception as e:
                 logger.error(f"Error updating payment: {e}")
     
@@ -237,6 +252,7 @@ def stripe_webhook():
     return jsonify({'received': True})
 
 @app.route('/api/v1/payments/services', methods=['GET'])
+@cached_response(max_age=3600)
 def get_services():
     """Get available services with prices - VS"""
     services = [
@@ -9,20 +9,39 @@ from flask import Flask, request, jsonify
 from datetime import datetime
 import uuid
 import os
+import sys
 import logging
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 import base64
+import mimetypes
+import re
+
+from images import PhotoPipeline
+
+# Shared modules live one level up (/app/shared in the container) - VS
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.auth import init_auth
+from shared.database import scan_all
+from shared.http_cache import cached_response
+from shared.rollups import RollupStore, pet_contribution
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+init_auth(app)
 
 
 AWS_REGION = os.getenv('AWS_REGION', 'eu-north-1')
 TABLE_NAME = 'PetCareApp-Pets'
 S3_BUCKET = os.getenv('S3_BUCKET', 'petcareapp-files')
+# S3-compatible endpoint (e.g. MinIO) for local development and tests - VS
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL') or None
+PHOTO_MAX_BYTES = int(os.getenv('PHOTO_MAX_BYTES', 10 * 1024 * 1024))
+PRESIGNED_URL_EXPIRES = int(os.getenv('PRESIGNED_URL_EXPIRES', 900))
+PHOTO_CONTENT_TYPES = ('image/jpeg', 'image/png', 'image/webp')
 
 # AWS clients - VS
 dynamodb = None
@@ -37,11 +56,18 @@ except Exception as e:
     logger.warning(f"DynamoDB not available: {e}")
 
 try:
-    s3_client = boto3.client('s3', region_name=AWS_REGION)
+    s3_client = boto3.client(
+        's3',
+        region_name=AWS_REGION,
+        endpoint_url=S3_ENDPOINT_URL,
+        config=Config(signature_version='s3v4')
+    )
     logger.info(f"S3 client initialized for bucket: {S3_BUCKET}")
 except Exception as e:
     logger.warning(f"S3 not available: {e}")
 
+rollups = RollupStore(dynamodb)
+
 pets_db = {}
 
 def save_pet(pet):
@@ -67,15 +93,32 @@ def get_pets_by_owner(owner_id):
             logger.error(f"DynamoDB error: {e}")
     return [p for p in pets_db.values() if p.get('ownerId') == owner_id]
 
-def upload_to_s3(file_data, file_name, content_type='image/jpeg'):
+def find_pet(pet_id):
+    if table:
+        try:
+            response = table.get_item(Key={'id': pet_id})
+            return response.get('Item')
+        except ClientError as e:
+            logger.error(f"DynamoDB error: {e}")
+    return pets_db.get(pet_id)
+
+def build_photo_key(file_name):
+    """S3 key for a new pet photo: pets/YYYY/MM/<uuid>/<file> - VS"""
+    safe_name = re.sub(r'[^A-Za-z0-9._-]', '_', os.path.basename(file_name or '')) or 'photo.jpg'
+    return f"pets/{datetime.utcnow().strftime('%Y/%m')}/{uuid.uuid4()}/{safe_name}"
+
+def build_public_url(key):
+    if S3_ENDPOINT_URL:
+        return f"{S3_ENDPOINT_URL.rstrip('/')}/{S3_BUCKET}/{key}"
+    return f"https://{S3_BUCKET}.s3.{AWS_REGION}.amazonaws.com/{key}"
+
+def upload_to_s3(file_data, key, content_type='image/jpeg'):
     """Upload file to S3 - VS"""
     if not s3_client:
         logger.warning("S3 not configured")
         return None
     
     try:
-        key = f"pets/{datetime.utcnow().strftime('%Y/%m')}/{uuid.uuid4()}/{file_name}"
-        
         s3_client.put_object(
             Bucket=S3_BUCKET,
             Key=key,
@@ -83,20 +126,58 @@ def upload_to_s3(file_data, file_name, content_type='image/jpeg'):
             ContentType=content_type
         )
         
-        url = f"https://{S3_BUCKET}.s3.{AWS_REGION}.amazonaws.com/{key}"
+        url = build_public_url(key)
         logger.info(f"File uploaded to S3: {key}")
         return url
     except ClientError as e:
         logger.error(f"S3 upload error: {e}")
         return None
 
+photo_pipeline = PhotoPipeline(s3_client, S3_BUCKET, build_public_url)
+
+def apply_photo_variants(pet_id, photo_url, variants):
+    """Store generated variants unless the photo was replaced in the meantime - VS"""
+    thumbnail_url = variants.get('thumb', {}).get('webp', '')
+    if table:
+        try:
+            table.update_item(
+                Key={'id': pet_id},
+                UpdateExpression='SET photoVariants = :v, thumbnailUrl = :t',
+                ConditionExpression='photoUrl = :p',
+                ExpressionAttributeValues={':v': variants, ':t': thumbnail_url, ':p': photo_url}
+            )
+            return
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return
+            logger.error(f"DynamoDB error: {e}")
+    pet = pets_db.get(pet_id)
+    if pet and pet.get('photoUrl') == photo_url:
+        pet.update({'photoVariants': variants, 'thumbnailUrl': thumbnail_url})
+
+def set_new_photo(pet, key, data=None):
+    """Point the pet at a new original and render its variants in the background - VS"""
+    photo_url = build_public_url(key)
+    pet['photoUrl'] = photo_url
+    pet['photoVariants'] = {}
+    pet['thumbnailUrl'] = ''
+    pet['updatedAt'] = datetime.utcnow().isoformat()
+    save_pet(pet)
+    photo_pipeline.submit(key, lambda variants: apply_photo_variants(pet['id'], photo_url, variants), data)
+    return photo_url
+
+def with_thumbnail(pet):
+    """List views fall back to the original until variants are ready"""
+    return {**pet, 'thumbnailUrl': pet.get('thumbnailUrl') or pet.get('photoUrl', '')}
+
 @app.route('/api/v1/health', methods=['GET'])
 def health_check():
     return jsonify({
         'service': 'pet-service',
         'status': 'healthy',
         'dynamodb': table is not None,
-        's3': s3_client is not None
+        's3': s3_client is not None,
+        'imagePipeline': photo_pipeline.enabled
     })
 
 @app.route('/api/v1/pets', methods=['GET'])
@@ -109,8 +190,7 @@ def get_pets():
         pets = get_pets_by_owner(owner_id)
     elif table:
         try:
-            response = table.scan()
-            pets = response.get('Items', [])
+            pets = scan_all(table)
         except ClientError as e:
             logger.error(f"DynamoDB error: {e}")
             pets = list(pets_db.values())
@@ -120,7 +200,7 @@ def get_pets():
     if species:
         pets = [p for p in pets if p.get('species') == species]
     
-    return jsonify(pets)
+    return jsonify([with_thumbnail(p) for p in pets])
 
 @app.route('/api/v1/pets/<pet_id>', methods=['GET'])
 def get_pet(pet_id):
@@ -166,6 +246,7 @@ def create_pet():
     }
     
     save_pet(pet)
+    rollups.record_change(pet_contribution, None, pet)
     logger.info(f"Pet created: {pet['id']} - {pet['name']}")
     return jsonify(pet), 201
 
@@ -185,6 +266,9 @@ def update_pet(pet_id):
         return jsonify({'error': 'Pet not found'}), 404
     
     data = request.get_json()
+    if data.get('photoUrl', pet.get('photoUrl')) != pet.get('photoUrl'):
+        # Variants belong to the old photo - VS
+        pet.update({'photoVariants': {}, 'thumbnailUrl': ''})
     pet.update({
         'name': data.get('name', pet.get('name')),
         'breed': data.get('breed', pet.get('breed')),
@@ -223,17 +307,23 @@ def upload_pet_photo(pet_id):
     if not image_data:
         return jsonify({'error': 'No image data'}), 400
     
+    # Data URL prefix, explicit contentType or the file extension - same allow-list as presigned uploads - VS
+    match = re.match(r'data:([\w/+.-]+);base64,', image_data)
+    content_type = (match.group(1) if match else data.get('contentType')
+                    or mimetypes.guess_type(file_name)[0] or 'image/jpeg').lower()
+    if content_type not in PHOTO_CONTENT_TYPES:
+        return jsonify({'error': f'Unsupported content type: {content_type}'}), 415
+    
     try:
         # Decode base64
         image_bytes = base64.b64decode(image_data.split(',')[1] if ',' in image_data else image_data)
         
         # Upload to S3
-        photo_url = upload_to_s3(image_bytes, file_name)
+        key = build_photo_key(file_name)
+        photo_url = upload_to_s3(image_bytes, key, content_type)
         
         if photo_url:
-            pet['photoUrl'] = photo_url
-            pet['updatedAt'] = datetime.utcnow().isoformat()
-            save_pet(pet)
+            set_new_photo(pet, key, image_bytes)
             return jsonify({'photoUrl': photo_url})
         else:
             return jsonify({'error': 'Failed to upload'}), 500
@@ -242,6 +332,78 @@ def upload_pet_photo(pet_id):
         logger.error(f"Photo upload error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/v1/pets/<pet_id>/photo/upload-url', methods=['POST'])
+def create_photo_upload_url(pet_id):
+    """
+    Presigned POST for uploading a photo directly to S3 - VS
+    Client uploads the file to `url` with `fields`, then calls /photo/complete with `key`
+    """
+    if not s3_client:
+        return jsonify({'error': 'S3 not configured'}), 503
+    
+    if not find_pet(pet_id):
+        return jsonify({'error': 'Pet not found'}), 404
+    
+    data = request.get_json() or {}
+    content_type = data.get('contentType', 'image/jpeg')
+    if content_type not in PHOTO_CONTENT_TYPES:
+        return jsonify({'error': f'Unsupported content type: {content_type}'}), 415
+    
+    key = build_photo_key(data.get('fileName', 'photo.jpg'))
+    try:
+        presigned = s3_client.generate_presigned_post(
+            Bucket=S3_BUCKET,
+            Key=key,
+            Fields={'Content-Type': content_type, 'x-amz-meta-pet-id': pet_id},
+            Conditions=[
+                {'Content-Type': content_type},
+                {'x-amz-meta-pet-id': pet_id},
+                ['content-length-range', 1, PHOTO_MAX_BYTES]
+            ],
+            ExpiresIn=PRESIGNED_URL_EXPIRES
+        )
+    except ClientError as e:
+        logger.error(f"S3 presign error: {e}")
+        return jsonify({'error': 'Failed to create upload URL'}), 500
+    
+    return jsonify({
+        'method': 'POST',
+        'url': presigned['url'],
+        'fields': presigned['fields'],
+        'key': key,
+        'maxBytes': PHOTO_MAX_BYTES,
+        'expiresIn': PRESIGNED_URL_EXPIRES
+    })
+
+@app.route('/api/v1/pets/<pet_id>/photo/complete', methods=['POST'])
+def complete_photo_upload(pet_id):
+    """Confirm a direct S3 upload and set it as the pet photo - VS"""
+    if not s3_client:
+        return jsonify({'error': 'S3 not configured'}), 503
+    
+    pet = find_pet(pet_id)
+    if not pet:
+        return jsonify({'error': 'Pet not found'}), 404
+    
+    data = request.get_json() or {}
+    key = data.get('key', '')
+    if not key.startswith('pets/'):
+        return jsonify({'error': 'Invalid key'}), 400
+    
+    try:
+        head = s3_client.head_object(Bucket=S3_BUCKET, Key=key)
+    except ClientError as e:
+        logger.warning(f"Upload not found in S3: {key} ({e})")
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    # Presigned POST policy pins the pet id into object metadata - VS
+    if head.get('Metadata', {}).get('pet-id') != pet_id:
+        return jsonify({'error': 'Upload does not belong to this pet'}), 403
+    
+    set_new_photo(pet, key)
+    logger.info(f"Photo upload completed for pet {pet_id}: {key}")
+    return jsonify({'photoUrl': pet['photoUrl'], 'size': head.get('ContentLength')})
+
 @app.route('/api/v1/pets/<pet_id>', methods=['DELETE'])
 def delete_pet(pet_id):
     if table:
@@ -256,6 +418,7 @@ def delete_pet(pet_id):
     return jsonify({'message': 'Pet deleted'})
 
 @app.route('/api/v1/pets/species', methods=['GET'])
+@cached_response(max_age=86400)
 def get_species_list():
     """Get list of supported species - VS"""
     species = [
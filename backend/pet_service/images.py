@@ -0,0 +1,96 @@
+"""
+PetCareApp - Pet Photo Pipeline
+Generowanie miniatur (WebP/JPEG) dla zdjęć zwierząt w tle
+@author VS
+"""
+
+import io
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# name -> longest edge in px - VS
+VARIANT_SIZES = {'thumb': 160, 'small': 480, 'medium': 1024}
+VARIANT_FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpg': ('JPEG', 'image/jpeg')}
+
+
+def variant_key(original_key, size_name, ext):
+    """pets/YYYY/MM/<uuid>/photo.jpg -> pets/YYYY/MM/<uuid>/variants/<size>.<ext>"""
+    return f"{original_key.rsplit('/', 1)[0]}/variants/{size_name}.{ext}"
+
+
+def render_variants(data):
+    """Resize the image to every variant size; EXIF and other metadata are dropped"""
+    with Image.open(io.BytesIO(data)) as source:
+        # Apply EXIF orientation before the metadata is discarded - VS
+        image = ImageOps.exif_transpose(source).convert('RGB')
+
+    variants = []
+    for size_name, edge in VARIANT_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        for ext, (fmt, content_type) in VARIANT_FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, format=fmt, quality=82, optimize=True)
+            variants.append((size_name, ext, buffer.getvalue(), content_type, resized.size))
+    return variants
+
+
+class PhotoPipeline:
+    """Thread pool that renders and stores photo variants next to the original - VS"""
+
+    def __init__(self, s3_client, bucket, url_builder, workers=IMAGE_WORKERS):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.url_builder = url_builder
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='photo')
+
+    @property
+    def enabled(self):
+        return PIL_AVAILABLE and self.s3_client is not None
+
+    def process(self, original_key, data=None):
+        """Render and upload all variants, returns {size: {ext: url, width, height}}"""
+        if data is None:
+            data = self.s3_client.get_object(Bucket=self.bucket, Key=original_key)['Body'].read()
+
+        result = {}
+        for size_name, ext, body, content_type, (width, height) in render_variants(data):
+            key = variant_key(original_key, size_name, ext)
+            self.s3_client.put_object(
+                Bucket=self.bucket,
+                Key=key,
+                Body=body,
+                ContentType=content_type,
+                # Keys are unique per upload, so variants never change - VS
+                CacheControl='public, max-age=31536000, immutable'
+            )
+            entry = result.setdefault(size_name, {'width': width, 'height': height})
+            entry[ext] = self.url_builder(key)
+        return result
+
+    def submit(self, original_key, callback, data=None):
+        """Process in the background and call callback(variants) when done"""
+        if not self.enabled:
+            logger.warning("Photo pipeline disabled (Pillow or S3 not available)")
+            return None
+
+        def run():
+            try:
+                variants = self.process(original_key, data)
+                callback(variants)
+                logger.info(f"Photo variants generated for {original_key}")
+            except Exception as e:
+                logger.error(f"Photo processing error for {original_key}: {e}")
+
+        return self.executor.submit(run)
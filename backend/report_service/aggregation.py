@@ -0,0 +1,518 @@
+"""
+PetCareApp - Report Aggregation Engine
+Strumieniowa agregacja raportów: równoległy scan DynamoDB + akumulatory grup
+@author VS
+"""
+
+import os
+import logging
+from datetime import datetime, time, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.dynamodb.conditions import Attr
+
+from shared.database import parallel_scan
+from shared.rollups import appointment_contribution, payment_contribution, pet_contribution
+
+logger = logging.getLogger(__name__)
+
+REPORT_SCAN_SEGMENTS = int(os.getenv('REPORT_SCAN_SEGMENTS', 4))
+TABLE_PREFIX = os.getenv('TABLE_PREFIX', 'PetCareApp-')
+
+DAY_NAMES = ['Poniedziałek', 'Wtorek', 'Środa', 'Czwartek', 'Piątek', 'Sobota', 'Niedziela']
+SPECIES_NAMES = {
+    'dog': 'Pies', 'cat': 'Kot', 'rabbit': 'Królik', 'hamster': 'Chomik',
+    'guinea_pig': 'Świnka morska', 'bird': 'Ptak', 'fish': 'Ryba', 'reptile': 'Gad', 'other': 'Inne'
+}
+AGE_RANGES = [(1, '0-1 lat'), (3, '1-3 lat'), (7, '3-7 lat'), (None, '7+ lat')]
+
+# ============================================
+#  Helpers
+# ============================================
+
+
+def parse_dt(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def to_number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def period_bounds(date_from=None, date_to=None, default_days=30):
+    """(from, to) as ISO strings; `to` is exclusive, a bare date includes the whole day"""
+    end = parse_dt(date_to) or datetime.utcnow()
+    if date_to and len(date_to) == 10:
+        end += timedelta(days=1)
+    start = parse_dt(date_from) or end - timedelta(days=default_days)
+    return start.isoformat(), end.isoformat()
+
+
+def rollup_days(period):
+    """Exclusive ISO period -> inclusive (first day, last day) for daily rollups"""
+    last = parse_dt(period[1]) - timedelta(microseconds=1)
+    return period[0][:10], last.strftime('%Y-%m-%d')
+
+
+def whole_days(period):
+    """True when both bounds fall on midnight - daily rollups cover the period exactly"""
+    return all(parse_dt(bound) and parse_dt(bound).time() == time.min for bound in period)
+
+
+def bucket(dt, group_by='day'):
+    if group_by == 'month':
+        return dt.strftime('%Y-%m')
+    if group_by == 'week':
+        year, week, _ = dt.isocalendar()
+        return f"{year}-W{week:02d}"
+    return dt.strftime('%Y-%m-%d')
+
+
+def age_range(birth_date, today=None):
+    born = parse_dt(birth_date)
+    if not born:
+        return None
+    years = ((today or datetime.utcnow()) - born).days / 365.25
+    for limit, label in AGE_RANGES:
+        if limit is None or years < limit:
+            return label
+
+
+# ============================================
+#  Accumulators
+# ============================================
+
+class Metric:
+    """count / sum / min / max of one group"""
+
+    __slots__ = ('count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value=None, count=1):
+        self.count += count
+        if value is None:
+            return
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.total, 2),
+            'avg': round(self.total / self.count, 2) if self.count else 0,
+            'min': self.min,
+            'max': self.max
+        }
+
+
+class GroupBy:
+    """Folds items into per-key metrics; memory grows with the number of groups, not items"""
+
+    def __init__(self, key_fn, value_fn=None, where=None, count_fn=None):
+        self.key_fn = key_fn
+        self.value_fn = value_fn
+        self.where = where
+        # Pre-aggregated rows (rollups) carry their own count - VS
+        self.count_fn = count_fn
+        self.groups = {}
+        self.overall = Metric()
+
+    def add(self, item):
+        if self.where and not self.where(item):
+            return
+        key = self.key_fn(item)
+        if key is None:
+            return
+        value = self.value_fn(item) if self.value_fn else None
+        count = self.count_fn(item) if self.count_fn else 1
+        metric = self.groups.get(key)
+        if metric is None:
+            metric = self.groups[key] = Metric()
+        metric.add(value, count)
+        self.overall.add(value, count)
+
+    def get(self, key):
+        return self.groups.get(key) or Metric()
+
+    def rows(self, key_name, order=None, by_count=False):
+        """List of {key_name: key, count, sum, avg, ...} sorted by key, `order` or count"""
+        if order is not None:
+            keys = [k for k in order if k in self.groups]
+        elif by_count:
+            keys = sorted(self.groups, key=lambda k: -self.groups[k].count)
+        else:
+            keys = sorted(self.groups)
+        total = self.overall.count
+        return [
+            {key_name: k, **self.groups[k].to_dict(),
+             'percentage': round(self.groups[k].count / total * 100, 1) if total else 0}
+            for k in keys
+        ]
+
+
+class DistinctCounter:
+    """Distinct values of a field (pet ids are bounded by the pet population)"""
+
+    def __init__(self, key_fn, where=None):
+        self.key_fn = key_fn
+        self.where = where
+        self.values = set()
+
+    def add(self, item):
+        if self.where and not self.where(item):
+            return
+        key = self.key_fn(item)
+        if key is not None:
+            self.values.add(key)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class Lookup:
+    """Last seen value per key, e.g. vet names denormalised on appointments"""
+
+    def __init__(self, key_fn, value_fn):
+        self.key_fn = key_fn
+        self.value_fn = value_fn
+        self.values = {}
+
+    def add(self, item):
+        key, value = self.key_fn(item), self.value_fn(item)
+        if key is not None and value:
+            self.values[key] = value
+
+
+def fold(items, accumulators):
+    """Single pass over items feeding every accumulator, returns number of items"""
+    count = 0
+    for item in items:
+        count += 1
+        for accumulator in accumulators:
+            accumulator.add(item)
+    return count
+
+
+# ============================================
+#  Report engine
+# ============================================
+
+def _dt_key(field, fmt_fn):
+    def key(item):
+        dt = parse_dt(item.get(field))
+        return fmt_fn(dt) if dt else None
+    return key
+
+
+def _field(name, default=None):
+    return lambda item: item.get(name) or default
+
+
+def _is_completed(item):
+    return item.get('status') == 'completed'
+
+
+def _is_active(item):
+    return item.get('isActive') is not False
+
+
+def _completed_price(item):
+    return to_number(item.get('price')) if _is_completed(item) else 0.0
+
+
+class ReportEngine:
+    """Builds reports straight from DynamoDB tables - VS"""
+
+    APPOINTMENT_FIELDS = ['id', 'petId', 'vetId', 'vetName', 'dateTime', 'serviceType', 'serviceName', 'price', 'status']
+    PAYMENT_FIELDS = ['id', 'amount', 'currency', 'status', 'description', 'createdAt']
+    PET_FIELDS = ['id', 'species', 'birthDate', 'isActive', 'createdAt']
+    USER_FIELDS = ['id', 'firstName', 'lastName', 'role']
+
+    def __init__(self, dynamodb, rollups=None, segments=REPORT_SCAN_SEGMENTS):
+        self.dynamodb = dynamodb
+        self.rollups = rollups
+        self.segments = segments
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='report')
+
+    def scan(self, table_name, fields, date_field=None, period=None, equals=None):
+        """Parallel segmented scan streaming only the projected fields"""
+        params = {}
+        condition = None
+        if date_field and period:
+            condition = Attr(date_field).gte(period[0]) & Attr(date_field).lt(period[1])
+        for name, value in (equals or {}).items():
+            clause = Attr(name).eq(value)
+            condition = clause if condition is None else condition & clause
+        if condition is not None:
+            params['FilterExpression'] = condition
+        if fields:
+            # Most field names (status, dateTime, name...) are reserved words - VS
+            names = {f"#p{i}": field for i, field in enumerate(fields)}
+            params['ProjectionExpression'] = ', '.join(names)
+            params['ExpressionAttributeNames'] = names
+        table = self.dynamodb.Table(f"{TABLE_PREFIX}{table_name}")
+        return parallel_scan(table, self.segments, **params)
+
+    def run_parallel(self, **folds):
+        """Run independent table folds concurrently, returns {name: result}"""
+        futures = {name: self.executor.submit(fn) for name, fn in folds.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+    # --- per-table folds ---
+
+    def fold_appointments(self, period, group_by='day', vet_id=None):
+        acc = {
+            'byStatus': GroupBy(_field('status', 'unknown')),
+            # count = all appointments, sum = revenue of completed ones - VS
+            'byService': GroupBy(_field('serviceName', 'Inne'), _completed_price),
+            'byDayOfWeek': GroupBy(_dt_key('dateTime', lambda dt: DAY_NAMES[dt.weekday()])),
+            'byHour': GroupBy(_dt_key('dateTime', lambda dt: f"{dt.hour:02d}:00")),
+            'byPeriod': GroupBy(_dt_key('dateTime', lambda dt: bucket(dt, group_by))),
+            'byVet': GroupBy(_field('vetId', 'unassigned')),
+            'vetRevenue': GroupBy(_field('vetId', 'unassigned'), lambda a: to_number(a.get('price')), where=_is_completed),
+            'patients': DistinctCounter(_field('petId')),
+            'vetNames': Lookup(_field('vetId'), _field('vetName'))
+        }
+        items = self.scan('Appointments', self.APPOINTMENT_FIELDS, 'dateTime', period, {'vetId': vet_id} if vet_id else None)
+        acc['total'] = fold(items, list(acc.values()))
+        return acc
+
+    def fold_payments(self, period, group_by='day'):
+        acc = {
+            'byStatus': GroupBy(_field('status', 'unknown'), lambda p: to_number(p.get('amount'))),
+            'revenue': GroupBy(_dt_key('createdAt', lambda dt: bucket(dt, group_by)),
+                               lambda p: to_number(p.get('amount')), where=_is_completed)
+        }
+        acc['total'] = fold(self.scan('Payments', self.PAYMENT_FIELDS, 'createdAt', period), list(acc.values()))
+        return acc
+
+    def fold_pets(self, period=None):
+        today = datetime.utcnow()
+        acc = {
+            'bySpecies': GroupBy(lambda p: SPECIES_NAMES.get(p.get('species'), 'Inne'), where=_is_active),
+            'byAge': GroupBy(lambda p: age_range(p.get('birthDate'), today), where=_is_active),
+            'perMonth': GroupBy(_dt_key('createdAt', lambda dt: dt.strftime('%Y-%m'))),
+            'active': DistinctCounter(_field('id'), where=_is_active),
+            'new': DistinctCounter(_field('id'), where=lambda p: bool(period) and period[0] <= (p.get('createdAt') or '') < period[1])
+        }
+        acc['total'] = fold(self.scan('Pets', self.PET_FIELDS), list(acc.values()))
+        return acc
+
+    def fold_vet_names(self):
+        names = {}
+        for user in self.scan('Users', self.USER_FIELDS, equals={'role': 'vet'}):
+            names[user['id']] = f"{user.get('firstName', '')} {user.get('lastName', '')}".strip()
+        return names
+
+    # --- reports ---
+
+    def summary(self, period):
+        results = self.run_parallel(
+            appointments=lambda: self.fold_appointments(period),
+            payments=lambda: self.fold_payments(period),
+            pets=lambda: self.fold_pets(period)
+        )
+        appointments, payments, pets = results['appointments'], results['payments'], results['pets']
+        by_status = appointments['byStatus']
+        total = appointments['total']
+        completed = by_status.get('completed').count
+        revenue = payments['revenue'].overall
+        seen = appointments['patients'].values
+        new_seen = len(seen & pets['new'].values)
+
+        return {
+            'appointments': {
+                'total': total,
+                'completed': completed,
+                'cancelled': by_status.get('cancelled').count,
+                'noShow': by_status.get('noShow').count,
+                'completionRate': round(completed / total * 100, 1) if total else 0
+            },
+            'revenue': {
+                'total': round(revenue.total, 2),
+                'average': round(revenue.total / revenue.count, 2) if revenue.count else 0,
+                'byService': [
+                    {'service': row['service'], 'amount': row['sum'], 'count': row['count']}
+                    for row in appointments['byService'].rows('service', by_count=True)
+                ]
+            },
+            'patients': {
+                'total': len(seen),
+                'new': new_seen,
+                'returning': len(seen) - new_seen,
+                'bySpecies': [
+                    {'species': row['species'], 'count': row['count']}
+                    for row in pets['bySpecies'].rows('species', by_count=True)
+                ]
+            }
+        }
+
+    def financial(self, period, group_by='day'):
+        payments = self.fold_payments(period, group_by)
+        data = [
+            {'date': row['date'], 'revenue': row['sum'], 'transactions': row['count'], 'average': row['avg']}
+            for row in payments['revenue'].rows('date')
+        ]
+        revenue = payments['revenue'].overall
+        return {
+            'data': data,
+            'byStatus': [
+                {'status': row['status'], 'count': row['count'], 'amount': row['sum']}
+                for row in payments['byStatus'].rows('status', by_count=True)
+            ],
+            'totals': {
+                'revenue': round(revenue.total, 2),
+                'transactions': revenue.count,
+                'average': round(revenue.total / revenue.count, 2) if revenue.count else 0
+            }
+        }
+
+    def appointments(self, period, vet_id=None, group_by='day'):
+        acc = self.fold_appointments(period, group_by, vet_id)
+        return {
+            'total': acc['total'],
+            'byStatus': [
+                {'status': row['status'], 'count': row['count'], 'percentage': row['percentage']}
+                for row in acc['byStatus'].rows('status', by_count=True)
+            ],
+            'byService': [
+                {'service': row['service'], 'count': row['count'], 'revenue': row['sum']}
+                for row in acc['byService'].rows('service', by_count=True)
+            ],
+            'byDayOfWeek': [
+                {'day': row['day'], 'count': row['count']}
+                for row in acc['byDayOfWeek'].rows('day', order=DAY_NAMES)
+            ],
+            'byHour': [{'hour': row['hour'], 'count': row['count']} for row in acc['byHour'].rows('hour')],
+            'byPeriod': [{'date': row['date'], 'count': row['count']} for row in acc['byPeriod'].rows('date')]
+        }
+
+    def patients(self, period=None):
+        acc = self.fold_pets(period)
+        return {
+            'total': acc['total'],
+            'active': len(acc['active']),
+            'bySpecies': [
+                {'species': row['species'], 'count': row['count'], 'percentage': row['percentage']}
+                for row in acc['bySpecies'].rows('species', by_count=True)
+            ],
+            'byAge': [
+                {'range': row['range'], 'count': row['count']}
+                for row in acc['byAge'].rows('range', order=[label for _, label in AGE_RANGES])
+            ],
+            'newPatientsPerMonth': [{'month': row['month'], 'count': row['count']} for row in acc['perMonth'].rows('month')]
+        }
+
+    def vets(self, period):
+        results = self.run_parallel(
+            appointments=lambda: self.fold_appointments(period),
+            names=self.fold_vet_names
+        )
+        acc, names = results['appointments'], {**results['appointments']['vetNames'].values, **results['names']}
+        vets = []
+        for row in acc['byVet'].rows('id', by_count=True):
+            completed = acc['vetRevenue'].get(row['id'])
+            vets.append({
+                'id': row['id'],
+                'name': names.get(row['id'], ''),
+                'appointments': row['count'],
+                'completed': completed.count,
+                'revenue': round(completed.total, 2),
+                'completionRate': round(completed.count / row['count'] * 100, 1) if row['count'] else 0
+            })
+        return {'vets': vets}
+
+    # --- rollups ---
+
+    def financial_rollups(self, period, group_by='day'):
+        """Financial report merged from daily rollup rows - same shape as financial(), whole days only"""
+        day_from, day_to = rollup_days(period)
+        revenue = GroupBy(
+            lambda r: bucket(parse_dt(r['day']), group_by),
+            lambda r: to_number(r.get('paymentRevenue')),
+            where=lambda r: r['dimension'] == 'total' and r.get('payments'),
+            count_fn=lambda r: int(r['payments'])
+        )
+        by_status = GroupBy(
+            lambda r: r['dimension'].split('#', 1)[1],
+            lambda r: to_number(r.get('amount')),
+            where=lambda r: r['dimension'].startswith('payment#') and r.get('payments'),
+            count_fn=lambda r: int(r['payments'])
+        )
+        fold(self.rollups.query(day_from, day_to), [revenue, by_status])
+        total = revenue.overall
+        return {
+            'data': [
+                {'date': row['date'], 'revenue': row['sum'], 'transactions': row['count'], 'average': row['avg']}
+                for row in revenue.rows('date')
+            ],
+            'byStatus': [
+                {'status': row['status'], 'count': row['count'], 'amount': row['sum']}
+                for row in by_status.rows('status', by_count=True)
+            ],
+            'totals': {
+                'revenue': round(total.total, 2),
+                'transactions': total.count,
+                'average': round(total.total / total.count, 2) if total.count else 0
+            },
+            'source': 'rollups'
+        }
+
+    def rollup_breakdown(self, period, dimension, group_by='day'):
+        """Counters per (period bucket, vet / service / species) from rollup rows"""
+        day_from, day_to = rollup_days(period)
+        merged = {}
+        for row in self.rollups.query(day_from, day_to, prefix=f"{dimension}#"):
+            key = ('all' if group_by == 'all' else bucket(parse_dt(row['day']), group_by), row['dimension'].split('#', 1)[1])
+            counters = merged.setdefault(key, {})
+            for name, value in row.items():
+                if name not in ('day', 'dimension'):
+                    counters[name] = counters.get(name, 0) + to_number(value)
+        return {
+            'dimension': dimension,
+            'rows': [
+                {'date': date, dimension: value, **{k: round(v, 2) for k, v in counters.items()}}
+                for (date, value), counters in sorted(merged.items())
+            ],
+            'source': 'rollups'
+        }
+
+    def rebuild_rollups(self, passes=3):
+        """
+        Recompute rollup rows from a full scan (backfill / repair).
+        Row revisions are read before the scan and every write is conditional
+        on them; months that service hooks changed meanwhile are scanned again.
+        """
+        months = None
+        for attempt in range(passes):
+            revisions = self.rollups.revisions(months)
+            deltas = {}
+            for item in self.scan('Appointments', self.APPOINTMENT_FIELDS):
+                appointment_contribution(item, deltas=deltas)
+            for item in self.scan('Payments', self.PAYMENT_FIELDS):
+                payment_contribution(item, deltas=deltas)
+            for item in self.scan('Pets', self.PET_FIELDS):
+                pet_contribution(item, deltas=deltas)
+            if months is not None:
+                deltas = {key: row for key, row in deltas.items() if key[0][:7] in months}
+            written, deleted, dirty = self.rollups.reconcile(deltas, revisions)
+            logger.info(f"Rollups rebuilt (pass {attempt + 1}): {written} rows written, {deleted} removed")
+            if not dirty:
+                return written
+            months = dirty
+        logger.warning(f"Rollups changed during every rebuild pass, months left as is: {sorted(months)}")
+        return written
@@ -4,262 +4,234 @@ Serwis generowania raportów
 @author VS
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, redirect, g
 
-from datetime import datetime, timedelta
+from datetime import datetime
 import uuid
 import os
 import logging
 import boto3
-from botocore.exceptions import ClientError
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 import json
-import io
+import sys
+
+# Shared modules live one level up (/app/shared in the container) - VS
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.auth import init_auth
+from shared.rate_limit import RateLimiter, init_rate_limit, shared_cache
+from shared.rollups import RollupStore
+
+from aggregation import ReportEngine, period_bounds, whole_days, REPORT_SCAN_SEGMENTS
+from snapshots import SnapshotStore, SnapshotScheduler
+from exports import ExportJobs
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+init_auth(app)
+
+# Reports scan whole tables - per user (or IP) limit on /reports/* - VS
+REPORT_RATE_LIMIT = int(os.getenv('REPORT_RATE_LIMIT', 60))
+REPORT_RATE_BURST = int(os.getenv('REPORT_RATE_BURST', 20))
+report_limiter = RateLimiter('reports', REPORT_RATE_LIMIT, 60, burst=REPORT_RATE_BURST, cache=shared_cache())
+init_rate_limit(app, report_limiter, '/api/v1/reports/')
 
 
 AWS_REGION = os.getenv('AWS_REGION', 'eu-north-1')
+S3_BUCKET = os.getenv('S3_BUCKET', 'petcareapp-files')
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL') or None
 
 # DynamoDB clients for querying other tables - VS
 dynamodb = None
 try:
     dynamodb = boto3.resource(
         'dynamodb', 
-        region_name=AWS_REGION
+        region_name=AWS_REGION,
+        # Parallel scan segments of several tables share the connection pool - VS
+        config=Config(max_pool_connections=REPORT_SCAN_SEGMENTS * 4)
         )
     logger.info("DynamoDB connected for reports")
 except Exception as e:
     logger.warning(f"DynamoDB not available: {e}")
 
+engine = ReportEngine(dynamodb, RollupStore(dynamodb)) if dynamodb else None
+snapshots = SnapshotStore(engine)
+snapshots.load()
+
+s3_client = None
+try:
+    s3_client = boto3.client(
+        's3',
+        region_name=AWS_REGION,
+        endpoint_url=S3_ENDPOINT_URL,
+        config=Config(signature_version='s3v4')
+    )
+    logger.info(f"S3 client initialized for bucket: {S3_BUCKET}")
+except Exception as e:
+    logger.warning(f"S3 not available: {e}")
+
+# Export jobs by id - VS
 reports_db = {}
+exports = ExportJobs(engine, s3_client, S3_BUCKET, reports_db)
 
 @app.route('/api/v1/health', methods=['GET'])
 def health_check():
     return jsonify({'service': 'report-service', 'status': 'healthy', 'dynamodb': dynamodb is not None})
 
+def report_response(build, period=None, **extra):
+    """Run a report and wrap it with period and timestamp - VS"""
+    if not engine:
+        return jsonify({'error': 'Reports unavailable'}), 503
+    try:
+        report = build()
+    except (ClientError, BotoCoreError) as e:
+        logger.error(f"Report query error: {e}")
+        return jsonify({'error': 'Reports unavailable'}), 503
+    if period:
+        report['period'] = {'from': period[0], 'to': period[1], **extra}
+    report['generatedAt'] = datetime.utcnow().isoformat()
+    return jsonify(report)
+
+def request_period():
+    return period_bounds(request.args.get('dateFrom'), request.args.get('dateTo'))
+
+def use_snapshot():
+    """Columnar snapshot unless ?source=scan (or none built yet)"""
+    return snapshots.available and request.args.get('source', 'snapshot') == 'snapshot'
+
+def request_group_by():
+    group_by = request.args.get('groupBy', 'day')
+    return group_by if group_by in ('day', 'week', 'month') else 'day'
+
 @app.route('/api/v1/reports/summary', methods=['GET'])
 def get_summary_report():
     """Get summary statistics - VS"""
-    date_from = request.args.get('dateFrom', (datetime.utcnow() - timedelta(days=30)).isoformat())
-    date_to = request.args.get('dateTo', datetime.utcnow().isoformat())
-    
-    # Demo data - in production query from DynamoDB - VS
-    summary = {
-        'period': {'from': date_from, 'to': date_to},
-        'appointments': {
-            'total': 156,
-            'completed': 142,
-            'cancelled': 8,
-            'noShow': 6,
-            'completionRate': 91.0
-        },
-        'revenue': {
-            'total': 23450.00,
-            'average': 150.32,
-            'byService': [
-                {'service': 'Konsultacja', 'amount': 8500.00, 'count': 57},
-                {'service': 'Szczepienie', 'amount': 4200.00, 'count': 42},
-                {'service': 'Chirurgia', 'amount': 6500.00, 'count': 13},
-                {'service': 'Stomatologia', 'amount': 2400.00, 'count': 8},
-                {'service': 'Inne', 'amount': 1850.00, 'count': 22}
-            ]
-        },
-        'patients': {
-            'total': 89,
-            'new': 23,
-            'returning': 66,
-            'bySpecies': [
-                {'species': 'Pies', 'count': 52},
-                {'species': 'Kot', 'count': 31},
-                {'species': 'Inne', 'count': 6}
-            ]
-        },
-        'generatedAt': datetime.utcnow().isoformat()
-    }
-    
-    return jsonify(summary)
+    period = request_period()
+    return report_response(lambda: engine.summary(period), period)
 
 @app.route('/api/v1/reports/financial', methods=['GET'])
 def get_financial_report():
     """Get financial report - VS"""
-    date_from = request.args.get('dateFrom')
-    date_to = request.args.get('dateTo')
-    group_by = request.args.get('groupBy', 'day')  # day, week, month
+    period = request_period()
+    group_by = request_group_by()
     
-    # Demo data - VS
-    data = []
-    base_date = datetime.utcnow() - timedelta(days=30)
+    source = request.args.get('source')
     
-    for i in range(30):
-        date = base_date + timedelta(days=i)
-        data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'revenue': 500 + (i * 50) + (i % 7 * 100),
-            'expenses': 200 + (i * 20),
-            'profit': 300 + (i * 30) + (i % 7 * 100),
-            'transactions': 3 + (i % 5)
-        })
+    def build():
+        if source == 'snapshot' and snapshots.available:
+            return snapshots.financial(period, group_by)
+        # Rollups are opt-in: they are only complete after POST /rollups/rebuild - VS
+        if source == 'rollups' and whole_days(period):
+            try:
+                return engine.financial_rollups(period, group_by)
+            except ClientError as e:
+                # e.g. rollup table not created yet - VS
+                logger.warning(f"Rollups unavailable, falling back to scan: {e}")
+        return engine.financial(period, group_by)
     
-    report = {
-        'period': {'from': date_from, 'to': date_to, 'groupBy': group_by},
-        'data': data,
-        'totals': {
-            'revenue': sum(d['revenue'] for d in data),
-            'expenses': sum(d['expenses'] for d in data),
-            'profit': sum(d['profit'] for d in data),
-            'transactions': sum(d['transactions'] for d in data)
-        },
-        'generatedAt': datetime.utcnow().isoformat()
-    }
-    
-    return jsonify(report)
+    return report_response(build, period, groupBy=group_by)
 
 @app.route('/api/v1/reports/appointments', methods=['GET'])
 def get_appointments_report():
     """Get appointments statistics report - VS"""
+    period = request_period()
     vet_id = request.args.get('vetId')
-    date_from = request.args.get('dateFrom')
-    date_to = request.args.get('dateTo')
-    
-    # Demo data - VS
-    report = {
-        'byStatus': [
-            {'status': 'completed', 'count': 142, 'percentage': 91.0},
-            {'status': 'cancelled', 'count': 8, 'percentage': 5.1},
-            {'status': 'noShow', 'count': 6, 'percentage': 3.9}
-        ],
-        'byService': [
-            {'service': 'Konsultacja', 'count': 57},
-            {'service': 'Szczepienie', 'count': 42},
-            {'service': 'Chirurgia', 'count': 13},
-            {'service': 'Stomatologia', 'count': 8},
-            {'service': 'RTG', 'count': 15},
-            {'service': 'USG', 'count': 12},
-            {'service': 'Inne', 'count': 9}
-        ],
-        'byDayOfWeek': [
-            {'day': 'Poniedziałek', 'count': 28},
-            {'day': 'Wtorek', 'count': 32},
-            {'day': 'Środa', 'count': 25},
-            {'day': 'Czwartek', 'count': 30},
-            {'day': 'Piątek', 'count': 35},
-            {'day': 'Sobota', 'count': 6}
-        ],
-        'byHour': [
-            {'hour': '09:00', 'count': 18},
-            {'hour': '10:00', 'count': 22},
-            {'hour': '11:00', 'count': 25},
-            {'hour': '12:00', 'count': 15},
-            {'hour': '13:00', 'count': 12},
-            {'hour': '14:00', 'count': 20},
-            {'hour': '15:00', 'count': 23},
-            {'hour': '16:00', 'count': 21}
-        ],
-        'generatedAt': datetime.utcnow().isoformat()
-    }
-    
-    return jsonify(report)
+    group_by = request_group_by()
+    if use_snapshot():
+        return report_response(lambda: snapshots.appointments(period, vet_id, group_by), period, groupBy=group_by)
+    return report_response(lambda: engine.appointments(period, vet_id, group_by), period, groupBy=group_by)
 
 @app.route('/api/v1/reports/patients', methods=['GET'])
 def get_patients_report():
     """Get patients statistics report - VS"""
-    
-    report = {
-        'total': 234,
-        'active': 189,
-        'bySpecies': [
-            {'species': 'Pies', 'count': 132, 'percentage': 56.4},
-            {'species': 'Kot', 'count': 78, 'percentage': 33.3},
-            {'species': 'Królik', 'count': 12, 'percentage': 5.1},
-            {'species': 'Świnka morska', 'count': 8, 'percentage': 3.4},
-            {'species': 'Inne', 'count': 4, 'percentage': 1.7}
-        ],
-        'byAge': [
-            {'range': '0-1 lat', 'count': 45},
-            {'range': '1-3 lat', 'count': 67},
-            {'range': '3-7 lat', 'count': 78},
-            {'range': '7+ lat', 'count': 44}
-        ],
-        'newPatientsPerMonth': [
-            {'month': '2024-10', 'count': 18},
-            {'month': '2024-11', 'count': 22},
-            {'month': '2024-12', 'count': 15},
-            {'month': '2025-01', 'count': 23}
-        ],
-        'generatedAt': datetime.utcnow().isoformat()
-    }
-    
-    return jsonify(report)
+    if use_snapshot():
+        return report_response(lambda: snapshots.patients())
+    return report_response(lambda: engine.patients())
 
 @app.route('/api/v1/reports/vets', methods=['GET'])
 def get_vets_report():
     """Get veterinarians performance report - VS"""
-    
-    report = {
-        'vets': [
-            {
-                'id': 'vet-001',
-                'name': 'Dr Jan Kowalski',
-                'appointments': 45,
-                'revenue': 6750.00,
-                'avgRating': 4.8,
-                'completionRate': 95.5
-            },
-            {
-                'id': 'vet-002',
-                'name': 'Dr Anna Nowak',
-                'appointments': 52,
-                'revenue': 7800.00,
-                'avgRating': 4.9,
-                'completionRate': 98.1
-            },
-            {
-                'id': 'vet-003',
-                'name': 'Dr Piotr Wiśniewski',
-                'appointments': 38,
-                'revenue': 5700.00,
-                'avgRating': 4.7,
-                'completionRate': 92.1
-            }
-        ],
-        'generatedAt': datetime.utcnow().isoformat()
-    }
-    
-    return jsonify(report)
+    period = request_period()
+    return report_response(lambda: engine.vets(period), period)
+
+@app.route('/api/v1/reports/rollups', methods=['GET'])
+def get_rollups_report():
+    """Daily per-vet / per-service / per-species counters - VS"""
+    dimension = request.args.get('dimension', 'vet')
+    if dimension not in ('vet', 'service', 'species'):
+        return jsonify({'error': 'dimension must be vet, service or species'}), 400
+    period = request_period()
+    group_by = request.args.get('groupBy') if request.args.get('groupBy') == 'all' else request_group_by()
+    return report_response(lambda: engine.rollup_breakdown(period, dimension, group_by), period, groupBy=group_by)
+
+@app.route('/api/v1/reports/rollups/rebuild', methods=['POST'])
+def rebuild_rollups():
+    """Recompute rollups from the source tables in the background - admin/IT only - VS"""
+    user = g.get('user')
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if user.get('role') not in ('admin', 'it'):
+        return jsonify({'error': 'Forbidden'}), 403
+    if not engine:
+        return jsonify({'error': 'Reports unavailable'}), 503
+    future = engine.executor.submit(engine.rebuild_rollups)
+    future.add_done_callback(lambda f: f.exception() and logger.error(f"Rollup rebuild failed: {f.exception()}"))
+    return jsonify({'message': 'Rollup rebuild started'}), 202
+
+@app.route('/api/v1/reports/snapshots', methods=['GET'])
+def get_snapshot_status():
+    return jsonify(snapshots.status())
+
+@app.route('/api/v1/reports/snapshots/refresh', methods=['POST'])
+def refresh_snapshots():
+    """Rebuild the columnar snapshots in the background - VS"""
+    if not engine:
+        return jsonify({'error': 'Reports unavailable'}), 503
+    future = engine.executor.submit(snapshots.build)
+    future.add_done_callback(lambda f: f.exception() and logger.error(f"Snapshot build failed: {f.exception()}"))
+    return jsonify({'message': 'Snapshot refresh started'}), 202
 
 @app.route('/api/v1/reports/export', methods=['POST'])
 def export_report():
-    """Export report to file - VS"""
-    data = request.get_json()
-    report_type = data.get('type', 'summary')
-    format_type = data.get('format', 'json')
-    
-    # Generate report data
-    if report_type == 'summary':
-        report_data = {'type': 'summary', 'data': 'Summary report data'}
-    elif report_type == 'financial':
-        report_data = {'type': 'financial', 'data': 'Financial report data'}
-    else:
-        report_data = {'type': report_type, 'data': 'Report data'}
-        report_data['generatedAt'] = datetime.utcnow().isoformat()
-    
-    if format_type == 'json':
-        return jsonify(report_data)
-    elif format_type == 'csv':
-        csv_content = "type,generatedAt\n" + f"{report_type},{report_data['generatedAt']}"
-        return send_file(
-            io.BytesIO(csv_content.encode()),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'report_{report_type}_{datetime.utcnow().strftime("%Y%m%d")}.csv'
-        )
+    """Queue a report export job - VS"""
+    if not engine:
+        return jsonify({'error': 'Reports unavailable'}), 503
+    data = request.get_json() or {}
+    try:
+        job = exports.submit(data.get('type', 'financial'), data.get('format', 'csv'), data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify(report_data)
+    logger.info(f"Export job queued: {job['id']} ({job['type']}/{job['format']})")
+    return jsonify(exports.describe(job)), 202
+
+@app.route('/api/v1/reports/export', methods=['GET'])
+def list_exports():
+    jobs = sorted(reports_db.values(), key=lambda j: j['createdAt'], reverse=True)
+    return jsonify([exports.describe(job) for job in jobs])
+
+@app.route('/api/v1/reports/export/<job_id>', methods=['GET'])
+def get_export(job_id):
+    """Job status; includes a download URL once completed - VS"""
+    job = exports.get(job_id)
+    if not job:
+        return jsonify({'error': 'Export job not found'}), 404
+    return jsonify(exports.describe(job))
+
+@app.route('/api/v1/reports/export/<job_id>/download', methods=['GET'])
+def download_export(job_id):
+    job = exports.get(job_id)
+    if not job:
+        return jsonify({'error': 'Export job not found'}), 404
+    if job['status'] != 'completed':
+        return jsonify({'error': f"Export is {job['status']}"}), 409
+    return redirect(exports.describe(job)['downloadUrl'])
 
 if __name__ == '__main__':
     PORT = int(os.getenv('PORT', 8007))
     logger.info(f"Starting Report Service on port {PORT}")
+    if engine and os.getenv('REPORT_SNAPSHOTS_ENABLED', 'true').lower() == 'true':
+        SnapshotScheduler(snapshots).start()
     app.run(host='0.0.0.0', port=PORT, debug=False)
\ No newline at end of file
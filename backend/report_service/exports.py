@@ -0,0 +1,310 @@
+"""
+PetCareApp - Report Export Jobs
+Eksport raportów (CSV/XLSX/PDF/JSON) w tle, strumieniowo do S3
+@author VS
+"""
+
+import io
+import os
+import csv
+import json
+import uuid
+import logging
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from openpyxl import Workbook
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+
+try:
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+    REPORTLAB_AVAILABLE = True
+except ImportError:
+    REPORTLAB_AVAILABLE = False
+
+from aggregation import period_bounds
+
+logger = logging.getLogger(__name__)
+
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', 2))
+# Up to this size the file stays in memory, above it spills to disk - VS
+EXPORT_SPOOL_BYTES = int(os.getenv('EXPORT_SPOOL_BYTES', 8 * 1024 * 1024))
+EXPORT_URL_EXPIRES = int(os.getenv('EXPORT_URL_EXPIRES', 3600))
+EXPORT_JOB_TTL_HOURS = int(os.getenv('EXPORT_JOB_TTL_HOURS', 24))
+EXPORT_PDF_MAX_ROWS = int(os.getenv('EXPORT_PDF_MAX_ROWS', 20000))
+PDF_FONT_PATH = os.getenv('PDF_FONT_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+
+# ============================================
+#  Row sources
+# ============================================
+
+def _raw(table, columns, date_field=None):
+    def rows(engine, params):
+        period = params['period'] if date_field else None
+        for item in engine.scan(table, columns, date_field, period):
+            yield [item.get(column, '') for column in columns]
+    return columns, rows
+
+
+def _financial_rows(engine, params):
+    for row in engine.financial(params['period'], params['groupBy'])['data']:
+        yield [row['date'], row['revenue'], row['transactions'], row['average']]
+
+
+def _vet_rows(engine, params):
+    for vet in engine.vets(params['period'])['vets']:
+        yield [vet['id'], vet['name'], vet['appointments'], vet['completed'], vet['revenue'], vet['completionRate']]
+
+
+def _appointment_breakdown_rows(engine, params):
+    report = engine.appointments(params['period'], params.get('vetId'), params['groupBy'])
+    for group, key in (('byStatus', 'status'), ('byService', 'service'), ('byDayOfWeek', 'day'), ('byHour', 'hour'), ('byPeriod', 'date')):
+        for row in report[group]:
+            yield [group, row[key], row['count']]
+
+
+EXPORT_TYPES = {
+    # raw rows, streamed straight from the parallel scan
+    'appointments': _raw('Appointments', ['id', 'dateTime', 'petId', 'ownerId', 'vetId', 'vetName',
+                                          'serviceName', 'price', 'status'], 'dateTime'),
+    'payments': _raw('Payments', ['id', 'createdAt', 'userId', 'appointmentId', 'amount', 'currency', 'status'], 'createdAt'),
+    'pets': _raw('Pets', ['id', 'ownerId', 'name', 'species', 'breed', 'birthDate', 'isActive', 'createdAt']),
+    # aggregated reports
+    'financial': (['date', 'revenue', 'transactions', 'average'], _financial_rows),
+    'vets': (['vetId', 'name', 'appointments', 'completed', 'revenue', 'completionRate'], _vet_rows),
+    'appointments-summary': (['group', 'key', 'count'], _appointment_breakdown_rows)
+}
+
+
+def _cell(value):
+    """DynamoDB Decimals and other types to plain cell values"""
+    if value is None:
+        return ''
+    if isinstance(value, (int, float, str, bool)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+# ============================================
+#  Writers
+# ============================================
+
+class CsvExportWriter:
+    extension, content_type = 'csv', 'text/csv'
+
+    def __init__(self, fileobj, columns, title):
+        # utf-8-sig so Excel shows Polish characters correctly - VS
+        self.text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='', write_through=True)
+        self.writer = csv.writer(self.text)
+        self.writer.writerow(columns)
+
+    def write_row(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.text.flush()
+        self.text.detach()
+
+
+class JsonExportWriter:
+    extension, content_type = 'json', 'application/json'
+
+    def __init__(self, fileobj, columns, title):
+        self.fileobj = fileobj
+        self.columns = columns
+        self.first = True
+        fileobj.write(b'[')
+
+    def write_row(self, row):
+        prefix = b'' if self.first else b',\n'
+        self.first = False
+        self.fileobj.write(prefix + json.dumps(dict(zip(self.columns, row)), ensure_ascii=False, default=str).encode())
+
+    def close(self):
+        self.fileobj.write(b']')
+
+
+class XlsxExportWriter:
+    """openpyxl write-only mode keeps rows in a temp file, not in memory"""
+    extension, content_type = 'xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    def __init__(self, fileobj, columns, title):
+        self.fileobj = fileobj
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(title[:31])
+        self.sheet.append(columns)
+
+    def write_row(self, row):
+        self.sheet.append(row)
+
+    def close(self):
+        self.workbook.save(self.fileobj)
+
+
+class PdfExportWriter:
+    """Simple paginated table; rows are drawn as they arrive"""
+    extension, content_type = 'pdf', 'application/pdf'
+    FONT_SIZE, LINE_HEIGHT, MARGIN = 8, 12, 30
+
+    def __init__(self, fileobj, columns, title):
+        self.font = 'Helvetica'
+        if os.path.exists(PDF_FONT_PATH):
+            # Helvetica has no Polish glyphs - VS
+            pdfmetrics.registerFont(TTFont('DejaVuSans', PDF_FONT_PATH))
+            self.font = 'DejaVuSans'
+        self.width, self.height = landscape(A4)
+        self.canvas = canvas.Canvas(fileobj, pagesize=(self.width, self.height))
+        self.canvas.setTitle(title)
+        self.columns = columns
+        self.title = title
+        self.col_width = (self.width - 2 * self.MARGIN) / len(columns)
+        self.rows = 0
+        self.page = 0
+        self._new_page()
+
+    def _new_page(self):
+        if self.page:
+            self.canvas.showPage()
+        self.page += 1
+        self.y = self.height - self.MARGIN
+        self.canvas.setFont(self.font, 11)
+        self.canvas.drawString(self.MARGIN, self.y, f"{self.title} - {self.page}")
+        self.y -= self.LINE_HEIGHT * 2
+        self._draw(self.columns)
+        self.canvas.line(self.MARGIN, self.y + 8, self.width - self.MARGIN, self.y + 8)
+        self.y -= 4
+
+    def _draw(self, values):
+        self.canvas.setFont(self.font, self.FONT_SIZE)
+        max_chars = int(self.col_width / (self.FONT_SIZE * 0.5))
+        for i, value in enumerate(values):
+            text = str(value)
+            if len(text) > max_chars:
+                text = text[:max_chars - 1] + '…'
+            self.canvas.drawString(self.MARGIN + i * self.col_width, self.y, text)
+        self.y -= self.LINE_HEIGHT
+
+    def write_row(self, row):
+        self.rows += 1
+        if self.rows > EXPORT_PDF_MAX_ROWS:
+            raise ValueError(f"PDF export limited to {EXPORT_PDF_MAX_ROWS} rows, use CSV or XLSX")
+        if self.y < self.MARGIN:
+            self._new_page()
+        self._draw(row)
+
+    def close(self):
+        self.canvas.save()
+
+
+WRITERS = {'csv': CsvExportWriter, 'json': JsonExportWriter}
+if OPENPYXL_AVAILABLE:
+    WRITERS['xlsx'] = XlsxExportWriter
+if REPORTLAB_AVAILABLE:
+    WRITERS['pdf'] = PdfExportWriter
+
+
+# ============================================
+#  Jobs
+# ============================================
+
+class ExportJobs:
+    """
+    Kolejka zadań eksportu - VS
+
+    Żądanie tylko zakłada zadanie; worker czyta wiersze z warstwy agregacji
+    (generator), zapisuje je formatem do pliku tymczasowego (w pamięci do
+    EXPORT_SPOOL_BYTES, dalej na dysku) i wysyła do S3 uploadem multipart.
+    """
+
+    def __init__(self, engine, s3_client, bucket, jobs=None, workers=EXPORT_WORKERS):
+        self.engine = engine
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.jobs = jobs if jobs is not None else {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export')
+
+    def submit(self, report_type, format_type, params):
+        """Validate and enqueue, returns the job or raises ValueError"""
+        if report_type not in EXPORT_TYPES:
+            raise ValueError(f"Unknown report type: {report_type} (available: {', '.join(EXPORT_TYPES)})")
+        if format_type not in WRITERS:
+            raise ValueError(f"Unsupported format: {format_type} (available: {', '.join(WRITERS)})")
+
+        period = period_bounds(params.get('dateFrom'), params.get('dateTo'))
+        group_by = params.get('groupBy') if params.get('groupBy') in ('day', 'week', 'month') else 'day'
+        job = {
+            'id': str(uuid.uuid4()),
+            'type': report_type,
+            'format': format_type,
+            'params': {'period': period, 'groupBy': group_by, 'vetId': params.get('vetId')},
+            'status': 'queued',
+            'rows': 0,
+            'createdAt': datetime.utcnow().isoformat()
+        }
+        with self.lock:
+            self._purge()
+            self.jobs[job['id']] = job
+        self.executor.submit(self._run, job)
+        return job
+
+    def _purge(self):
+        oldest = (datetime.utcnow() - timedelta(hours=EXPORT_JOB_TTL_HOURS)).isoformat()
+        for job_id in [j['id'] for j in self.jobs.values() if j['createdAt'] < oldest]:
+            del self.jobs[job_id]
+
+    def _run(self, job):
+        job.update(status='running', startedAt=datetime.utcnow().isoformat())
+        columns, rows = EXPORT_TYPES[job['type']]
+        writer_class = WRITERS[job['format']]
+        title = f"report_{job['type']}_{datetime.utcnow().strftime('%Y%m%d')}"
+        key = f"reports/exports/{job['id']}/{title}.{writer_class.extension}"
+        try:
+            with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as spool:
+                writer = writer_class(spool, columns, title)
+                for row in rows(self.engine, job['params']):
+                    writer.write_row([_cell(value) for value in row])
+                    job['rows'] += 1
+                writer.close()
+                job['size'] = spool.tell()
+                spool.seek(0)
+                # upload_fileobj switches to parallel multipart for large files - VS
+                self.s3_client.upload_fileobj(
+                    spool, self.bucket, key,
+                    ExtraArgs={
+                        'ContentType': writer_class.content_type,
+                        'ContentDisposition': f'attachment; filename="{title}.{writer_class.extension}"'
+                    }
+                )
+            job.update(status='completed', s3Key=key, fileName=f"{title}.{writer_class.extension}",
+                       completedAt=datetime.utcnow().isoformat())
+            logger.info(f"Export {job['id']} completed: {job['rows']} rows, {job['size']} bytes")
+        except Exception as e:
+            logger.error(f"Export {job['id']} failed: {e}")
+            job.update(status='failed', error=str(e), completedAt=datetime.utcnow().isoformat())
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def describe(self, job):
+        """Public view of a job, with a download URL once completed"""
+        result = {k: v for k, v in job.items() if k not in ('params', 's3Key')}
+        result['period'] = {'from': job['params']['period'][0], 'to': job['params']['period'][1],
+                            'groupBy': job['params']['groupBy']}
+        if job['status'] == 'completed':
+            result['downloadUrl'] = self.s3_client.generate_presigned_url(
+                'get_object', Params={'Bucket': self.bucket, 'Key': job['s3Key']}, ExpiresIn=EXPORT_URL_EXPIRES
+            )
+        return result
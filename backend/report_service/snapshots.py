@@ -0,0 +1,372 @@
+"""
+PetCareApp - Columnar Report Snapshots
+Kolumnowe snapshoty (NumPy) tabel Appointments, Payments i Pets dla raportów
+@author VS
+"""
+
+import os
+import time
+import logging
+import threading
+from array import array
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from aggregation import (
+    DAY_NAMES, SPECIES_NAMES, AGE_RANGES,
+    parse_dt, to_number, bucket
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.getenv('REPORT_SNAPSHOT_DIR', '/app/data/snapshots')
+SNAPSHOT_HOUR = int(os.getenv('REPORT_SNAPSHOT_HOUR', 2))  # UTC
+
+EPOCH = datetime(1970, 1, 1)
+MISSING = -1
+
+
+def epoch_seconds(value):
+    dt = parse_dt(value)
+    return int((dt - EPOCH).total_seconds()) if dt else MISSING
+
+
+class Dictionary:
+    """Dictionary encoding of a text column - values are stored as int32 codes"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, value):
+        value = '' if value is None else str(value)
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class TableBuilder:
+    """Streams items into compact typed columns (stdlib arrays), no per-row dicts kept"""
+
+    def __init__(self, numeric=(), times=(), text=(), flags=()):
+        self.columns = {}
+        for name in numeric:
+            self.columns[name] = (array('d'), lambda v: to_number(v))
+        for name in times:
+            self.columns[name] = (array('q'), epoch_seconds)
+        for name in flags:
+            self.columns[name] = (array('b'), lambda v: 0 if v is False else 1)
+        self.dictionaries = {name: Dictionary() for name in text}
+        for name, dictionary in self.dictionaries.items():
+            self.columns[name] = (array('i'), dictionary.encode)
+        self.rows = 0
+
+    def add(self, item):
+        for name, (column, convert) in self.columns.items():
+            column.append(convert(item.get(name)))
+        self.rows += 1
+
+    def arrays(self, sort_by):
+        """Columns as NumPy arrays sorted by `sort_by`, plus dictionaries"""
+        data = {name: np.frombuffer(column, dtype=column.typecode).copy() for name, (column, _) in self.columns.items()}
+        order = np.argsort(data[sort_by], kind='stable')
+        data = {name: values[order] for name, values in data.items()}
+        for name, dictionary in self.dictionaries.items():
+            data[f"dict__{name}"] = np.array(dictionary.values, dtype=str)
+        return data
+
+
+class Snapshot:
+    """One loaded table: sorted columns + dictionaries"""
+
+    def __init__(self, data, sort_by):
+        self.sort_by = sort_by
+        self.columns = {k: v for k, v in data.items() if not k.startswith('dict__')}
+        self.dictionaries = {k[6:]: list(v) for k, v in data.items() if k.startswith('dict__')}
+
+    def __len__(self):
+        return len(self.columns[self.sort_by])
+
+    def slice(self, start=None, end=None):
+        """Row range with sort column in [start, end) - binary search on the sorted column"""
+        values = self.columns[self.sort_by]
+        lo = np.searchsorted(values, epoch_seconds(start), 'left') if start else 0
+        hi = np.searchsorted(values, epoch_seconds(end), 'left') if end else len(values)
+        return {name: column[lo:hi] for name, column in self.columns.items()}
+
+    def code(self, column, value):
+        try:
+            return self.dictionaries[column].index(value)
+        except ValueError:
+            return None
+
+    def group_counts(self, column, codes, weights=None, default=''):
+        """[(value, count, weight sum)] over dictionary codes"""
+        values = self.dictionaries[column]
+        counts = np.bincount(codes, minlength=len(values))
+        sums = np.bincount(codes, weights=weights, minlength=len(values)) if weights is not None else counts
+        return [(values[i] or default, int(counts[i]), float(sums[i])) for i in np.nonzero(counts)[0]]
+
+
+def _rows(groups, key_name, total, order=None, value_name=None):
+    groups = list(groups)
+    if order is not None:
+        rank = {k: i for i, k in enumerate(order)}
+        groups.sort(key=lambda g: rank.get(g[0], len(rank)))
+    else:
+        groups.sort(key=lambda g: -g[1])
+    rows = []
+    for key, count, value in groups:
+        row = {key_name: key, 'count': count, 'percentage': round(count / total * 100, 1) if total else 0}
+        if value_name:
+            row[value_name] = round(value, 2)
+        rows.append(row)
+    return rows
+
+
+def _period_groups(seconds, weights, group_by):
+    """Group by day/week/month: unique days via NumPy, labels only for distinct days"""
+    days = seconds // 86400
+    unique_days, inverse = np.unique(days, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(unique_days))
+    sums = np.bincount(inverse, weights=weights, minlength=len(unique_days))
+    merged = {}
+    for day, count, total in zip(unique_days, counts, sums):
+        label = bucket(EPOCH + timedelta(days=int(day)), group_by)
+        entry = merged.setdefault(label, [0, 0.0])
+        entry[0] += int(count)
+        entry[1] += float(total)
+    return sorted(merged.items())
+
+
+class SnapshotStore:
+    """
+    Kolumnowe snapshoty tabel raportowych - VS
+
+    Budowane nocą (lub na żądanie) pełnym skanem i zapisywane jako .npz.
+    Zapytania raportowe to wektorowe group-by (bincount) na posortowanych
+    po czasie kolumnach - zakres dat to dwa wyszukiwania binarne, bez
+    odczytów z DynamoDB.
+    """
+
+    TABLES = {
+        'appointments': {
+            'source': 'Appointments', 'sort_by': 'dateTime',
+            'times': ('dateTime',), 'numeric': ('price',),
+            'text': ('vetId', 'serviceName', 'status')
+        },
+        'payments': {
+            'source': 'Payments', 'sort_by': 'createdAt',
+            'times': ('createdAt',), 'numeric': ('amount',), 'text': ('status',)
+        },
+        'pets': {
+            'source': 'Pets', 'sort_by': 'createdAt',
+            'times': ('createdAt', 'birthDate'), 'text': ('species',), 'flags': ('isActive',)
+        }
+    }
+
+    def __init__(self, engine, directory=SNAPSHOT_DIR):
+        self.engine = engine
+        self.directory = directory
+        self.snapshots = {}
+        self.built_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def available(self):
+        return NUMPY_AVAILABLE and len(self.snapshots) == len(self.TABLES)
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.npz")
+
+    def build(self):
+        """Full export of the source tables into columnar files"""
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("NumPy not installed")
+        os.makedirs(self.directory, exist_ok=True)
+        started = time.time()
+        loaded = {}
+        for name, spec in self.TABLES.items():
+            builder = TableBuilder(spec.get('numeric', ()), spec.get('times', ()), spec.get('text', ()), spec.get('flags', ()))
+            fields = list(builder.columns)
+            for item in self.engine.scan(spec['source'], fields):
+                builder.add(item)
+            data = builder.arrays(spec['sort_by'])
+            tmp_path = os.path.join(self.directory, f"{name}.tmp.npz")
+            np.savez_compressed(tmp_path, **data)
+            os.replace(tmp_path, self._path(name))
+            loaded[name] = Snapshot(data, spec['sort_by'])
+        with self.lock:
+            self.snapshots = loaded
+            self.built_at = datetime.utcnow().isoformat()
+        logger.info(f"Report snapshots built in {time.time() - started:.1f}s: "
+                    f"{ {name: len(s) for name, s in loaded.items()} }")
+        return self.status()
+
+    def load(self):
+        """Load snapshots written by a previous run (e.g. after restart)"""
+        if not NUMPY_AVAILABLE:
+            return False
+        try:
+            loaded = {}
+            for name, spec in self.TABLES.items():
+                with np.load(self._path(name), allow_pickle=False) as data:
+                    loaded[name] = Snapshot(dict(data), spec['sort_by'])
+            with self.lock:
+                self.snapshots = loaded
+                self.built_at = datetime.utcfromtimestamp(os.path.getmtime(self._path('appointments'))).isoformat()
+            return True
+        except (OSError, ValueError) as e:
+            logger.info(f"No report snapshot loaded: {e}")
+            return False
+
+    def status(self):
+        return {
+            'available': self.available,
+            'numpy': NUMPY_AVAILABLE,
+            'builtAt': self.built_at,
+            'rows': {name: len(s) for name, s in self.snapshots.items()}
+        }
+
+    # --- reports ---
+
+    def appointments(self, period, vet_id=None, group_by='day'):
+        snap = self.snapshots['appointments']
+        cols = snap.slice(*period)
+        if vet_id:
+            code = snap.code('vetId', vet_id)
+            mask = cols['vetId'] == (code if code is not None else -1)
+            cols = {name: column[mask] for name, column in cols.items()}
+
+        seconds = cols['dateTime']
+        total = len(seconds)
+        completed_code = snap.code('status', 'completed')
+        revenue = np.where(cols['status'] == completed_code, cols['price'], 0.0)
+
+        weekday = ((seconds // 86400) + 3) % 7  # 1970-01-01 was a Thursday
+        weekday_counts = np.bincount(weekday, minlength=7)
+        hour_counts = np.bincount((seconds // 3600) % 24, minlength=24)
+
+        return {
+            'total': total,
+            'byStatus': [
+                {k: row[k] for k in ('status', 'count', 'percentage')}
+                for row in _rows(snap.group_counts('status', cols['status'], default='unknown'), 'status', total)
+            ],
+            'byService': [
+                {'service': row['service'], 'count': row['count'], 'revenue': row['revenue']}
+                for row in _rows(snap.group_counts('serviceName', cols['serviceName'], revenue, 'Inne'), 'service', total, value_name='revenue')
+            ],
+            'byDayOfWeek': [
+                {'day': DAY_NAMES[d], 'count': int(weekday_counts[d])} for d in range(7) if weekday_counts[d]
+            ],
+            'byHour': [{'hour': f"{h:02d}:00", 'count': int(hour_counts[h])} for h in range(24) if hour_counts[h]],
+            'byPeriod': [
+                {'date': label, 'count': count}
+                for label, (count, _) in _period_groups(seconds, None, group_by)
+            ],
+            'source': 'snapshot',
+            'snapshotAt': self.built_at
+        }
+
+    def financial(self, period, group_by='day'):
+        snap = self.snapshots['payments']
+        cols = snap.slice(*period)
+        completed = cols['status'] == snap.code('status', 'completed')
+        amounts = cols['amount'][completed]
+        data = [
+            {'date': label, 'revenue': round(total, 2), 'transactions': count,
+             'average': round(total / count, 2) if count else 0}
+            for label, (count, total) in _period_groups(cols['createdAt'][completed], amounts, group_by)
+        ]
+        revenue, transactions = float(amounts.sum()), int(len(amounts))
+        return {
+            'data': data,
+            'byStatus': [
+                {'status': status, 'count': count, 'amount': round(amount, 2)}
+                for status, count, amount in sorted(
+                    snap.group_counts('status', cols['status'], cols['amount'], 'unknown'), key=lambda g: -g[1])
+            ],
+            'totals': {
+                'revenue': round(revenue, 2),
+                'transactions': transactions,
+                'average': round(revenue / transactions, 2) if transactions else 0
+            },
+            'source': 'snapshot',
+            'snapshotAt': self.built_at
+        }
+
+    def patients(self, period=None):
+        snap = self.snapshots['pets']
+        cols = snap.columns
+        active = cols['isActive'] == 1
+        species_names = [SPECIES_NAMES.get(s, 'Inne') for s in snap.dictionaries['species']]
+
+        species_counts = {}
+        for code, count in enumerate(np.bincount(cols['species'][active], minlength=len(species_names))):
+            if count:
+                species_counts[species_names[code]] = species_counts.get(species_names[code], 0) + int(count)
+        active_total = int(active.sum())
+
+        birth = cols['birthDate'][active]
+        birth = birth[birth != MISSING]
+        ages = (time.time() - birth) / (365.25 * 86400)
+        limits = [limit for limit, _ in AGE_RANGES if limit is not None]
+        age_counts = np.bincount(np.digitize(ages, limits), minlength=len(AGE_RANGES))
+
+        created = cols['createdAt'][cols['createdAt'] != MISSING]
+        per_month = _period_groups(created, None, 'month')
+
+        return {
+            'total': len(snap),
+            'active': active_total,
+            'bySpecies': _rows(((k, v, 0) for k, v in species_counts.items()), 'species', active_total),
+            'byAge': [
+                {'range': label, 'count': int(age_counts[i])}
+                for i, (_, label) in enumerate(AGE_RANGES) if age_counts[i]
+            ],
+            'newPatientsPerMonth': [{'month': label, 'count': count} for label, (count, _) in per_month],
+            'source': 'snapshot',
+            'snapshotAt': self.built_at
+        }
+
+
+class SnapshotScheduler:
+    """Rebuilds snapshots every night at REPORT_SNAPSHOT_HOUR (UTC) - VS"""
+
+    def __init__(self, store, hour=SNAPSHOT_HOUR):
+        self.store = store
+        self.hour = hour
+        self._stop = threading.Event()
+        self._thread = None
+
+    def seconds_until_next_run(self, now=None):
+        now = now or datetime.utcnow()
+        next_run = now.replace(hour=self.hour, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return (next_run - now).total_seconds()
+
+    def _loop(self):
+        while not self._stop.wait(self.seconds_until_next_run()):
+            try:
+                self.store.build()
+            except Exception as e:
+                logger.error(f"Snapshot build error: {e}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='report-snapshots', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+PetCareApp - Audit Day Buckets Backfill
+Uzupełnienie atrybutu `day` w logach audytu zapisanych przed wprowadzeniem partycji dziennych
+@author VS
+"""
+
+import argparse
+import os
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+
+AWS_REGION = os.getenv('AWS_REGION', 'eu-north-1')
+DYNAMODB_ENDPOINT = os.getenv('DYNAMODB_ENDPOINT') or None
+
+
+def backfill(table_name, dry_run=False):
+    """Jednorazowy skan - tylko logi bez `day`, więc ponowne uruchomienie jest tanie - VS"""
+    table = boto3.resource('dynamodb', region_name=AWS_REGION, endpoint_url=DYNAMODB_ENDPOINT).Table(table_name)
+    kwargs = {
+        'FilterExpression': Attr('day').not_exists() & Attr('timestamp').exists(),
+        'ProjectionExpression': 'id, #ts',
+        'ExpressionAttributeNames': {'#ts': 'timestamp'}
+    }
+    updated = 0
+    while True:
+        response = table.scan(**kwargs)
+        for item in response.get('Items', []):
+            if not dry_run:
+                table.update_item(
+                    Key={'id': item['id']},
+                    UpdateExpression='SET #day = :day',
+                    ExpressionAttributeNames={'#day': 'day'},
+                    ExpressionAttributeValues={':day': item['timestamp'][:10]}
+                )
+            updated += 1
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    print(f"{'Would update' if dry_run else 'Updated'} {updated} audit logs in {table_name}")
+    return updated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill day buckets of audit logs')
+    parser.add_argument('--table', default=os.getenv('AUDIT_TABLE', 'PetCareApp-AuditLogs'))
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    backfill(args.table, args.dry_run)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+PetCareApp - Gateway Smoke Test
+Porównanie bramy nginx przed/po zmianach: opóźnienia, transfer, kompresja, cache
+@author VS
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+import requests
+
+# Idempotentne GET-y pobierane przy każdym ładowaniu aplikacji - VS
+DEFAULT_PATHS = [
+    '/api/v1/pets/species',
+    '/api/v1/payments/services',
+    '/api/v1/alerts/diseases',
+    '/api/v1/appointments/available-slots',
+]
+
+
+def run(base_url, paths, requests_per_path, token=None, verify=True):
+    """Pomiar jednej bramy - jedna sesja (keep-alive) jak w przeglądarce - VS"""
+    session = requests.Session()
+    session.verify = verify
+    headers = {'Accept-Encoding': 'gzip'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+
+    latencies, wire_bytes = [], 0
+    statuses, cache_statuses, gzip_count = {}, {}, 0
+    etags = {}
+
+    for path in paths:
+        for _ in range(requests_per_path):
+            request_headers = dict(headers)
+            if path in etags:
+                request_headers['If-None-Match'] = etags[path]
+
+            start = time.perf_counter()
+            response = session.get(base_url + path, headers=request_headers, stream=True, timeout=30)
+            raw = response.raw.read(decode_content=False)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            wire_bytes += len(raw)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            cache_status = response.headers.get('X-Cache-Status', '-')
+            cache_statuses[cache_status] = cache_statuses.get(cache_status, 0) + 1
+            if response.headers.get('Content-Encoding') == 'gzip':
+                gzip_count += 1
+            if response.headers.get('ETag'):
+                etags[path] = response.headers['ETag']
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'p50_ms': statistics.median(latencies),
+        'p95_ms': latencies[max(0, int(len(latencies) * 0.95) - 1)],
+        'total_ms': sum(latencies),
+        'wire_bytes': wire_bytes,
+        'gzip_responses': gzip_count,
+        'statuses': statuses,
+        'cache': cache_statuses,
+    }
+
+
+def print_report(name, result):
+    print(f"\n{name}")
+    print(f"  requests:      {result['requests']}")
+    print(f"  p50 / p95:     {result['p50_ms']:.1f} ms / {result['p95_ms']:.1f} ms")
+    print(f"  total time:    {result['total_ms']:.0f} ms")
+    print(f"  bytes on wire: {result['wire_bytes']}")
+    print(f"  gzip:          {result['gzip_responses']}")
+    print(f"  statuses:      {result['statuses']}")
+    print(f"  cache:         {result['cache']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Smoke test / benchmark bramy nginx')
+    parser.add_argument('candidate', help='URL bramy po zmianach, np. https://localhost')
+    parser.add_argument('--baseline', help='URL bramy przed zmianami (opcjonalnie)')
+    parser.add_argument('--path', action='append', dest='paths', help='ścieżka do odpytania (można powtarzać)')
+    parser.add_argument('-n', '--requests', type=int, default=50, help='liczba żądań na ścieżkę')
+    parser.add_argument('--token', help='token JWT dla endpointów wymagających autoryzacji')
+    parser.add_argument('--insecure', action='store_true', help='nie weryfikuj certyfikatu TLS')
+    args = parser.parse_args()
+
+    if args.insecure:
+        requests.packages.urllib3.disable_warnings()
+    paths = args.paths or DEFAULT_PATHS
+
+    candidate = run(args.candidate.rstrip('/'), paths, args.requests, args.token, not args.insecure)
+    print_report(f"Candidate: {args.candidate}", candidate)
+
+    failed = sum(count for status, count in candidate['statuses'].items() if status >= 500)
+
+    if args.baseline:
+        baseline = run(args.baseline.rstrip('/'), paths, args.requests, args.token, not args.insecure)
+        print_report(f"Baseline: {args.baseline}", baseline)
+        print("\nDifference (candidate vs baseline)")
+        for key in ('p50_ms', 'p95_ms', 'total_ms', 'wire_bytes'):
+            before, after = baseline[key], candidate[key]
+            change = (after - before) / before * 100 if before else 0
+            print(f"  {key:<12} {before:>12.1f} -> {after:>12.1f} ({change:+.1f}%)")
+
+    if failed:
+        print(f"\n❌ {failed} responses with 5xx status")
+        sys.exit(1)
+    print("\n✅ Smoke test passed")
+
+
+if __name__ == '__main__':
+    main()
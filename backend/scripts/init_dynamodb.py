@@ -191,14 +191,145 @@ TABLES = [
         'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
     },
     {
+        # Partycje dzienne (`day`) i indeksy filtrów, wszystkie sortowane po timestamp - VS
         'TableName': f'{TABLE_PREFIX}audit_logs',
         'KeySchema': [
             {'AttributeName': 'id', 'KeyType': 'HASH'}
         ],
         'AttributeDefinitions': [
-            {'AttributeName': 'id', 'AttributeType': 'S'}
+            {'AttributeName': 'id', 'AttributeType': 'S'},
+            {'AttributeName': 'timestamp', 'AttributeType': 'S'},
+            {'AttributeName': 'day', 'AttributeType': 'S'},
+            {'AttributeName': 'userId', 'AttributeType': 'S'},
+            {'AttributeName': 'action', 'AttributeType': 'S'},
+            {'AttributeName': 'resource', 'AttributeType': 'S'}
+        ],
+        'GlobalSecondaryIndexes': [
+            {
+                'IndexName': 'day-timestamp-index',
+                'KeySchema': [
+                    {'AttributeName': 'day', 'KeyType': 'HASH'},
+                    {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'},
+                'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+            },
+            {
+                'IndexName': 'userId-timestamp-index',
+                'KeySchema': [
+                    {'AttributeName': 'userId', 'KeyType': 'HASH'},
+                    {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'},
+                'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+            },
+            {
+                'IndexName': 'action-timestamp-index',
+                'KeySchema': [
+                    {'AttributeName': 'action', 'KeyType': 'HASH'},
+                    {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'},
+                'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+            },
+            {
+                'IndexName': 'resource-timestamp-index',
+                'KeySchema': [
+                    {'AttributeName': 'resource', 'KeyType': 'HASH'},
+                    {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'},
+                'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+            }
+        ],
+        'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+    },
+    {
+        # Dzienne liczniki audytu (audit_service/stats.py), atrybut na licznik - VS
+        'TableName': f'{TABLE_PREFIX}audit_stats',
+        'KeySchema': [
+            {'AttributeName': 'day', 'KeyType': 'HASH'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'day', 'AttributeType': 'S'}
         ],
         'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+    },
+    {
+        # Dzienne liczniki raportów (shared/rollups.py), sk = "<dzień>#<wymiar>" - VS
+        'TableName': f'{TABLE_PREFIX}report_rollups',
+        'KeySchema': [
+            {'AttributeName': 'month', 'KeyType': 'HASH'},
+            {'AttributeName': 'sk', 'KeyType': 'RANGE'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'month', 'AttributeType': 'S'},
+            {'AttributeName': 'sk', 'AttributeType': 'S'}
+        ],
+        'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+    },
+    {
+        # Sesje refresh tokenów (auth_service/sessions.py), wygasają przez TTL - VS
+        'TableName': f'{TABLE_PREFIX}auth_sessions',
+        'KeySchema': [
+            {'AttributeName': 'sid', 'KeyType': 'HASH'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'sid', 'AttributeType': 'S'},
+            {'AttributeName': 'email', 'AttributeType': 'S'}
+        ],
+        'GlobalSecondaryIndexes': [
+            {
+                'IndexName': 'email-index',
+                'KeySchema': [
+                    {'AttributeName': 'email', 'KeyType': 'HASH'}
+                ],
+                'Projection': {
+                    'ProjectionType': 'INCLUDE',
+                    'NonKeyAttributes': ['expiresAt', 'revokedAt']
+                },
+                'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+            }
+        ],
+        'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5},
+        'TimeToLive': 'expiresAt'
+    },
+    {
+        # Kolejka e-maili (shared/email_outbox.py), rzadki indeks oczekujących/martwych - VS
+        'TableName': f'{TABLE_PREFIX}email_outbox',
+        'KeySchema': [
+            {'AttributeName': 'id', 'KeyType': 'HASH'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'id', 'AttributeType': 'S'},
+            {'AttributeName': 'queueStatus', 'AttributeType': 'S'},
+            {'AttributeName': 'nextAttemptAt', 'AttributeType': 'N'}
+        ],
+        'GlobalSecondaryIndexes': [
+            {
+                'IndexName': 'queueStatus-nextAttemptAt-index',
+                'KeySchema': [
+                    {'AttributeName': 'queueStatus', 'KeyType': 'HASH'},
+                    {'AttributeName': 'nextAttemptAt', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'},
+                'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+            }
+        ],
+        'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5},
+        'TimeToLive': 'expiresAt'
+    },
+    {
+        # Lista unieważnionych tokenów/sesji (shared/revocation.py) - VS
+        'TableName': f'{TABLE_PREFIX}revoked_tokens',
+        'KeySchema': [
+            {'AttributeName': 'id', 'KeyType': 'HASH'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'id', 'AttributeType': 'S'}
+        ],
+        'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5},
+        'TimeToLive': 'expiresAt'
     }
 ]
 
@@ -233,12 +364,20 @@ def create_tables():
         
         try:
             print(f"  📦 Creating table {table_name}...")
+            table_def = dict(table_def)
+            ttl_attribute = table_def.pop('TimeToLive', None)
             dynamodb.create_table(**table_def)
             
             # Poczekaj na aktywację tabeli - VS
             waiter = dynamodb.get_waiter('table_exists')
             waiter.wait(TableName=table_name)
             
+            if ttl_attribute:
+                dynamodb.update_time_to_live(
+                    TableName=table_name,
+                    TimeToLiveSpecification={'Enabled': True, 'AttributeName': ttl_attribute}
+                )
+            
             print(f"  ✅ Table {table_name} created successfully")
             created += 1
             
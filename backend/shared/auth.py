@@ -0,0 +1,286 @@
+"""
+PetCareApp - Shared Authentication
+Lokalna weryfikacja tokenów JWT (HS256 z auth_service, RS256 z Cognito) we wszystkich serwisach
+@author VS
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import urllib.request
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import jwt
+from flask import g, jsonify, request
+
+try:
+    from jwt.algorithms import RSAAlgorithm, has_crypto
+except ImportError:
+    has_crypto = False
+
+from .revocation import RevocationList, get_revocations
+
+logger = logging.getLogger(__name__)
+
+JWT_SECRET = os.getenv('JWT_SECRET', 'petcareapp-secret-key-2025')
+AWS_REGION = os.getenv('AWS_REGION', 'eu-north-1')
+COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID', '')
+COGNITO_CLIENT_ID = os.getenv('COGNITO_CLIENT_ID', '')
+
+# Domyślnie tak jak wcześniej: brak tokenu blokowany tylko na produkcji - VS
+AUTH_REQUIRED = os.getenv('AUTH_REQUIRED', str(os.getenv('APP_ENV') == 'production')).lower() == 'true'
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 4096))
+AUTH_JWKS_TTL = int(os.getenv('AUTH_JWKS_TTL', 3600))
+# Nieznany `kid` wymusza odświeżenie JWKS (rotacja kluczy), ale nie częściej niż co tyle sekund - VS
+AUTH_JWKS_MIN_REFRESH = int(os.getenv('AUTH_JWKS_MIN_REFRESH', 30))
+
+PUBLIC_PATHS = ('/api/v1/health', '/health')
+
+
+class AuthError(Exception):
+    """Brak lub niepoprawny token - VS"""
+
+
+class JwksCache:
+    """Klucze publiczne puli Cognito, pobierane raz na AUTH_JWKS_TTL - VS"""
+
+    def __init__(self, url: str, ttl: int = AUTH_JWKS_TTL, min_refresh: int = AUTH_JWKS_MIN_REFRESH):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self.keys: Dict[str, Any] = {}
+        self.fetched_at = 0.0
+        self.lock = threading.Lock()
+
+    def _refresh(self) -> None:
+        self.fetched_at = time.monotonic()
+        try:
+            with urllib.request.urlopen(self.url, timeout=5) as response:
+                jwks = json.loads(response.read())
+            self.keys = {
+                jwk['kid']: RSAAlgorithm.from_jwk(json.dumps(jwk))
+                for jwk in jwks.get('keys', []) if jwk.get('kty') == 'RSA'
+            }
+            logger.info(f"JWKS refreshed: {len(self.keys)} keys")
+        except Exception as e:
+            # Stare klucze zostają - lepsze niż odrzucanie wszystkich tokenów - VS
+            logger.error(f"JWKS refresh failed: {e}")
+
+    def get(self, kid: Optional[str]) -> Any:
+        age = time.monotonic() - self.fetched_at
+        if age > self.ttl or (kid not in self.keys and age > self.min_refresh):
+            with self.lock:
+                age = time.monotonic() - self.fetched_at
+                if age > self.ttl or (kid not in self.keys and age > self.min_refresh):
+                    self._refresh()
+        key = self.keys.get(kid)
+        if key is None:
+            raise AuthError('Unknown signing key')
+        return key
+
+
+def normalize_claims(claims: Dict[str, Any]) -> Dict[str, Any]:
+    """Jeden kształt użytkownika dla tokenów auth_service i Cognito - VS"""
+    groups = claims.get('cognito:groups') or []
+    return {
+        'id': claims.get('id') or claims.get('sub'),
+        'email': claims.get('email') or claims.get('username'),
+        'firstName': claims.get('firstName') or claims.get('given_name'),
+        'lastName': claims.get('lastName') or claims.get('family_name'),
+        'role': claims.get('role') or claims.get('custom:role') or (groups[0] if groups else 'client'),
+        'exp': claims.get('exp'),
+        'jti': claims.get('jti'),
+        # Cognito: origin_jti is shared by all tokens of one sign-in session - VS
+        'sid': claims.get('sid') or claims.get('origin_jti')
+    }
+
+
+class TokenVerifier:
+    """
+    Weryfikacja bez zapytań do auth_service - VS
+
+    HS256 - wspólny JWT_SECRET; RS256 - klucze z JWKS puli Cognito (cache
+    z obsługą rotacji). Zweryfikowane tokeny trafiają do małego LRU
+    (klucz: SHA-256 tokenu, nie sam token) aż do swojego `exp`, więc
+    kolejne żądania z tym samym tokenem kosztują jeden odczyt ze słownika.
+    Unieważnienie (`jti` lub `sid`) sprawdzane jest w filtrze Blooma listy
+    unieważnień, także dla tokenów z cache - ponownie tylko po zmianie listy.
+    """
+
+    def __init__(self, secret: str = JWT_SECRET, user_pool_id: str = COGNITO_USER_POOL_ID,
+                 client_id: str = COGNITO_CLIENT_ID, region: str = AWS_REGION,
+                 cache_size: int = AUTH_TOKEN_CACHE_SIZE, revocations: Optional[RevocationList] = None):
+        self.secret = secret
+        self.revocations = revocations
+        self.client_id = client_id
+        self.issuer = f"https://cognito-idp.{region}.amazonaws.com/{user_pool_id}" if user_pool_id else None
+        self.jwks = None
+        if self.issuer and has_crypto:
+            self.jwks = JwksCache(f"{self.issuer}/.well-known/jwks.json")
+        elif self.issuer:
+            logger.warning("cryptography not installed - Cognito (RS256) tokens will be rejected")
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[bytes, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Użytkownik z tokenu albo AuthError"""
+        digest = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(digest)
+            if entry and entry[1] > now:
+                self._cache.move_to_end(digest)
+                self.stats['hits'] += 1
+            else:
+                entry = None
+
+        if entry is None:
+            user = self._decode(token)
+            # [user, expires, revocation list version it was last checked at] - VS
+            entry = [user, user.get('exp') or now + 60, None]
+            with self._lock:
+                self.stats['misses'] += 1
+                self._cache[digest] = entry
+                self._cache.move_to_end(digest)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        if self.revocations and entry[2] != self.revocations.version:
+            version = self.revocations.version
+            if self.revocations.is_revoked(entry[0]):
+                raise AuthError('Token revoked')
+            entry[2] = version
+        return entry[0]
+
+    def _decode(self, token: str) -> Dict[str, Any]:
+        try:
+            header = jwt.get_unverified_header(token)
+            algorithm = header.get('alg')
+            if algorithm == 'HS256':
+                claims = jwt.decode(token, self.secret, algorithms=['HS256'])
+                if claims.get('type') == 'refresh':
+                    raise AuthError('Refresh token cannot be used for API access')
+            elif algorithm == 'RS256' and self.jwks:
+                key = self.jwks.get(header.get('kid'))
+                claims = jwt.decode(token, key, algorithms=['RS256'], issuer=self.issuer,
+                                    options={'verify_aud': False})
+                self._check_cognito_client(claims)
+            else:
+                raise AuthError(f"Unsupported token algorithm: {algorithm}")
+        except jwt.ExpiredSignatureError:
+            raise AuthError('Token expired')
+        except jwt.InvalidTokenError as e:
+            raise AuthError(f"Invalid token: {e}")
+        return normalize_claims(claims)
+
+    def _check_cognito_client(self, claims: Dict[str, Any]) -> None:
+        """Access token ma `client_id`, ID token - `aud` - VS"""
+        token_use = claims.get('token_use')
+        if token_use not in ('access', 'id'):
+            raise AuthError('Invalid token use')
+        if self.client_id:
+            client = claims.get('client_id') if token_use == 'access' else claims.get('aud')
+            if client != self.client_id:
+                raise AuthError('Token issued for another client')
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            status = {**self.stats, 'cached': len(self._cache), 'cognito': self.jwks is not None}
+        if self.revocations:
+            status['revocations'] = self.revocations.status()
+        return status
+
+
+_verifier: Optional[TokenVerifier] = None
+
+
+def get_verifier() -> TokenVerifier:
+    global _verifier
+    if _verifier is None:
+        _verifier = TokenVerifier(revocations=get_revocations())
+    return _verifier
+
+
+def bearer_token() -> Optional[str]:
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer ') and len(header) > 7:
+        return header[7:].strip()
+    return None
+
+
+def current_user() -> Optional[Dict[str, Any]]:
+    return g.get('user')
+
+
+def _is_public(path: str, public_paths: Iterable[str]) -> bool:
+    # Ścieżka kończąca się "/" oznacza cały prefiks - VS
+    return any(path == p or (p.endswith('/') and path.startswith(p)) for p in public_paths)
+
+
+def init_auth(app, public_paths: Iterable[str] = (), required: bool = AUTH_REQUIRED,
+              verifier: Optional[TokenVerifier] = None) -> None:
+    """
+    Middleware dla całego serwisu - VS
+
+    Token (jeśli jest) jest weryfikowany przed każdym żądaniem, a użytkownik
+    trafia do `g.user`. Przy `required` żądania bez poprawnego tokenu
+    dostają 401, poza ścieżkami publicznymi (health + `public_paths`).
+    """
+    public_paths = tuple(PUBLIC_PATHS) + tuple(public_paths)
+
+    @app.before_request
+    def authenticate():
+        g.user = None
+        if request.method == 'OPTIONS':
+            return None
+        public = _is_public(request.path, public_paths)
+        token = bearer_token()
+        if token:
+            try:
+                g.user = (verifier or get_verifier()).verify(token)
+            except AuthError as e:
+                if required and not public:
+                    return jsonify({'error': str(e)}), 401
+        elif required and not public:
+            return jsonify({'error': 'Unauthorized'}), 401
+        return None
+
+
+def require_auth(f: Callable) -> Callable:
+    """Dekorator pojedynczego endpointu (dla serwisów bez init_auth) - VS"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if g.get('user') is None and bearer_token():
+            try:
+                g.user = get_verifier().verify(bearer_token())
+            except AuthError as e:
+                if AUTH_REQUIRED:
+                    return jsonify({'error': str(e)}), 401
+        if g.get('user') is None and AUTH_REQUIRED:
+            return jsonify({'error': 'Unauthorized'}), 401
+        return f(*args, **kwargs)
+    return decorated
+
+
+_service_tokens: Dict[str, tuple] = {}
+
+
+def service_headers(service: str, ttl: int = 300) -> Dict[str, str]:
+    """Nagłówek Authorization dla wywołań serwis-serwis (krótki token HS256 z rolą `service`) - VS"""
+    token, expires = _service_tokens.get(service, (None, 0))
+    if expires - time.time() < 60:
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl)
+        token = jwt.encode(
+            {'id': f"service:{service}", 'role': 'service', 'iat': now, 'exp': expires_at},
+            JWT_SECRET, algorithm='HS256'
+        )
+        _service_tokens[service] = (token, time.time() + ttl)
+    return {'Authorization': f'Bearer {token}'}
@@ -28,6 +28,28 @@ class S3Config:
     bucket_name: str = os.getenv('S3_BUCKET_NAME', 'petcareapp-files')
     region: str = os.getenv('AWS_REGION', 'eu-north-1')
 
+@dataclass
+class RedisConfig:
+    """Konfiguracja Redis (opcjonalny, wspólny cache/limity) - VS"""
+    host: str = os.getenv('REDIS_HOST', '')
+    port: int = int(os.getenv('REDIS_PORT', 6379))
+    password: Optional[str] = os.getenv('REDIS_PASSWORD', None)
+    db: int = int(os.getenv('REDIS_DB', 0))
+
+@dataclass
+class SMTPConfig:
+    """Konfiguracja SMTP (gdy SES niedostępny), pula połączeń - VS"""
+    host: str = os.getenv('SMTP_HOST', '')
+    port: int = int(os.getenv('SMTP_PORT', 587))
+    user: str = os.getenv('SMTP_USER', '')
+    password: str = os.getenv('SMTP_PASSWORD', '')
+    starttls: bool = os.getenv('SMTP_STARTTLS', 'true').lower() == 'true'
+    ssl: bool = os.getenv('SMTP_SSL', 'false').lower() == 'true'
+    timeout: float = float(os.getenv('SMTP_TIMEOUT', 30))
+    pool_size: int = int(os.getenv('SMTP_POOL_SIZE', 4))
+    max_messages_per_connection: int = int(os.getenv('SMTP_MAX_MESSAGES_PER_CONNECTION', 100))
+    idle_timeout: float = float(os.getenv('SMTP_IDLE_TIMEOUT', 60))
+
 @dataclass
 class ServiceConfig:
     """Główna konfiguracja serwisu - VS"""
@@ -6,12 +6,108 @@ Pomocnik do operacji na DynamoDB
 
 import boto3
 from botocore.exceptions import ClientError
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterator, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
 from .config import DatabaseConfig
+import os
+import queue
+import random
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
 
+SCAN_SEGMENTS = int(os.getenv('DYNAMODB_SCAN_SEGMENTS', 4))
+SCAN_MAX_RETRIES = int(os.getenv('DYNAMODB_SCAN_MAX_RETRIES', 8))
+# Maks. liczba stron (<= 1 MB) czekających między segmentami a konsumentem - VS
+SCAN_BUFFERED_PAGES = int(os.getenv('DYNAMODB_SCAN_BUFFERED_PAGES', 8))
+
+THROTTLING_ERRORS = (
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded'
+)
+
+_SEGMENT_DONE = object()
+
+# Pula wspólna dla wszystkich skanów w procesie - VS
+_scan_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('DYNAMODB_SCAN_WORKERS', 16)),
+    thread_name_prefix='dynamodb-scan'
+)
+
+
+def _scan_page(table, params: Dict[str, Any], stop: threading.Event) -> Optional[Dict[str, Any]]:
+    """Jedna strona skanu z exponential backoff + jitter przy throttlingu - VS"""
+    for attempt in range(SCAN_MAX_RETRIES + 1):
+        try:
+            return table.scan(**params)
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code not in THROTTLING_ERRORS or attempt == SCAN_MAX_RETRIES:
+                raise
+            delay = min(0.05 * (2 ** attempt), 5.0) * random.uniform(0.5, 1.0)
+            logger.warning(f"Throttling podczas skanu segmentu {params.get('Segment')}, ponowienie za {delay:.2f}s")
+            if stop.wait(delay):
+                return None
+    return None
+
+
+def parallel_scan(table, total_segments: Optional[int] = None, **scan_params) -> Iterator[Dict[str, Any]]:
+    """
+    Równoległy skan całej tabeli (Segment / TotalSegments) - VS
+
+    Segmenty są skanowane w puli wątków, strony trafiają do ograniczonej
+    kolejki, a wynik to jeden iterator po wszystkich elementach (kolejność
+    nieokreślona). Przerwanie iteracji zatrzymuje pozostałe segmenty.
+    """
+    segments = total_segments or SCAN_SEGMENTS
+    pages: queue.Queue = queue.Queue(maxsize=SCAN_BUFFERED_PAGES)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def scan_segment(segment: int) -> None:
+        params = dict(scan_params, Segment=segment, TotalSegments=segments)
+        try:
+            while not stop.is_set():
+                page = _scan_page(table, params, stop)
+                if page is None or not put(page.get('Items', [])) or 'LastEvaluatedKey' not in page:
+                    break
+                params['ExclusiveStartKey'] = page['LastEvaluatedKey']
+        except Exception as e:
+            put(e)
+        finally:
+            put(_SEGMENT_DONE)
+
+    for segment in range(segments):
+        _scan_executor.submit(scan_segment, segment)
+
+    finished = 0
+    try:
+        while finished < segments:
+            page = pages.get()
+            if page is _SEGMENT_DONE:
+                finished += 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield from page
+    finally:
+        stop.set()
+
+
+def scan_all(table, total_segments: Optional[int] = None, **scan_params) -> List[Dict[str, Any]]:
+    """Wszystkie elementy tabeli jako lista (widoki administracyjne) - VS"""
+    return list(parallel_scan(table, total_segments, **scan_params))
+
 class DynamoDBHelper:
     """Helper do operacji na DynamoDB - VS"""
     
@@ -129,6 +225,14 @@ class DynamoDBHelper:
         except ClientError as e:
             logger.error(f"Błąd skanowania: {e}")
             raise
+    
+    def scan_all(self, total_segments: Optional[int] = None, **scan_params) -> List[Dict[str, Any]]:
+        """Pełny równoległy skan tabeli - VS"""
+        try:
+            return scan_all(self.table, total_segments, **scan_params)
+        except ClientError as e:
+            logger.error(f"Błąd skanowania: {e}")
+            raise
 
 class CacheHelper:
     """Helper do operacji na Redis Cache - VS"""
@@ -158,3 +262,12 @@ class CacheHelper:
     def exists(self, key: str) -> bool:
         """Sprawdzenie czy klucz istnieje - VS"""
         return self.redis.exists(key) > 0
+
+    def incr_many(self, amounts: Dict[str, int], ttl: int = 3600) -> Dict[str, int]:
+        """Atomowe INCRBY wielu liczników z czasem życia, jeden round trip - VS"""
+        pipe = self.redis.pipeline(transaction=False)
+        for key, amount in amounts.items():
+            pipe.incrby(key, amount)
+            pipe.expire(key, ttl)
+        results = pipe.execute()
+        return dict(zip(amounts, results[::2]))
@@ -0,0 +1,354 @@
+"""
+PetCareApp - Email Outbox
+Trwała kolejka e-maili: zapis w żądaniu, wysyłka w puli workerów z ponowieniami i DLQ
+@author VS
+"""
+
+import os
+import time
+import uuid
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+EMAIL_OUTBOX_TABLE = os.getenv('EMAIL_OUTBOX_TABLE', 'PetCareApp-EmailOutbox')
+EMAIL_OUTBOX_WORKERS = int(os.getenv('EMAIL_OUTBOX_WORKERS', 4))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', 6))
+EMAIL_OUTBOX_BASE_DELAY = float(os.getenv('EMAIL_OUTBOX_BASE_DELAY', 5))
+EMAIL_OUTBOX_MAX_DELAY = float(os.getenv('EMAIL_OUTBOX_MAX_DELAY', 900))
+# A claimed message whose worker died becomes due again after the lease - VS
+EMAIL_OUTBOX_LEASE = float(os.getenv('EMAIL_OUTBOX_LEASE', 120))
+EMAIL_OUTBOX_POLL_INTERVAL = float(os.getenv('EMAIL_OUTBOX_POLL_INTERVAL', 2))
+EMAIL_OUTBOX_RETENTION_DAYS = int(os.getenv('EMAIL_OUTBOX_RETENTION_DAYS', 14))
+
+PENDING = ('queued', 'sending')
+DEDUPE_NAMESPACE = uuid.UUID('7f1b7c52-3d0e-4a52-9a55-2f5f2c1e0b6d')
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _expires_at() -> int:
+    return int(time.time()) + EMAIL_OUTBOX_RETENTION_DAYS * 86400
+
+
+# ============================================
+#  Magazyny
+# ============================================
+
+class DynamoOutboxStore:
+    """
+    Tabela `id` + rzadki GSI queueStatus-nextAttemptAt-index - VS
+
+    `queueStatus` istnieje tylko dla wiadomości oczekujących (queued,
+    sending) i martwych (dead), więc wysłane wypadają z indeksu, a
+    wyszukanie wiadomości do wysłania to jedno Query na status.
+    """
+
+    INDEX = 'queueStatus-nextAttemptAt-index'
+
+    def __init__(self, dynamodb, table_name: str = EMAIL_OUTBOX_TABLE):
+        self.table = dynamodb.Table(table_name)
+
+    def put(self, item: Dict[str, Any]) -> bool:
+        try:
+            self.table.put_item(Item=item, ConditionExpression='attribute_not_exists(id)')
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def get(self, message_id: str) -> Optional[Dict[str, Any]]:
+        return self.table.get_item(Key={'id': message_id}, ConsistentRead=True).get('Item')
+
+    def _query(self, status: str, now: Optional[int], limit: int) -> List[Dict[str, Any]]:
+        condition = Key('queueStatus').eq(status)
+        if now is not None:
+            condition = condition & Key('nextAttemptAt').lte(now)
+        response = self.table.query(IndexName=self.INDEX, KeyConditionExpression=condition, Limit=limit)
+        return response.get('Items', [])
+
+    def due(self, now: int, limit: int) -> List[str]:
+        ids = []
+        for status in PENDING:
+            ids.extend(item['id'] for item in self._query(status, now, limit - len(ids)))
+            if len(ids) >= limit:
+                break
+        return ids
+
+    def claim(self, message_id: str, now: int, lease_until: int) -> Optional[Dict[str, Any]]:
+        try:
+            return self.table.update_item(
+                Key={'id': message_id},
+                UpdateExpression='SET #s = :sending, queueStatus = :sending, nextAttemptAt = :lease, '
+                                 'attempts = attempts + :one, lastAttemptAt = :at',
+                ConditionExpression='queueStatus IN (:queued, :sending) AND nextAttemptAt <= :now',
+                ExpressionAttributeNames={'#s': 'status'},
+                ExpressionAttributeValues={':sending': 'sending', ':queued': 'queued', ':lease': lease_until,
+                                           ':one': 1, ':now': now, ':at': datetime.utcnow().isoformat()},
+                ReturnValues='ALL_NEW'
+            )['Attributes']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return None
+            raise
+
+    def update(self, message_id: str, fields: Dict[str, Any], remove: tuple = ()) -> None:
+        names = {f"#f{i}": name for i, name in enumerate(fields)}
+        values = {f":v{i}": value for i, value in enumerate(fields.values())}
+        expression = 'SET ' + ', '.join(f"{n} = {v}" for n, v in zip(names, values))
+        if remove:
+            expression += ' REMOVE ' + ', '.join(remove)
+        self.table.update_item(Key={'id': message_id}, UpdateExpression=expression,
+                               ExpressionAttributeNames=names, ExpressionAttributeValues=values)
+
+    def list(self, status: str, limit: int) -> List[Dict[str, Any]]:
+        return self._query(status, None, limit)
+
+
+class MemoryOutboxStore:
+    """Lokalny zamiennik tabeli (dev/testy) - kolejka żyje tylko w pamięci procesu"""
+
+    def __init__(self):
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+    def put(self, item: Dict[str, Any]) -> bool:
+        with self.lock:
+            if item['id'] in self.items:
+                return False
+            self.items[item['id']] = dict(item)
+            return True
+
+    def get(self, message_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            item = self.items.get(message_id)
+            return dict(item) if item else None
+
+    def due(self, now: int, limit: int) -> List[str]:
+        with self.lock:
+            due = [item for item in self.items.values()
+                   if item.get('queueStatus') in PENDING and item['nextAttemptAt'] <= now]
+        due.sort(key=lambda item: item['nextAttemptAt'])
+        return [item['id'] for item in due[:limit]]
+
+    def claim(self, message_id: str, now: int, lease_until: int) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            item = self.items.get(message_id)
+            if not item or item.get('queueStatus') not in PENDING or item['nextAttemptAt'] > now:
+                return None
+            item.update(status='sending', queueStatus='sending', nextAttemptAt=lease_until,
+                        attempts=item['attempts'] + 1, lastAttemptAt=datetime.utcnow().isoformat())
+            return dict(item)
+
+    def update(self, message_id: str, fields: Dict[str, Any], remove: tuple = ()) -> None:
+        with self.lock:
+            item = self.items[message_id]
+            item.update(fields)
+            for name in remove:
+                item.pop(name, None)
+
+    def list(self, status: str, limit: int) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [dict(item) for item in self.items.values() if item.get('queueStatus') == status][:limit]
+
+
+# ============================================
+#  Outbox
+# ============================================
+
+class EmailOutbox:
+    """
+    Kolejka wysyłki - VS
+
+    enqueue() zapisuje wiadomość (status `queued`) i od razu wraca, więc
+    czas odpowiedzi API nie zależy od dostawcy poczty. Dispatcher pobiera
+    wiadomości do wysłania, przejmuje każdą warunkowo (lease - kilka
+    instancji serwisu nie wyśle tej samej) i przekazuje do puli
+    `workers` wątków - to jednocześnie limit równoległych wysyłek.
+    Nieudana próba wraca do kolejki z wykładniczym opóźnieniem (z jitterem);
+    po `max_attempts` próbach wiadomość dostaje status `dead` (DLQ) i czeka
+    na ręczne requeue(). `sender(message)` zwraca {'success', 'message_id' | 'error'}.
+    """
+
+    def __init__(self, store, sender: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 workers: int = EMAIL_OUTBOX_WORKERS, max_attempts: int = EMAIL_OUTBOX_MAX_ATTEMPTS,
+                 base_delay: float = EMAIL_OUTBOX_BASE_DELAY, max_delay: float = EMAIL_OUTBOX_MAX_DELAY,
+                 lease: float = EMAIL_OUTBOX_LEASE, poll_interval: float = EMAIL_OUTBOX_POLL_INTERVAL):
+        self.store = store
+        self.sender = sender
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='email-outbox')
+        self.slots = threading.Semaphore(workers)
+        self.lock = threading.Lock()
+        self.stats = {'queued': 0, 'sent': 0, 'retried': 0, 'dead': 0}
+        self.busy = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- API ----------
+
+    def enqueue(self, to_email: str, subject: str, body_text: str, body_html: Optional[str] = None,
+                from_email: Optional[str] = None, dedupe_key: Optional[str] = None,
+                meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Zapis do kolejki, zwraca element outboxa. Z `dedupe_key` ta sama
+        wiadomość (np. przypomnienie o wizycie) trafia do kolejki tylko raz.
+        """
+        message = {'to_email': to_email, 'subject': subject, 'body_text': body_text}
+        if body_html:
+            message['body_html'] = body_html
+        if from_email:
+            message['from_email'] = from_email
+        item = {
+            'id': str(uuid.uuid5(DEDUPE_NAMESPACE, dedupe_key) if dedupe_key else uuid.uuid4()),
+            'status': 'queued',
+            'queueStatus': 'queued',
+            'nextAttemptAt': _now_ms(),
+            'attempts': 0,
+            'createdAt': datetime.utcnow().isoformat(),
+            'message': message
+        }
+        if meta:
+            item['meta'] = meta
+        if not self.store.put(item):
+            return self.store.get(item['id']) or item
+        with self.lock:
+            self.stats['queued'] += 1
+        self._wake.set()
+        return item
+
+    def get(self, message_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(message_id)
+
+    def list(self, status: str = 'dead', limit: int = 100) -> List[Dict[str, Any]]:
+        """Wiadomości oczekujące (queued / sending) albo martwe (dead)"""
+        return self.store.list(status, limit)
+
+    def requeue(self, message_id: str) -> Optional[Dict[str, Any]]:
+        """Ponowna wysyłka wiadomości z DLQ (licznik prób od zera)"""
+        item = self.store.get(message_id)
+        if not item or item.get('status') != 'dead':
+            return None
+        self.store.update(message_id, {'status': 'queued', 'queueStatus': 'queued', 'nextAttemptAt': _now_ms(),
+                                       'attempts': 0}, remove=('expiresAt', 'deadAt'))
+        self._wake.set()
+        return self.store.get(message_id)
+
+    # ---------- Wysyłka ----------
+
+    def _dispatch(self) -> int:
+        ids = self.store.due(_now_ms(), self.workers * 4)
+        for message_id in ids:
+            # Blocks while every worker is busy - the concurrency limit - VS
+            self.slots.acquire()
+            if self._stop.is_set():
+                self.slots.release()
+                break
+            now = _now_ms()
+            try:
+                item = self.store.claim(message_id, now, now + int(self.lease * 1000))
+            except Exception:
+                self.slots.release()
+                raise
+            if item is None:
+                self.slots.release()
+                continue
+            with self.lock:
+                self.busy += 1
+            self.executor.submit(self._attempt, item)
+        return len(ids)
+
+    def _attempt(self, item: Dict[str, Any]) -> None:
+        try:
+            try:
+                result = self.sender(item['message'])
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+            self._settle(item, result)
+        except Exception as e:
+            # Status not saved - the message is retried once its lease runs out - VS
+            logger.error(f"Email outbox error for {item['id']}: {e}")
+        finally:
+            with self.lock:
+                self.busy -= 1
+            self.slots.release()
+
+    def _settle(self, item: Dict[str, Any], result: Dict[str, Any]) -> None:
+        attempts = int(item['attempts'])
+        if result.get('success'):
+            fields = {'status': 'sent', 'sentAt': datetime.utcnow().isoformat(), 'expiresAt': _expires_at()}
+            if result.get('message_id'):
+                fields['providerMessageId'] = str(result['message_id'])
+            self.store.update(item['id'], fields, remove=('queueStatus', 'nextAttemptAt', 'lastError'))
+            stat = 'sent'
+        elif attempts >= self.max_attempts:
+            self.store.update(item['id'], {
+                'status': 'dead', 'queueStatus': 'dead', 'nextAttemptAt': _now_ms(),
+                'lastError': str(result.get('error'))[:1000], 'deadAt': datetime.utcnow().isoformat(),
+                'expiresAt': _expires_at()
+            })
+            logger.error(f"Email {item['id']} to {item['message']['to_email']} dead after {attempts} attempts: "
+                         f"{result.get('error')}")
+            stat = 'dead'
+        else:
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+            self.store.update(item['id'], {
+                'status': 'queued', 'queueStatus': 'queued', 'nextAttemptAt': _now_ms() + int(delay * 1000),
+                'lastError': str(result.get('error'))[:1000]
+            })
+            stat = 'retried'
+        with self.lock:
+            self.stats[stat] += 1
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                if self._dispatch() >= self.workers * 4:
+                    continue
+            except Exception as e:
+                logger.error(f"Email outbox dispatch error: {e}")
+            self._wake.wait(self.poll_interval)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='email-outbox', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Zatrzymanie dispatchera; rozpoczęte wysyłki są kończone"""
+        self._stop.set()
+        self._wake.set()
+        self.executor.shutdown(wait=True)
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, 'workers': self.workers, 'busy': self.busy,
+                    'durable': isinstance(self.store, DynamoOutboxStore)}
+
+
+def email_sender(service) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """Sender outboxa wysyłający przez shared EmailService (SES / SMTP / log)"""
+    def send(message: Dict[str, Any]) -> Dict[str, Any]:
+        return service.send_email(message['to_email'], message['subject'], message['body_text'],
+                                  message.get('body_html'), message.get('from_email'))
+    return send
@@ -7,10 +7,13 @@ Sends transactional emails via AWS SES or SMTP fallback
 import os
 import sys
 import logging
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import datetime
+from email.utils import formatdate, make_msgid
+from typing import Dict, List
+
+from .config import SMTPConfig
+from .smtp_transport import SMTPTransport
 
 # AWS SES
 try:
@@ -24,6 +27,21 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def build_message(to_email: str, subject: str, body_text: str, body_html: str = None, from_email: str = None):
+    """MIME message (text + optional HTML alternative) with Message-ID and Date"""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = from_email
+    msg['To'] = to_email
+    msg['Date'] = formatdate(localtime=True)
+    msg['Message-ID'] = make_msgid(domain=from_email.rsplit('@', 1)[-1] if from_email else None)
+    
+    msg.attach(MIMEText(body_text, 'plain', 'utf-8'))
+    if body_html:
+        msg.attach(MIMEText(body_html, 'html', 'utf-8'))
+    return msg
+
+
 class EmailService:
     """
     Email Service supporting AWS SES 
@@ -46,6 +64,14 @@ class EmailService:
         except Exception:
             return False
     
+    def _check_smtp(self):
+        """SMTP when SMTP_HOST is set - connections are pooled and reused - VS"""
+        config = SMTPConfig()
+        if not config.host:
+            return False
+        self.smtp = SMTPTransport(config)
+        return True
+    
     def send_email(self, to_email: str, subject: str, body_text: str, body_html: str = None, from_email: str = None):
         """
         Send email via available method
@@ -81,27 +107,27 @@ class EmailService:
             return {'success': False, 'error': str(e)}
     
     def _send_smtp(self, to_email, subject, body_text, body_html, from_email):
-        """Send via SMTP"""
-        try:
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = from_email
-            msg['To'] = to_email
-            
-            msg.attach(MIMEText(body_text, 'plain', 'utf-8'))
-            if body_html:
-                msg.attach(MIMEText(body_html, 'html', 'utf-8'))
-            
-            with smtplib.SMTP(self.smtp_host, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_user, self.smtp_password)
-                server.sendmail(from_email, to_email, msg.as_string())
-            
+        """Send via SMTP (pooled connection)"""
+        result = self.smtp.send(build_message(to_email, subject, body_text, body_html, from_email))
+        if result['success']:
             logger.info(f"SMTP email sent to {to_email}")
-            return {'success': True, 'message_id': f"smtp_{datetime.now().timestamp()}"}
-        except Exception as e:
-            logger.error(f"SMTP error: {e}")
-            return {'success': False, 'error': str(e)}
+        return result
+    
+    def send_bulk(self, emails: List[Dict], from_email: str = None) -> List[Dict]:
+        """
+        Send many emails (dicts with to_email, subject, body_text, body_html).
+        SMTP sends them in batches over the pooled connections, so a reminder
+        blast pays one handshake per connection, not per recipient - VS
+        """
+        from_email = from_email or os.getenv('FROM_EMAIL', 'petcareappverify@gmail.com')
+        if self.mode != 'smtp':
+            return [self.send_email(e['to_email'], e['subject'], e['body_text'], e.get('body_html'), from_email)
+                    for e in emails]
+        messages = [build_message(e['to_email'], e['subject'], e['body_text'], e.get('body_html'), from_email)
+                    for e in emails]
+        results = self.smtp.send_many(messages)
+        logger.info(f"SMTP batch: {sum(r['success'] for r in results)}/{len(results)} sent")
+        return results
     
     def _log_email(self, to_email, subject, body_text):
         """Log email (for development)"""
@@ -0,0 +1,120 @@
+"""
+PetCareApp - HTTP Response Cache
+Warunkowe GET (ETag / Last-Modified) dla endpointów z danymi referencyjnymi
+@author VS
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from functools import wraps
+from typing import Callable, Iterable, Optional, Tuple
+
+from flask import Response, request, make_response
+
+
+class _CachedBody:
+    """Zserializowana odpowiedź wraz z walidatorami - VS"""
+
+    def __init__(self, response: Response):
+        self.body = response.get_data()
+        self.mimetype = response.mimetype
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        # Nagłówek HTTP ma rozdzielczość sekundową - VS
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == '*':
+        return True
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def _not_modified_since(header: str, last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return last_modified <= since
+
+
+def cached_response(max_age: int = 3600, public: bool = True, query_args: Iterable[str] = (),
+                    max_entries: int = 256) -> Callable:
+    """
+    Dekorator dla statycznych endpointów GET - VS
+
+    Odpowiedź jest budowana i serializowana raz dla ścieżki i wartości
+    parametrów `query_args` (pozostałe parametry zapytania nie tworzą
+    nowych wpisów), razem z silnym ETagiem. Najwyżej `max_entries`
+    wpisów (LRU). Kolejne żądania z pasującym If-None-Match
+    lub If-Modified-Since dostają 304 bez ciała. Cache-Control pozwala
+    na cache w nginx i przeglądarce. `view.invalidate()` czyści cache.
+    """
+    cache_control = f"{'public' if public else 'private'}, max-age={max_age}"
+
+    def decorator(view: Callable) -> Callable:
+        entries: 'OrderedDict[tuple, _CachedBody]' = OrderedDict()
+        lock = threading.Lock()
+        names = tuple(query_args)
+
+        def _get_entry(args, kwargs) -> Tuple[Optional[_CachedBody], Optional[Response]]:
+            key = (request.path,) + tuple(request.args.get(name) for name in names)
+            with lock:
+                entry = entries.get(key)
+                if entry is not None:
+                    entries.move_to_end(key)
+                    return entry, None
+                response = make_response(view(*args, **kwargs))
+                # Błędy nie są cache'owane - VS
+                if response.status_code != 200:
+                    return None, response
+                entry = entries[key] = _CachedBody(response)
+                while len(entries) > max_entries:
+                    entries.popitem(last=False)
+            return entry, None
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+
+            entry, uncached = _get_entry(args, kwargs)
+            if entry is None:
+                return uncached
+
+            headers = {
+                'ETag': entry.etag,
+                'Last-Modified': format_datetime(entry.last_modified, usegmt=True),
+                'Cache-Control': cache_control
+            }
+
+            if_none_match = request.headers.get('If-None-Match')
+            if_modified_since = request.headers.get('If-Modified-Since')
+            # If-None-Match ma pierwszeństwo (RFC 9110, 13.1.3) - VS
+            if if_none_match is not None:
+                not_modified = _etag_matches(if_none_match, entry.etag)
+            else:
+                not_modified = bool(if_modified_since) and _not_modified_since(if_modified_since, entry.last_modified)
+
+            if not_modified:
+                return Response(status=304, headers=headers)
+            return Response(entry.body, status=200, mimetype=entry.mimetype, headers=headers)
+
+        def invalidate():
+            with lock:
+                entries.clear()
+
+        wrapper.invalidate = invalidate
+        return wrapper
+
+    return decorator
@@ -0,0 +1,335 @@
+"""
+PetCareApp - Rate Limiting
+Limity żądań (token bucket) per IP / e-mail / użytkownik, opcjonalnie wspólne dla instancji przez Redis
+@author VS
+"""
+
+import os
+import math
+import ipaddress
+import time
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from flask import g, jsonify, make_response, request
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000))
+RATE_LIMIT_SYNC_INTERVAL = float(os.getenv('RATE_LIMIT_SYNC_INTERVAL', 1))
+# X-Real-IP is trusted only from these proxies (nginx, 172.28.0.2 in docker-compose) - VS
+RATE_LIMIT_TRUSTED_PROXIES = tuple(
+    ipaddress.ip_network(value.strip(), strict=False)
+    for value in os.getenv('RATE_LIMIT_TRUSTED_PROXIES', '').split(',') if value.strip()
+)
+
+
+class RateLimitDecision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: int
+    retry_after: int
+
+
+class RateLimiter:
+    """
+    Token bucket per klucz: `limit` żądań na `period` sekund, zapas `burst` - VS
+
+    Kubełki są lokalne (LRU, RATE_LIMIT_MAX_KEYS), więc decyzja nie wymaga
+    sieci. Z `cache` (CacheHelper / Redis) instancje co sync_interval
+    wysyłają jednym pipeline swoje zużycie dla aktywnych kluczy (INCRBY
+    licznika okna `period`) i dostają łączne zużycie wszystkich instancji;
+    zużycie pozostałych jest odejmowane od lokalnego kubełka. Limit jest
+    więc wspólny z opóźnieniem najwyżej jednej synchronizacji.
+    """
+
+    def __init__(self, name: str, limit: int, period: float, burst: Optional[int] = None, cache=None,
+                 max_keys: int = RATE_LIMIT_MAX_KEYS, sync_interval: float = RATE_LIMIT_SYNC_INTERVAL):
+        self.name = name
+        self.limit = limit
+        self.period = period
+        self.capacity = burst or limit
+        self.rate = limit / period
+        self.cache = cache
+        self.max_keys = max_keys
+        self.sync_interval = sync_interval
+        # key -> [tokens, refilled at (monotonic), window, own use in window, others' use seen] - VS
+        self.buckets: 'OrderedDict[str, list]' = OrderedDict()
+        self.pending: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.stats = {'allowed': 0, 'limited': 0, 'syncs': 0, 'syncErrors': 0}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if cache is not None:
+            self.start()
+
+    def _refill(self, bucket: list, now: float) -> None:
+        bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+
+    def hit(self, key: str, cost: int = 1) -> RateLimitDecision:
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [float(self.capacity), now, None, 0, 0]
+                while len(self.buckets) > self.max_keys:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+                self._refill(bucket, now)
+            allowed = bucket[0] >= cost
+            if allowed:
+                bucket[0] -= cost
+                if self.cache is not None:
+                    self.pending[key] = self.pending.get(key, 0) + cost
+                self.stats['allowed'] += 1
+            else:
+                self.stats['limited'] += 1
+            tokens = bucket[0]
+        return RateLimitDecision(
+            allowed=allowed,
+            limit=self.limit,
+            remaining=max(0, int(tokens)),
+            reset=math.ceil((self.capacity - tokens) / self.rate),
+            retry_after=0 if allowed else math.ceil((cost - tokens) / self.rate)
+        )
+
+    def reset(self, key: str) -> None:
+        """
+        Pełny kubełek dla klucza (np. e-mail po udanym logowaniu) w tej instancji.
+        Rozliczenie okna zostaje - inaczej następna synchronizacja uznałaby
+        własne zużycie za cudze i odjęła je z powrotem.
+        """
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket[0], bucket[1] = float(self.capacity), time.monotonic()
+
+    # ---------- Synchronizacja przez Redis ----------
+
+    def sync(self) -> None:
+        now = time.monotonic()
+        window = int(time.time() // self.period)
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            # Keys used within the last period - also pull what the other instances spent - VS
+            active = {}
+            for key, bucket in reversed(self.buckets.items()):
+                if now - bucket[1] > self.period:
+                    break
+                active[key] = pending.get(key, 0)
+        if not active:
+            return
+        amounts = {f"ratelimit:{self.name}:{key}:{window}": amount for key, amount in active.items()}
+        try:
+            totals = self.cache.incr_many(amounts, ttl=int(self.period) + 1)
+        except Exception as e:
+            with self.lock:
+                self.stats['syncErrors'] += 1
+                for key, amount in pending.items():
+                    self.pending[key] = self.pending.get(key, 0) + amount
+            raise e
+
+        with self.lock:
+            for key, amount in active.items():
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    continue
+                if bucket[2] != window:
+                    bucket[2:] = [window, 0, 0]
+                bucket[3] += amount
+                others = int(totals[f"ratelimit:{self.name}:{key}:{window}"]) - bucket[3]
+                if others > bucket[4]:
+                    self._refill(bucket, now)
+                    bucket[0] = max(0.0, bucket[0] - (others - bucket[4]))
+                    bucket[4] = others
+            self.stats['syncs'] += 1
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.sync_interval):
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"Rate limit sync error ({self.name}): {e}")
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=f"ratelimit-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, 'keys': len(self.buckets), 'limit': self.limit,
+                    'period': self.period, 'shared': self.cache is not None}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def shared_cache():
+    """CacheHelper, gdy REDIS_HOST jest ustawiony - inaczej None (limity tylko lokalne)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            from .config import RedisConfig
+            config = RedisConfig()
+            _cache = False
+            if config.host:
+                try:
+                    from .database import CacheHelper
+                    _cache = CacheHelper(config)
+                    logger.info(f"Rate limits shared through Redis at {config.host}:{config.port}")
+                except ImportError as e:
+                    logger.warning(f"Redis client not installed, rate limits are per instance: {e}")
+        return _cache or None
+
+
+# ---------- Flask ----------
+
+def trusted_proxy(address: Optional[str]) -> bool:
+    if not address or not RATE_LIMIT_TRUSTED_PROXIES:
+        return False
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in RATE_LIMIT_TRUSTED_PROXIES)
+
+
+# Private addresses that relayed X-Real-IP while no proxy is configured - VS
+_unconfigured_proxies = set()
+
+
+def _unconfigured_proxy(address: Optional[str]) -> bool:
+    """Żądanie z prywatnego adresu z X-Real-IP przy pustym RATE_LIMIT_TRUSTED_PROXIES"""
+    if RATE_LIMIT_TRUSTED_PROXIES or not address or 'X-Real-IP' not in request.headers:
+        return False
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    if not (ip.is_private or ip.is_loopback):
+        return False
+    if address not in _unconfigured_proxies and len(_unconfigured_proxies) < 64:
+        _unconfigured_proxies.add(address)
+        logger.warning(f"Request relayed by {address} with X-Real-IP, but RATE_LIMIT_TRUSTED_PROXIES is empty - "
+                       f"all clients behind it share one address; per-IP limits are disabled for it")
+    return True
+
+
+def known_proxy(address: Optional[str]) -> bool:
+    """Adres proxy (skonfigurowanego albo wykrytego) - nie identyfikuje klienta"""
+    return trusted_proxy(address) or address in _unconfigured_proxies
+
+
+def client_ip() -> str:
+    """
+    Adres klienta - VS
+    X-Real-IP tylko od zaufanego proxy: porty serwisów są publikowane
+    bezpośrednio, więc nagłówek od kogokolwiek innego jest ignorowany.
+    """
+    if trusted_proxy(request.remote_addr):
+        return request.headers.get('X-Real-IP') or request.remote_addr
+    _unconfigured_proxy(request.remote_addr)
+    return request.remote_addr
+
+
+def client_ip_key() -> Optional[str]:
+    """Klucz limitu per IP; None (bez limitu) za nieskonfigurowanym proxy, które sklejałoby wszystkich klientów"""
+    if _unconfigured_proxy(request.remote_addr):
+        return None
+    return client_ip()
+
+
+def user_or_ip() -> str:
+    user = g.get('user')
+    if user and user.get('id'):
+        return f"user:{user['id']}"
+    return f"ip:{client_ip()}"
+
+
+def limit_headers(decision: RateLimitDecision) -> Dict[str, str]:
+    headers = {
+        'X-RateLimit-Limit': str(decision.limit),
+        'X-RateLimit-Remaining': str(decision.remaining),
+        'X-RateLimit-Reset': str(decision.reset)
+    }
+    if not decision.allowed:
+        headers['Retry-After'] = str(decision.retry_after)
+    return headers
+
+
+def too_many_requests(decision: RateLimitDecision):
+    response = jsonify({'error': 'Too many requests', 'retryAfter': decision.retry_after})
+    response.status_code = 429
+    response.headers.update(limit_headers(decision))
+    return response
+
+
+def rate_limit(limiter: RateLimiter, key: Callable[[], Optional[str]] = user_or_ip, cost: int = 1) -> Callable:
+    """
+    Dekorator endpointu - VS
+
+    `key()` wyznacza klucz limitu w kontekście żądania (None = bez limitu).
+    Odpowiedź dostaje nagłówki X-RateLimit-*, a po przekroczeniu - 429
+    z Retry-After. Z require_auth dekorator musi być pod nim (g.user).
+    """
+    def decorator(view: Callable) -> Callable:
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not RATE_LIMIT_ENABLED or request.method == 'OPTIONS':
+                return view(*args, **kwargs)
+            limit_key = key()
+            if limit_key is None:
+                return view(*args, **kwargs)
+            decision = limiter.hit(limit_key, cost)
+            if not decision.allowed:
+                logger.warning(f"Rate limit {limiter.name} exceeded for {limit_key}")
+                return too_many_requests(decision)
+            response = make_response(view(*args, **kwargs))
+            for name, value in limit_headers(decision).items():
+                response.headers.setdefault(name, value)
+            return response
+        return wrapper
+    return decorator
+
+
+def init_rate_limit(app, limiter: RateLimiter, prefix: str, key: Callable[[], Optional[str]] = user_or_ip) -> None:
+    """
+    Limit dla wszystkich ścieżek z prefiksem - VS
+    Wywoływane po init_auth, żeby klucz mógł korzystać z g.user.
+    """
+    @app.before_request
+    def check_rate_limit():
+        g.rate_limit = None
+        if not RATE_LIMIT_ENABLED or request.method == 'OPTIONS' or not request.path.startswith(prefix):
+            return None
+        limit_key = key()
+        if limit_key is None:
+            return None
+        decision = limiter.hit(limit_key)
+        if not decision.allowed:
+            logger.warning(f"Rate limit {limiter.name} exceeded for {limit_key}")
+            return too_many_requests(decision)
+        g.rate_limit = decision
+        return None
+
+    @app.after_request
+    def add_rate_limit_headers(response):
+        decision = g.get('rate_limit')
+        if decision is not None:
+            for name, value in limit_headers(decision).items():
+                response.headers.setdefault(name, value)
+        return response
@@ -0,0 +1,265 @@
+"""
+PetCareApp - Token Revocation
+Lista unieważnionych tokenów i sesji: filtr Blooma w pamięci + tabela DynamoDB z TTL
+@author VS
+"""
+
+import os
+import math
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import BotoCoreError, ClientError
+
+logger = logging.getLogger(__name__)
+
+AUTH_REVOCATION_TABLE = os.getenv('AUTH_REVOCATION_TABLE', 'PetCareApp-RevokedTokens')
+AUTH_REVOCATION_SYNC_INTERVAL = float(os.getenv('AUTH_REVOCATION_SYNC_INTERVAL', 15))
+# Full rescan even without new revocations - drops expired keys from the filter - VS
+AUTH_REVOCATION_RESCAN_INTERVAL = float(os.getenv('AUTH_REVOCATION_RESCAN_INTERVAL', 3600))
+AUTH_REVOCATION_CAPACITY = int(os.getenv('AUTH_REVOCATION_CAPACITY', 100000))
+AUTH_REVOCATION_ERROR_RATE = float(os.getenv('AUTH_REVOCATION_ERROR_RATE', 0.001))
+
+# Counter item bumped by every revoke() - a sync rescans only when it moved - VS
+VERSION_KEY = 'meta#version'
+
+
+class BloomFilter:
+    """Filtr Blooma na bytearray; k pozycji z jednego skrótu (double hashing) - VS"""
+
+    def __init__(self, capacity: int = AUTH_REVOCATION_CAPACITY, error_rate: float = AUTH_REVOCATION_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+def revocation_keys(user: Dict[str, Any]) -> Iterable[str]:
+    """Klucze listy dla zweryfikowanego tokenu: sam token (`jti`) i jego sesja (`sid`)"""
+    if user.get('jti'):
+        yield f"jti:{user['jti']}"
+    if user.get('sid'):
+        yield f"sid:{user['sid']}"
+
+
+class RevocationList:
+    """
+    Unieważnione tokeny (`jti:<id>`) i sesje (`sid:<id>`) - VS
+
+    Źródłem prawdy jest tabela z TTL na `expiresAt` (wpis żyje tyle, co
+    najdłuższy token, którego dotyczy). Każdy serwis co
+    AUTH_REVOCATION_SYNC_INTERVAL czyta licznik `meta#version` (jeden
+    GetItem) i tylko gdy się zmienił - albo raz na
+    AUTH_REVOCATION_RESCAN_INTERVAL - przebudowuje filtr Blooma skanem
+    tabeli. Sprawdzenie tokenu to kilka operacji na bitach, bez zapytań do bazy.
+    Tylko trafienie w filtr (token faktycznie unieważniony albo rzadki
+    fałszywy alarm) kończy się jednym GetItem, którego wynik jest
+    zapamiętywany do następnej synchronizacji. Unieważnienia z tego procesu
+    działają natychmiast, w pozostałych serwisach - po synchronizacji.
+    """
+
+    def __init__(self, dynamodb=None, table_name: str = AUTH_REVOCATION_TABLE,
+                 sync_interval: float = AUTH_REVOCATION_SYNC_INTERVAL,
+                 capacity: int = AUTH_REVOCATION_CAPACITY, error_rate: float = AUTH_REVOCATION_ERROR_RATE):
+        self.table = dynamodb.Table(table_name) if dynamodb else None
+        self.sync_interval = sync_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.filter = BloomFilter(capacity, error_rate)
+        # Revoked here: key -> (expires, revoked at) - kept until a sync has seen them - VS
+        self.local: Dict[str, Tuple[float, float]] = {}
+        self.confirmed: Dict[str, Tuple[bool, float]] = {}
+        self.lock = threading.Lock()
+        self.synced_at: Optional[str] = None
+        self.table_version: Optional[int] = None
+        self.scanned_at = 0.0
+        # Bumped whenever the filter changes - a token checked at this version needn't be re-hashed - VS
+        self.version = 0
+        self.stats = {'positives': 0, 'falsePositives': 0, 'lookups': 0, 'syncs': 0, 'scans': 0}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- Unieważnianie ----------
+
+    def revoke(self, kind: str, value: str, expires_at: float, reason: Optional[str] = None) -> None:
+        """Unieważnia `jti` albo `sid` do `expires_at` (epoch s)"""
+        key = f"{kind}:{value}"
+        revoked_at = time.time()
+        if self.table:
+            item = {'id': key, 'expiresAt': int(expires_at) + 1, 'revokedAt': datetime.utcnow().isoformat()}
+            if reason:
+                item['reason'] = reason
+            try:
+                self.table.put_item(Item=item)
+                self.table.update_item(Key={'id': VERSION_KEY}, UpdateExpression='ADD #v :one',
+                                       ExpressionAttributeNames={'#v': 'version'}, ExpressionAttributeValues={':one': 1})
+            except (ClientError, BotoCoreError) as e:
+                # Local entry stays until expiry; the other services won't see it - VS
+                logger.error(f"Revocation write error for {key}: {e}")
+                revoked_at = float('inf')
+        with self.lock:
+            self.filter.add(key)
+            self.local[key] = (expires_at, revoked_at)
+            self.confirmed[key] = (True, expires_at)
+            self.version += 1
+
+    def revoke_token(self, user: Dict[str, Any], reason: Optional[str] = None) -> None:
+        if user.get('jti'):
+            self.revoke('jti', user['jti'], user.get('exp') or time.time() + 86400, reason)
+
+    # ---------- Sprawdzanie ----------
+
+    def is_revoked(self, user: Dict[str, Any]) -> bool:
+        for key in revocation_keys(user):
+            if key in self.filter and self._confirm(key):
+                return True
+        return False
+
+    def _confirm(self, key: str) -> bool:
+        now = time.time()
+        with self.lock:
+            self.stats['positives'] += 1
+            entry = self.confirmed.get(key)
+            if entry and entry[1] > now:
+                return entry[0]
+            local = self.local.get(key)
+        if local and local[0] > now:
+            revoked, until = True, local[0]
+        elif self.table:
+            try:
+                item = self.table.get_item(Key={'id': key}, ConsistentRead=True).get('Item')
+            except (ClientError, BotoCoreError) as e:
+                # Filter says revoked and the table can't say otherwise - fail closed - VS
+                logger.error(f"Revocation lookup error for {key}: {e}")
+                return True
+            self.stats['lookups'] += 1
+            revoked = bool(item) and int(item['expiresAt']) > now
+            until = int(item['expiresAt']) if revoked else now + self.sync_interval
+        else:
+            revoked, until = False, now + self.sync_interval
+        with self.lock:
+            if not revoked:
+                self.stats['falsePositives'] += 1
+            self.confirmed[key] = (revoked, until)
+        return revoked
+
+    # ---------- Synchronizacja ----------
+
+    def _read_version(self) -> int:
+        item = self.table.get_item(Key={'id': VERSION_KEY}, ConsistentRead=True).get('Item')
+        return int(item['version']) if item else 0
+
+    def sync(self, force: bool = False) -> int:
+        """Przebudowa filtra z tabeli (tylko niewygasłe wpisy), gdy przybyło unieważnień; zwraca liczbę kluczy"""
+        if not self.table:
+            return 0
+        started = time.time()
+        # Read before the scan: a revoke() landing during the scan moves it again - VS
+        version = self._read_version()
+        if not force and version == self.table_version and started - self.scanned_at < AUTH_REVOCATION_RESCAN_INTERVAL:
+            with self.lock:
+                self.confirmed = {k: v for k, v in self.confirmed.items() if v[1] > started}
+                self.synced_at = datetime.utcnow().isoformat()
+                self.stats['syncs'] += 1
+                return self.filter.count
+        keys = []
+        kwargs = {
+            'ProjectionExpression': 'id',
+            'FilterExpression': Attr('expiresAt').gt(int(started))
+        }
+        while True:
+            response = self.table.scan(**kwargs)
+            keys.extend(item['id'] for item in response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        if len(keys) > self.capacity:
+            logger.warning(f"Revocation list has {len(keys)} entries (capacity {self.capacity}) - filter resized")
+        fresh = BloomFilter(max(self.capacity, len(keys) * 2), self.error_rate)
+        for key in keys:
+            fresh.add(key)
+        with self.lock:
+            # Writes newer than the scan start may be missing from it - VS
+            self.local = {k: v for k, v in self.local.items() if v[0] > started and v[1] >= started - 1}
+            for key in self.local:
+                fresh.add(key)
+            if fresh.bits != self.filter.bits:
+                self.version += 1
+            self.filter = fresh
+            self.confirmed = {k: v for k, v in self.confirmed.items() if v[0] and v[1] > started}
+            self.synced_at = datetime.utcnow().isoformat()
+            self.table_version, self.scanned_at = version, started
+            self.stats['syncs'] += 1
+            self.stats['scans'] += 1
+        return len(keys)
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"Revocation sync error: {e}")
+            if self._stop.wait(self.sync_interval):
+                return
+
+    def start(self) -> None:
+        if not self.table or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='auth-revocation-sync', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                **self.stats,
+                'entries': self.filter.count,
+                'filterBytes': len(self.filter.bits),
+                'syncedAt': self.synced_at,
+                'shared': self.table is not None
+            }
+
+
+_revocations: Optional[RevocationList] = None
+_revocations_lock = threading.Lock()
+
+
+def get_revocations() -> RevocationList:
+    """Lista procesu (tworzona przy pierwszym użyciu, synchronizowana w tle)"""
+    global _revocations
+    with _revocations_lock:
+        if _revocations is None:
+            dynamodb = None
+            try:
+                import boto3
+                dynamodb = boto3.resource('dynamodb', region_name=os.getenv('AWS_REGION', 'eu-north-1'))
+            except Exception as e:
+                logger.warning(f"Revocation table not available, local list only: {e}")
+            _revocations = RevocationList(dynamodb)
+            _revocations.start()
+        return _revocations
@@ -0,0 +1,218 @@
+"""
+PetCareApp - Report Rollups
+Dzienne liczniki raportowe (per lekarz, usługa, gatunek) aktualizowane przyrostowo
+@author VS
+"""
+
+import os
+import logging
+from datetime import datetime
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import BotoCoreError, ClientError
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_TABLE = os.getenv('ROLLUP_TABLE', 'PetCareApp-ReportRollups')
+
+# (dzień YYYY-MM-DD, wymiar np. "total", "vet#<id>", "service#<nazwa>", "species#dog") -> liczniki
+Deltas = Dict[Tuple[str, str], Dict[str, Decimal]]
+
+
+def _day(value) -> Optional[str]:
+    """Dzień z ISO daty/czasu (walidowany, żeby nie tworzyć śmieciowych kluczy) - VS"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value)[:10]).strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def _amount(value) -> Decimal:
+    try:
+        return Decimal(str(value or 0))
+    except ArithmeticError:
+        return Decimal(0)
+
+
+def _add(deltas: Deltas, day: str, dimensions, counters: Dict[str, Decimal], sign: int = 1) -> None:
+    for dimension in dimensions:
+        row = deltas.setdefault((day, dimension), {})
+        for counter, value in counters.items():
+            row[counter] = row.get(counter, Decimal(0)) + value * sign
+
+
+# ============================================
+#  Wkład pojedynczych rekordów w liczniki
+# ============================================
+
+def appointment_contribution(appointment: Optional[Dict], sign: int = 1, deltas: Optional[Deltas] = None) -> Deltas:
+    """Wizyta liczy się w dniu wizyty (dateTime), przychód tylko po zakończeniu - VS"""
+    deltas = {} if deltas is None else deltas
+    day = _day((appointment or {}).get('dateTime'))
+    if not day:
+        return deltas
+    status = appointment.get('status')
+    counters = {'appointments': Decimal(1)}
+    if status == 'completed':
+        counters['completed'] = Decimal(1)
+        counters['revenue'] = _amount(appointment.get('price'))
+    elif status == 'cancelled':
+        counters['cancelled'] = Decimal(1)
+    dimensions = [
+        'total',
+        f"vet#{appointment.get('vetId') or 'unassigned'}",
+        f"service#{appointment.get('serviceName') or appointment.get('serviceType') or 'Inne'}"
+    ]
+    _add(deltas, day, dimensions, counters, sign)
+    return deltas
+
+
+def payment_contribution(payment: Optional[Dict], sign: int = 1, deltas: Optional[Deltas] = None) -> Deltas:
+    """Każda płatność w wymiarze `payment#<status>`, do przychodu tylko opłacone - w dniu utworzenia - VS"""
+    deltas = {} if deltas is None else deltas
+    day = _day((payment or {}).get('createdAt'))
+    if not day:
+        return deltas
+    amount = _amount(payment.get('amount'))
+    _add(deltas, day, [f"payment#{payment.get('status') or 'unknown'}"], {'payments': Decimal(1), 'amount': amount}, sign)
+    if payment.get('status') == 'completed':
+        _add(deltas, day, ['total'], {'payments': Decimal(1), 'paymentRevenue': amount}, sign)
+    return deltas
+
+
+def pet_contribution(pet: Optional[Dict], sign: int = 1, deltas: Optional[Deltas] = None) -> Deltas:
+    deltas = {} if deltas is None else deltas
+    day = _day((pet or {}).get('createdAt'))
+    if day:
+        _add(deltas, day, ['total', f"species#{pet.get('species') or 'other'}"], {'newPets': Decimal(1)}, sign)
+    return deltas
+
+
+def change_deltas(contribution: Callable, before: Optional[Dict], after: Optional[Dict]) -> Deltas:
+    """Różnica wkładów przed/po zmianie - obsługuje zmianę statusu, daty, lekarza itd. - VS"""
+    deltas = contribution(after)
+    contribution(before, sign=-1, deltas=deltas)
+    return {
+        key: {counter: value for counter, value in row.items() if value}
+        for key, row in deltas.items()
+        if any(row.values())
+    }
+
+
+# ============================================
+#  Tabela rollupów
+# ============================================
+
+class RollupStore:
+    """
+    Tabela: klucz partycji `month` (YYYY-MM), klucz sortowania `sk` = "<dzień>#<wymiar>" - VS
+
+    Zapytanie o zakres dat to jedno Query na miesiąc, a aktualizacje są
+    atomowymi ADD, więc równoległe serwisy nie nadpisują sobie liczników.
+    Każde ADD podbija też `rev` wiersza - przebudowa zapisuje wiersz
+    tylko wtedy, gdy od odczytu przed skanem nikt go nie zmienił.
+    """
+
+    def __init__(self, dynamodb, table_name: str = ROLLUP_TABLE):
+        self.table = dynamodb.Table(table_name) if dynamodb else None
+
+    def apply(self, deltas: Deltas) -> None:
+        """Przyrostowa aktualizacja - błędy są logowane, nie przerywają zapisu rekordu"""
+        if not self.table:
+            return
+        for (day, dimension), counters in deltas.items():
+            names = {f"#c{i}": counter for i, counter in enumerate(counters)}
+            values = {f":v{i}": value for i, value in enumerate(counters.values())}
+            try:
+                self.table.update_item(
+                    Key={'month': day[:7], 'sk': f"{day}#{dimension}"},
+                    UpdateExpression='ADD ' + ', '.join(f"{n} {v}" for n, v in zip(names, values)) + ', #rev :one',
+                    ExpressionAttributeNames={**names, '#rev': 'rev'},
+                    ExpressionAttributeValues={**values, ':one': 1}
+                )
+            except (ClientError, BotoCoreError) as e:
+                logger.error(f"Rollup update error for {day}#{dimension}: {e}")
+
+    def record_change(self, contribution: Callable, before: Optional[Dict], after: Optional[Dict]) -> None:
+        self.apply(change_deltas(contribution, before, after))
+
+    def revisions(self, months: Optional[Iterable[str]] = None) -> Dict[Tuple[str, str], Optional[int]]:
+        """(miesiąc, sk) -> rev istniejących wierszy: całej tabeli albo wybranych miesięcy"""
+        found = {}
+        if months is None:
+            pages = [{'ProjectionExpression': '#m, sk, #rev',
+                      'ExpressionAttributeNames': {'#m': 'month', '#rev': 'rev'}}]
+            read = self.table.scan
+        else:
+            pages = [{'KeyConditionExpression': Key('month').eq(month), 'ProjectionExpression': '#m, sk, #rev',
+                      'ExpressionAttributeNames': {'#m': 'month', '#rev': 'rev'}} for month in months]
+            read = self.table.query
+        for kwargs in pages:
+            while True:
+                response = read(**kwargs)
+                for item in response.get('Items', []):
+                    found[(item['month'], item['sk'])] = int(item['rev']) if 'rev' in item else None
+                if 'LastEvaluatedKey' not in response:
+                    break
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return found
+
+    def reconcile(self, deltas: Deltas, revisions: Dict[Tuple[str, str], Optional[int]]) -> Tuple[int, int, Set[str]]:
+        """
+        Zapis przebudowy: wiersze z `deltas` nadpisane, wiersze z `revisions`
+        spoza wyniku skanu usunięte - każdy warunkowo na rev odczytany przed
+        skanem. Zwraca (zapisane, usunięte, miesiące zmienione w trakcie skanu).
+        """
+        rows = {(day[:7], f"{day}#{dimension}"): counters for (day, dimension), counters in deltas.items()}
+        written, deleted, dirty = 0, 0, set()
+        for key in set(rows) | set(revisions):
+            counters = rows.get(key)
+            keep = bool(counters) and any(counters.values())
+            if key not in revisions and not keep:
+                continue
+            rev = revisions.get(key)
+            if key not in revisions:
+                condition = {'ConditionExpression': 'attribute_not_exists(sk)'}
+            elif rev is None:
+                condition = {'ConditionExpression': 'attribute_not_exists(#rev)', 'ExpressionAttributeNames': {'#rev': 'rev'}}
+            else:
+                condition = {'ConditionExpression': '#rev = :rev', 'ExpressionAttributeNames': {'#rev': 'rev'},
+                             'ExpressionAttributeValues': {':rev': rev}}
+            try:
+                if keep:
+                    self.table.put_item(Item={'month': key[0], 'sk': key[1], **counters, 'rev': (rev or 0) + 1}, **condition)
+                    written += 1
+                else:
+                    self.table.delete_item(Key={'month': key[0], 'sk': key[1]}, **condition)
+                    deleted += 1
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+                # A service hook ADDed to this row during the scan - VS
+                dirty.add(key[0])
+        return written, deleted, dirty
+
+    def query(self, day_from: str, day_to: str, prefix: Optional[str] = None) -> Iterator[Dict]:
+        """Wiersze z dni [day_from, day_to], opcjonalnie tylko wymiary zaczynające się od `prefix`"""
+        month = day_from[:7]
+        while month <= day_to[:7]:
+            kwargs = {
+                'KeyConditionExpression': Key('month').eq(month) & Key('sk').between(day_from, f"{day_to}#\uffff")
+            }
+            while True:
+                response = self.table.query(**kwargs)
+                for item in response.get('Items', []):
+                    day, dimension = item['sk'].split('#', 1)
+                    if prefix and not dimension.startswith(prefix):
+                        continue
+                    counters = {k: v for k, v in item.items() if k not in ('month', 'sk', 'rev')}
+                    yield {'day': day, 'dimension': dimension, **counters}
+                if 'LastEvaluatedKey' not in response:
+                    break
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+            year, mon = int(month[:4]), int(month[5:])
+            month = f"{year + mon // 12}-{mon % 12 + 1:02d}"
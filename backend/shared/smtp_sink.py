@@ -0,0 +1,118 @@
+"""
+PetCareApp - SMTP Sink
+Lokalny serwer SMTP do testów: przyjmuje każdą wiadomość i trzyma ją w pamięci
+@author VS
+"""
+
+import sys
+import email
+import logging
+import threading
+import socketserver
+from email import policy
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    """EHLO/HELO, AUTH PLAIN, MAIL, RCPT, DATA, RSET, NOOP, QUIT - bez TLS"""
+
+    def reply(self, *lines: str) -> None:
+        self.wfile.write(''.join(line + '\r\n' for line in lines).encode())
+
+    def handle(self) -> None:
+        sink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+        mail_from, recipients = None, []
+        self.reply('220 petcareapp-sink ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self.reply('250-petcareapp-sink', '250-AUTH PLAIN', '250 8BITMIME')
+            elif verb == 'HELO':
+                self.reply('250 petcareapp-sink')
+            elif verb == 'AUTH':
+                self.reply('235 2.7.0 Authentication successful')
+            elif verb == 'MAIL':
+                mail_from, recipients = command[10:].strip().split(' ')[0].strip('<>'), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command[8:].strip().strip('<>'))
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data == b'.\r\n':
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                message = email.message_from_bytes(b''.join(lines), policy=policy.default)
+                sink.store(mail_from, recipients, message)
+                mail_from, recipients = None, []
+                self.reply('250 OK queued')
+            elif verb in ('RSET', 'NOOP'):
+                if verb == 'RSET':
+                    mail_from, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class _SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """
+    Serwer do testów i lokalnego uruchomienia - VS
+
+    Ustaw SMTP_HOST=127.0.0.1, SMTP_PORT=<port>, SMTP_STARTTLS=false;
+    odebrane wiadomości są w `messages`, a `connections` pokazuje, ile
+    sesji SMTP otworzył klient (sprawdzenie ponownego użycia połączeń).
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, keep: int = 10000):
+        self.server = _SinkServer((host, port), _SinkHandler)
+        self.server.sink = self
+        self.keep = keep
+        self.messages: List[Tuple[str, List[str], email.message.EmailMessage]] = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def store(self, mail_from, recipients, message) -> None:
+        with self.lock:
+            self.messages.append((mail_from, recipients, message))
+            del self.messages[:-self.keep]
+        logger.info(f"SMTP sink: {mail_from} -> {', '.join(recipients)}: {message['Subject']}")
+
+    def start(self) -> 'SMTPSink':
+        self._thread = threading.Thread(target=self.server.serve_forever, name='smtp-sink', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sink = SMTPSink(port=int(sys.argv[1]) if len(sys.argv) > 1 else 1025)
+    logger.info(f"SMTP sink listening on 127.0.0.1:{sink.port}")
+    sink.server.serve_forever()
@@ -0,0 +1,176 @@
+"""
+PetCareApp - SMTP Transport
+Pula uwierzytelnionych połączeń SMTP z wysyłką wsadową
+@author VS
+"""
+
+import ssl
+import time
+import logging
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import SMTPConfig
+
+logger = logging.getLogger(__name__)
+
+
+class _Connection:
+    __slots__ = ('smtp', 'sent', 'last_used')
+
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPTransport:
+    """
+    Pula połączeń SMTP - VS
+
+    Połączenie (TCP + STARTTLS + AUTH) jest zestawiane raz i obsługuje
+    kolejne wiadomości. Po `max_messages_per_connection` wiadomościach
+    albo bezczynności dłuższej niż `idle_timeout` (serwery same zamykają
+    bezczynne sesje) jest zamykane i otwierane nowe. Zerwane połączenie
+    jest odtwarzane, a wiadomość wysyłana ponownie (raz). send_many dzieli
+    wsad na najwyżej `pool_size` części - każda idzie jednym połączeniem.
+    """
+
+    def __init__(self, config: Optional[SMTPConfig] = None):
+        self.config = config or SMTPConfig()
+        self.idle: List[_Connection] = []
+        self.slots = threading.BoundedSemaphore(self.config.pool_size)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=self.config.pool_size, thread_name_prefix='smtp')
+        self.stats = {'sent': 0, 'failed': 0, 'connections': 0, 'reconnects': 0}
+
+    # ---------- Połączenia ----------
+
+    def _connect(self) -> _Connection:
+        config = self.config
+        if config.ssl:
+            smtp = smtplib.SMTP_SSL(config.host, config.port, timeout=config.timeout,
+                                    context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(config.host, config.port, timeout=config.timeout)
+        try:
+            smtp.ehlo()
+            if config.starttls and not config.ssl:
+                smtp.starttls(context=ssl.create_default_context())
+                smtp.ehlo()
+            if config.user:
+                smtp.login(config.user, config.password)
+        except Exception:
+            smtp.close()
+            raise
+        with self.lock:
+            self.stats['connections'] += 1
+        return _Connection(smtp)
+
+    @staticmethod
+    def _close(conn: _Connection) -> None:
+        try:
+            conn.smtp.quit()
+        except Exception:
+            conn.smtp.close()
+
+    def _acquire(self) -> Optional[_Connection]:
+        """Wolne połączenie z puli albo None (połączy się przy pierwszej wiadomości)"""
+        self.slots.acquire()
+        now = time.monotonic()
+        while True:
+            with self.lock:
+                conn = self.idle.pop() if self.idle else None
+            if conn is None or now - conn.last_used <= self.config.idle_timeout:
+                return conn
+            self._close(conn)
+
+    def _release(self, conn: Optional[_Connection]) -> None:
+        try:
+            if conn is not None:
+                if conn.sent < self.config.max_messages_per_connection:
+                    conn.last_used = time.monotonic()
+                    with self.lock:
+                        self.idle.append(conn)
+                else:
+                    self._close(conn)
+        finally:
+            self.slots.release()
+
+    # ---------- Wysyłka ----------
+
+    def _deliver(self, conn: Optional[_Connection], message: Message) -> Tuple[Optional[_Connection], Dict[str, Any]]:
+        """Wysyłka jednej wiadomości; zwraca (połączenie do dalszego użycia, wynik)"""
+        for attempt in range(2):
+            try:
+                if conn is not None and conn.sent >= self.config.max_messages_per_connection:
+                    self._close(conn)
+                    conn = None
+                if conn is None:
+                    conn = self._connect()
+                    if attempt:
+                        with self.lock:
+                            self.stats['reconnects'] += 1
+                refused = conn.smtp.send_message(message)
+                conn.sent += 1
+                with self.lock:
+                    self.stats['sent'] += 1
+                result = {'success': True, 'message_id': message['Message-ID']}
+                if refused:
+                    result['refused'] = sorted(refused)
+                return conn, result
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused) as e:
+                # Rejected by the server - the session itself is still usable - VS
+                error = e
+                break
+            except OSError as e:
+                # Disconnect, timeout, TLS/connect error: new connection, one retry - VS
+                if conn is not None:
+                    conn.smtp.close()
+                    conn = None
+                error = e
+        with self.lock:
+            self.stats['failed'] += 1
+        logger.error(f"SMTP error for {message['To']}: {error}")
+        return conn, {'success': False, 'error': str(error)}
+
+    def _send_chunk(self, messages: List[Message]) -> List[Dict[str, Any]]:
+        conn = self._acquire()
+        results = []
+        try:
+            for message in messages:
+                conn, result = self._deliver(conn, message)
+                results.append(result)
+        finally:
+            self._release(conn)
+        return results
+
+    def send(self, message: Message) -> Dict[str, Any]:
+        return self._send_chunk([message])[0]
+
+    def send_many(self, messages: List[Message]) -> List[Dict[str, Any]]:
+        """Wsad wiadomości, wyniki w tej samej kolejności"""
+        if not messages:
+            return []
+        parts = min(self.config.pool_size, len(messages))
+        size = -(-len(messages) // parts)
+        chunks = [messages[i:i + size] for i in range(0, len(messages), size)]
+        if len(chunks) == 1:
+            return self._send_chunk(chunks[0])
+        results = []
+        for chunk_results in self.executor.map(self._send_chunk, chunks):
+            results.extend(chunk_results)
+        return results
+
+    def close(self) -> None:
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            self._close(conn)
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, 'idle': len(self.idle), 'poolSize': self.config.pool_size}
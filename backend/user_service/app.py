@@ -9,14 +9,21 @@ from flask import Flask, request, jsonify
 from datetime import datetime
 import uuid
 import os
+import sys
 import logging
 import boto3
 from botocore.exceptions import ClientError
 
+# Shared modules live one level up (/app/shared in the container) - VS
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.auth import init_auth
+from shared.database import scan_all
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+init_auth(app)
 
 
 AWS_REGION = os.getenv('AWS_REGION', 'eu-north-1')
@@ -65,11 +72,12 @@ def get_users():
     
     if table:
         try:
+            # Paginated parallel scan - a single Scan stops at 1 MB - VS
             if role:
-                response = table.scan(FilterExpression='#r = :role', ExpressionAttributeNames={'#r': 'role'}, ExpressionAttributeValues={':role': role})
+                users = scan_all(table, FilterExpression='#r = :role', ExpressionAttributeNames={'#r': 'role'}, ExpressionAttributeValues={':role': role})
             else:
-                response = table.scan()
-            return jsonify(response.get('Items', []))
+                users = scan_all(table)
+            return jsonify(users)
         except ClientError as e:
             logger.error(f"DynamoDB error: {e}")
     
@@ -98,6 +106,7 @@ def create_user():
         'role': data.get('role', 'client'),
         'phone': data.get('phone', ''),
         'address': data.get('address', ''),
+        'region': data.get('region', ''),  # województwo, used for disease alerts
         'isActive': True,
         'createdAt': datetime.utcnow().isoformat(),
         'updatedAt': datetime.utcnow().isoformat()
@@ -119,6 +128,7 @@ def update_user(user_id):
         'lastName': data.get('lastName', user.get('lastName')),
         'phone': data.get('phone', user.get('phone')),
         'address': data.get('address', user.get('address')),
+        'region': data.get('region', user.get('region', '')),
         'updatedAt': datetime.utcnow().isoformat()
     })
     
@@ -52,6 +52,7 @@ const createApiInstance = (baseURL) => {
                     if (refreshToken) {
                         const response = await axios.post(`${API_CONFIG.AUTH_SERVICE}/refresh`, { refreshToken });
                         localStorage.setItem('accessToken', response.data.accessToken);
+                        if (response.data.refreshToken) localStorage.setItem('refreshToken', response.data.refreshToken);
                         originalRequest.headers.Authorization = `Bearer ${response.data.accessToken}`;
                         return instance(originalRequest);
                     }